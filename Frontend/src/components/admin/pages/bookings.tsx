@@ -54,9 +54,16 @@ interface Booking {
   price_etb?: string | number;
 }
 
+// GET /booking/ returns one page, newest first; `next` is the cursor for the following page
+interface BookingPage {
+  results: Booking[];
+  next: string | null;
+}
+
 const Bookings: React.FC = () => {
   const [bookings, setBookings] = useState<Booking[]>([]);
   const [filteredBookings, setFilteredBookings] = useState<Booking[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [loadingId, setLoadingId] = useState<number | null>(null);
 
@@ -80,11 +87,13 @@ const Bookings: React.FC = () => {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [bookings, searchTerm, statusFilter, dateFilter, paymentFilter]);
 
-  const fetchBookings = async () => {
+  const fetchBookings = async (cursor?: string) => {
     try {
-      setLoading(true);
-      const res = await api.get<Booking[]>("/booking/");
-      setBookings(Array.isArray(res.data) ? res.data : []);
+      if (!cursor) setLoading(true);
+      const res = await api.get<BookingPage>("/booking/", { params: cursor ? { cursor } : {} });
+      const page = Array.isArray(res.data?.results) ? res.data.results : [];
+      setBookings((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(res.data?.next ?? null);
     } catch (error) {
       toast.error("Failed to fetch bookings.");
       console.error(error);
@@ -224,7 +233,7 @@ const Bookings: React.FC = () => {
           <p className="text-gray-600 mt-1">Manage and track all booking requests</p>
         </div>
         <button
-          onClick={fetchBookings}
+          onClick={() => fetchBookings()}
           className="inline-flex items-center px-3 py-2 rounded-lg border text-sm hover:bg-gray-50"
           title="Refresh"
         >
@@ -452,6 +461,17 @@ const Bookings: React.FC = () => {
         </div>
       </div>
 
+      {!loading && nextCursor && (
+        <div className="mt-4 flex justify-center">
+          <button
+            onClick={() => fetchBookings(nextCursor)}
+            className="px-4 py-2 rounded-lg border border-gray-300 text-gray-700 hover:bg-gray-50"
+          >
+            Load more
+          </button>
+        </div>
+      )}
+
       {/* Summary */}
       {!loading && filteredBookings.length > 0 && (
         <div className="mt-6 grid grid-cols-1 md:grid-cols-4 gap-4">
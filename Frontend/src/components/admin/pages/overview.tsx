@@ -136,7 +136,7 @@ const Overview: React.FC = () => {
 
         setPlaygrounds(Array.isArray(playgroundsRes.data) ? playgroundsRes.data : []);
         setUsers(Array.isArray(usersRes.data) ? usersRes.data : []);
-        setBookings(Array.isArray(bookingsRes.data) ? bookingsRes.data : []);
+        setBookings(Array.isArray(bookingsRes.data?.results) ? bookingsRes.data.results : []);
         setRevenue(Number(revenueRes?.data?.total ?? 0));
 
         const labels = Array.isArray(chartRes?.data?.labels) ? chartRes.data.labels : [];
@@ -0,0 +1,256 @@
+# booking/analytics.py
+"""
+Reporting aggregates computed in the database.
+
+Every function here returns one row per group, never per booking, so memory
+and transfer stay proportional to the number of groups however large the
+bookings table grows. Per-day booking counts and revenue come from the
+DailyBookingRollup table, customer totals from CustomerRollup (see
+booking/rollups.py).
+"""
+from __future__ import annotations
+
+from array import array
+from collections import defaultdict
+from datetime import date as date_cls
+from decimal import Decimal
+from typing import Iterable
+
+from django.conf import settings
+from django.db.models import DateField, F, Q, Sum
+from django.db.models.functions import ExtractIsoWeekDay, TruncMonth
+
+from .models import BookingStatus, CustomerRollup, DailyBookingRollup, FieldBlackout, FieldWeeklySlot
+from .occupancy import SlotBits, iter_bits
+
+# ============================================================================
+# Bookings and revenue (from DailyBookingRollup)
+# ============================================================================
+# Revenue is recognised when money is taken:
+#   series checkouts   ChapaPayment.amount_etb of paid payments, at paid_at
+#   admin bookings     price_per_session of approved, paid bookings that have
+#                      no series (no payment row), at created_at
+# booking/rollups.py keeps both, and booking counts per play date, in the
+# rollup table, so these read a few rows per day instead of every booking.
+REVENUE_DIMENSIONS = ("month", "field", "type")
+CENTS = Decimal("0.01")
+
+# dimension -> rollup columns grouped on (month is a TruncMonth annotation)
+_ROLLUP_COLUMNS = {
+    "field": ("playground_id", "playground__name"),
+    "type": ("playground__type",),
+}
+_OUTPUT_NAMES = {"playground_id": "field_id", "playground__name": "field_name", "playground__type": "type"}
+
+
+def _in_range(qs, start: date_cls | None, end: date_cls | None):
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    return qs
+
+
+def bookings_per_day(start: date_cls, end: date_cls, **filters) -> dict[date_cls, int]:
+    """{day: bookings} over [start, end]; filters: playground_id, status."""
+    return dict(
+        _in_range(DailyBookingRollup.objects.filter(**filters), start, end)
+        .order_by().values("date").annotate(n=Sum("bookings")).filter(n__gt=0)
+        .values_list("date", "n")
+    )
+
+
+def bookings_count(start: date_cls, end: date_cls, **filters) -> int:
+    qs = _in_range(DailyBookingRollup.objects.filter(**filters), start, end)
+    return qs.aggregate(n=Sum("bookings"))["n"] or 0
+
+
+def daily_totals(start: date_cls, end: date_cls) -> dict[date_cls, tuple[int, Decimal]]:
+    """{day: (bookings, revenue_etb)} over [start, end] in one grouped query; empty days are left out."""
+    return {
+        day: (n or 0, Decimal(total or 0))
+        for day, n, total in _in_range(DailyBookingRollup.objects.all(), start, end)
+        .order_by().values_list("date").annotate(n=Sum("bookings"), total=Sum("revenue_etb"))
+    }
+
+
+def revenue_rows(
+    start: date_cls | None = None,
+    end: date_cls | None = None,
+    group_by: Iterable[str] = (),
+) -> list[dict]:
+    """
+    Revenue over [start, end] (either may be None for open-ended) grouped by
+    any of REVENUE_DIMENSIONS, in one grouped query. Rows: {month?,
+    field_id?, field_name?, type?, total_etb: Decimal, count: int}, sorted by
+    their group keys.
+    """
+    group_by = [dim for dim in REVENUE_DIMENSIONS if dim in set(group_by)]
+    qs = _in_range(DailyBookingRollup.objects.filter(revenue_count__gt=0), start, end)
+    totals = {"total": Sum("revenue_etb"), "n": Sum("revenue_count")}
+    if not group_by:
+        grouped = [qs.aggregate(**totals)]
+    else:
+        names = []
+        for dim in group_by:
+            if dim == "month":
+                qs = qs.annotate(month=TruncMonth("date", output_field=DateField()))
+                names.append("month")
+            else:
+                names.extend(_ROLLUP_COLUMNS[dim])
+        grouped = list(qs.order_by().values(*names).annotate(**totals))
+
+    rows = []
+    for row in grouped:
+        out = {_OUTPUT_NAMES.get(k, k): v for k, v in row.items() if k not in ("total", "n")}
+        if out.get("month") is not None:
+            out["month"] = out["month"].strftime("%Y-%m")
+        # SQLite sums decimals as floats; keep money at 2 places
+        out["total_etb"] = Decimal(row["total"] or 0).quantize(CENTS)
+        out["count"] = row["n"] or 0
+        rows.append(out)
+    rows.sort(key=lambda r: tuple(str(r[k]) for k in r if k not in ("total_etb", "count")))
+    return rows
+
+
+# ============================================================================
+# Customers
+# ============================================================================
+CUSTOMER_SORTS = ("bookings", "spend", "last_booking")
+_SORT_COLUMNS = {"bookings": "bookings", "spend": "spend_etb", "last_booking": "last_booking"}
+
+
+def _decode_sort_value(sort: str, raw):
+    if sort == "spend":
+        return Decimal(raw)
+    if sort == "last_booking":
+        return date_cls.fromisoformat(raw)
+    return int(raw)
+
+
+def customer_leaderboard(sort: str = "bookings", limit: int = 50, after: tuple | None = None):
+    """
+    One page of customers ranked by `sort` (desc, ties by customer), as
+    (rows, next_after). Reads CustomerRollup through the index for that
+    sort, so a page costs `limit` rows however many bookings there are.
+    `after` is the (sort value, customer) of the last row of the previous
+    page.
+
+    Spend is what the customer paid (see CustomerRollup).
+    """
+    column = _SORT_COLUMNS[sort]
+    qs = CustomerRollup.objects.filter(bookings__gt=0)
+    if after is not None:
+        value, key = _decode_sort_value(sort, after[0]), after[1]
+        qs = qs.filter(Q(**{f"{column}__lt": value}) | Q(**{column: value, "customer__gt": key}))
+    rows = list(
+        qs.order_by(F(column).desc(), "customer")
+        .values("customer", "user_id", "guest_name", "bookings", "approved_bookings", "spend_etb", "last_booking")
+        [: limit + 1]
+    )
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][column]
+        next_after = (str(last) if not isinstance(last, date_cls) else last.isoformat(), rows[-1]["customer"])
+    for row in rows:
+        row["spend_etb"] = Decimal(row["spend_etb"]).quantize(CENTS)
+    return rows, next_after
+
+
+# ============================================================================
+# Utilisation
+# ============================================================================
+# Counts live in flat row-major buffers indexed [field][weekday][timeslot]
+# (weekday 0 = Monday, as EthiopianWeekday), so every step is one pass over a
+# buffer of fields x 7 x timeslots cells, whatever the length of the range.
+
+def weekday_counts(start: date_cls, end: date_cls) -> list[int]:
+    """How many of each weekday (Monday = 0) fall in [start, end]."""
+    weeks, extra = divmod((end - start).days + 1, 7)
+    first = start.weekday()
+    return [weeks + ((dow - first) % 7 < extra) for dow in range(7)]
+
+
+def utilisation_heatmap(fields, timeslots, start: date_cls, end: date_cls) -> list[dict]:
+    """
+    Approved bookings over open capacity per field x weekday x timeslot, for
+    [start, end]. Capacity is every date of that weekday whose slot the
+    weekly rules leave open and no blackout closes (same rules as
+    AvailabilityGrid). Three queries: weekly rules, blackouts and one grouped
+    read of the rollup; the rest is arithmetic on the buffers.
+
+    Returns one dict per field: {field_id, field_name, booked, capacity,
+    utilisation (None where there is no capacity), overall}, each matrix a
+    list of 7 weekday rows with one column per timeslot.
+    """
+    slots = SlotBits(timeslots)
+    nslots = len(slots)
+    field_pos = {f.id: i for i, f in enumerate(fields)}
+    slot_pos = {ts.id: i for i, ts in enumerate(timeslots)}
+    cells = len(fields) * 7 * nslots
+
+    def at(fi: int, dow: int, si: int) -> int:
+        return (fi * 7 + dow) * nslots + si
+
+    # Open slots per (field, weekday): closed if rules exist for the key and none is open
+    open_mask = [slots.full] * (len(fields) * 7)
+    if fields and not getattr(settings, "ALWAYS_OPEN_SLOTS", False):
+        open_by_key: dict[tuple[int, int, int], bool] = {}
+        for field_id, dow, ts_id, is_open in FieldWeeklySlot.objects.filter(
+            playground_id__in=field_pos
+        ).values_list("playground_id", "day_of_week", "time_slot_id", "is_open"):
+            key = (field_id, dow, ts_id)
+            open_by_key[key] = open_by_key.get(key, False) or is_open
+        for (field_id, dow, ts_id), is_open in open_by_key.items():
+            if not is_open:
+                open_mask[field_pos[field_id] * 7 + dow] &= ~slots.bit(ts_id)
+
+    per_weekday = weekday_counts(start, end)
+    capacity = array("l", bytes(array("l").itemsize * cells))
+    for fi in range(len(fields)):
+        for dow in range(7):
+            for si in iter_bits(open_mask[fi * 7 + dow]):
+                capacity[at(fi, dow, si)] = per_weekday[dow]
+
+    # Blackouts only remove capacity that was open in the first place
+    blacked: dict[tuple[int, date_cls], int] = defaultdict(int)
+    for field_id, d, ts_id in FieldBlackout.objects.filter(
+        playground_id__in=field_pos, date__gte=start, date__lte=end
+    ).values_list("playground_id", "date", "time_slot_id"):
+        blacked[(field_pos[field_id], d)] |= slots.bit(ts_id)
+    for (fi, d), mask in blacked.items():
+        dow = d.weekday()
+        for si in iter_bits(mask & open_mask[fi * 7 + dow]):
+            capacity[at(fi, dow, si)] -= 1
+
+    booked = array("l", bytes(array("l").itemsize * cells))
+    for field_id, ts_id, iso_dow, n in (
+        DailyBookingRollup.objects.filter(
+            playground_id__in=field_pos, status=BookingStatus.APPROVED, date__gte=start, date__lte=end,
+        )
+        .annotate(iso_dow=ExtractIsoWeekDay("date")).order_by()
+        .values_list("playground_id", "time_slot_id", "iso_dow").annotate(n=Sum("bookings"))
+    ):
+        if ts_id in slot_pos:
+            booked[at(field_pos[field_id], iso_dow - 1, slot_pos[ts_id])] += n
+
+    ratio = [round(b / c, 4) if c > 0 else None for b, c in zip(booked, capacity)]
+
+    def matrix(buf, fi: int) -> list[list]:
+        return [list(buf[at(fi, dow, 0):at(fi, dow, 0) + nslots]) for dow in range(7)]
+
+    out = []
+    for fi, f in enumerate(fields):
+        lo, hi = at(fi, 0, 0), at(fi + 1, 0, 0)
+        total_capacity = sum(c for c in capacity[lo:hi] if c > 0)
+        out.append({
+            "field_id": f.id,
+            "field_name": f.name,
+            "booked": matrix(booked, fi),
+            "capacity": matrix(capacity, fi),
+            "utilisation": matrix(ratio, fi),
+            "overall": round(sum(booked[lo:hi]) / total_capacity, 4) if total_capacity else None,
+        })
+    return out
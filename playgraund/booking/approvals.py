@@ -0,0 +1,91 @@
+# booking/approvals.py
+"""
+Marking paid Chapa transactions: payment -> paid, series -> approved and
+all of its live holds -> approved, in a fixed number of statements per batch.
+"""
+from __future__ import annotations
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import rollups
+from .availability import live_hold_q
+from .models import Booking, BookingSeries, BookingStatus, ChapaPayment, PaymentStatus, SeriesStatus
+from .signals import series_approved
+
+
+def approve_transaction(tx_ref: str, payload: dict | None = None) -> int:
+    """
+    Apply a verified payment. Returns how many bookings were approved.
+    Raises ChapaPayment.DoesNotExist for an unknown tx_ref.
+    """
+    approved = approve_transactions({tx_ref: payload})
+    if tx_ref not in approved:
+        raise ChapaPayment.DoesNotExist(f"No ChapaPayment with tx_ref {tx_ref!r}")
+    return approved[tx_ref]
+
+
+def approve_transactions(verified: dict[str, dict | None]) -> dict[str, int]:
+    """
+    Apply many verified payments ({tx_ref: Chapa payload}) at once.
+    Returns {tx_ref: bookings approved}; unknown tx_refs are left out.
+
+    The statement count does not depend on the batch size: payments are
+    locked and updated together, series with one UPDATE and holds with one
+    UPDATE (flags included, so the per-row _sync_flags_on_approved signal is
+    not needed); the reporting rollup follows with one grouped read and one
+    upsert. Listeners get one series_approved signal per series once the
+    transaction commits.
+    """
+    if not verified:
+        return {}
+    with transaction.atomic():
+        now = timezone.now()
+        rollup = rollups.new_deltas()
+        payments = list(
+            ChapaPayment.objects.select_for_update().select_related("series")
+            .filter(tx_ref__in=list(verified))
+        )
+        unpaid = [p for p in payments if p.status != PaymentStatus.PAID]
+        for payment in unpaid:
+            payment.status = PaymentStatus.PAID
+            payment.paid_at = now
+            payment.payload = verified[payment.tx_ref]
+            payment.updated_at = now
+            series = payment.series
+            rollups.add_payment(rollup, timezone.localdate(now), series.playground_id, series.time_slot_id,
+                                rollups.customer_of(series.purchaser_id, series.guest_email, series.guest_phone),
+                                payment.amount_etb)
+        if unpaid:
+            ChapaPayment.objects.bulk_update(unpaid, ["status", "paid_at", "payload", "updated_at"])
+
+        pending_series = [p.series for p in payments if p.series.status != SeriesStatus.APPROVED]
+        if pending_series:
+            BookingSeries.objects.filter(pk__in=[s.pk for s in pending_series]).update(
+                status=SeriesStatus.APPROVED, updated_at=now
+            )
+            for series in pending_series:
+                series.status = SeriesStatus.APPROVED
+
+        holds = Booking.objects.filter(live_hold_q(now), chapa_tx_ref__in=[p.tx_ref for p in payments])
+        counts = dict(
+            holds.order_by().values("chapa_tx_ref").annotate(n=Count("pk")).values_list("chapa_tx_ref", "n")
+        )
+        if counts:
+            rollups.add_update(rollup, holds, status=BookingStatus.APPROVED, is_paid=True)
+            holds.update(
+                status=BookingStatus.APPROVED, is_paid=True, is_booked=True,
+                hold_expires_at=None, updated_at=now,
+            )
+        rollups.apply(rollup)
+
+        for payment in payments:
+            approved = counts.get(payment.tx_ref, 0)
+            if approved:
+                transaction.on_commit(
+                    lambda payment=payment, approved=approved: series_approved.send(
+                        sender=BookingSeries, series=payment.series, payment=payment, approved=approved
+                    )
+                )
+    return {p.tx_ref: counts.get(p.tx_ref, 0) for p in payments}
@@ -0,0 +1,281 @@
+# booking/availability.py
+"""
+Set-based availability engine.
+
+Loads everything needed to answer "is this field/date/slot free?" for a date
+window in a fixed number of queries (timeslots, weekly rules, blackouts,
+live bookings) into an OccupancyIndex and answers every lookup in memory.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date as date_cls, datetime, timedelta
+from typing import Iterable
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import (
+    PENDING_HOLD_TTL_MINUTES,
+    Field,
+    Timeslot,
+    FieldWeeklySlot,
+    FieldBlackout,
+    Booking,
+    BookingStatus,
+)
+from .occupancy import OccupancyIndex, SlotBits, iter_bits
+
+SLOT_AVAILABLE = "available"
+SLOT_BOOKED = "booked"
+SLOT_CLOSED = "closed"
+
+# Why a series occurrence cannot be booked
+SKIP_PAST = "past"
+SKIP_CLOSED = "closed_weekly"
+SKIP_BLACKOUT = "blacked_out"
+SKIP_TAKEN = "taken"
+SKIP_LOST_RACE = "lost_race"
+
+
+def slot_label(start_t, end_t) -> str:
+    def _fmt(t):
+        if hasattr(t, "strftime"):
+            return t.strftime("%H:%M")
+        s = str(t)
+        parts = s.split(":")
+        return f"{parts[0]:0>2}:{parts[1]:0>2}"
+
+    return f"{_fmt(start_t)} - {_fmt(end_t)}"
+
+
+def hold_cutoff():
+    """Checkouts (series, payments) started before this instant are stale."""
+    return timezone.localtime() - timedelta(minutes=PENDING_HOLD_TTL_MINUTES)
+
+
+def live_hold_q(now=None) -> models.Q:
+    """PENDING holds whose hold_expires_at has not passed."""
+    return models.Q(status=BookingStatus.PENDING, hold_expires_at__gt=now or timezone.now())
+
+
+def live_booking_q(now=None) -> models.Q:
+    """Bookings that occupy their slot: approved, or a pending hold that has not expired."""
+    return models.Q(status=BookingStatus.APPROVED) | live_hold_q(now)
+
+
+def iter_days(start: date_cls, end: date_cls):
+    """Yield every date in [start, end)."""
+    d = start
+    while d < end:
+        yield d
+        d += timedelta(days=1)
+
+
+def month_windows(start: date_cls, end: date_cls):
+    """Split [start, end) into calendar-month sub-windows."""
+    cur = start
+    while cur < end:
+        nxt = date_cls(cur.year + 1, 1, 1) if cur.month == 12 else date_cls(cur.year, cur.month + 1, 1)
+        yield cur, min(nxt, end)
+        cur = nxt
+
+
+class AvailabilityGrid:
+    """
+    Day -> slot availability for a set of fields over [start, end).
+
+    Build with AvailabilityGrid.load(); it issues at most four queries no
+    matter how many fields, days or timeslots are involved. State is kept in
+    an OccupancyIndex (one bitmask per field/day), so lookups are O(1).
+    """
+
+    def __init__(self, fields: list[Field], timeslots: list[Timeslot], start: date_cls, end: date_cls):
+        self.fields = fields
+        self.timeslots = timeslots
+        self.start = start
+        self.end = end
+        self.slots = SlotBits(timeslots)
+        self.occupancy = OccupancyIndex([f.id for f in fields], self.slots, start, end)
+        # (field_id, year, month) -> when the earliest live PENDING hold lapses
+        self.next_hold_expiry: dict[tuple[int, int, int], datetime] = {}
+
+    @classmethod
+    def load(
+        cls,
+        fields: Iterable[Field],
+        start: date_cls,
+        end: date_cls,
+        timeslots: list[Timeslot] | None = None,
+    ) -> "AvailabilityGrid":
+        fields = list(fields)
+        if timeslots is None:
+            timeslots = list(Timeslot.objects.all().order_by("start_time"))
+        grid = cls(fields, timeslots, start, end)
+        field_ids = [f.id for f in fields]
+        if not field_ids:
+            return grid
+
+        occ, bit = grid.occupancy, grid.slots.bit
+
+        # Weekly rules: closed if rows exist for the key and none is open
+        if not getattr(settings, "ALWAYS_OPEN_SLOTS", False):
+            open_by_key: dict[tuple[int, int, int], bool] = {}
+            rows = FieldWeeklySlot.objects.filter(playground_id__in=field_ids).values_list(
+                "playground_id", "day_of_week", "time_slot_id", "is_open"
+            )
+            for field_id, dow, ts_id, is_open in rows:
+                key = (field_id, dow, ts_id)
+                open_by_key[key] = open_by_key.get(key, False) or is_open
+            weekly_closed: dict[int, list[int]] = defaultdict(lambda: [0] * 7)
+            for (field_id, dow, ts_id), is_open in open_by_key.items():
+                if not is_open:
+                    weekly_closed[field_id][dow] |= bit(ts_id)
+            for field_id, by_dow in weekly_closed.items():
+                occ.mark_all_days("closed", field_id, by_dow)
+
+        blackouts = FieldBlackout.objects.filter(
+            playground_id__in=field_ids, date__gte=start, date__lt=end
+        ).values_list("playground_id", "date", "time_slot_id")
+        for field_id, d, ts_id in blackouts:
+            occ.mark("closed", field_id, d, bit(ts_id))
+            occ.mark("blackout", field_id, d, bit(ts_id))
+
+        bookings = Booking.objects.filter(
+            playground_id__in=field_ids, date__gte=start, date__lt=end
+        ).filter(live_booking_q()).values_list(
+            "playground_id", "date", "time_slot_id", "status", "hold_expires_at"
+        )
+        for field_id, d, ts_id, st, expires_at in bookings:
+            occ.mark("taken", field_id, d, bit(ts_id))
+            if st == BookingStatus.APPROVED:
+                occ.mark("approved", field_id, d, bit(ts_id))
+            else:
+                key = (field_id, d.year, d.month)
+                if key not in grid.next_hold_expiry or expires_at < grid.next_hold_expiry[key]:
+                    grid.next_hold_expiry[key] = expires_at
+
+        return grid
+
+    @classmethod
+    def iter_months(cls, fields: Iterable[Field], start: date_cls, end: date_cls):
+        """
+        Yield one grid per calendar month of [start, end). Timeslots are read
+        once; each month costs the same fixed number of queries, and only one
+        month of state is held at a time.
+        """
+        fields = list(fields)
+        timeslots = list(Timeslot.objects.all().order_by("start_time"))
+        for lo, hi in month_windows(start, end):
+            yield cls.load(fields, lo, hi, timeslots=timeslots)
+
+    # ---- lookups ----
+    def is_open(self, field_id: int, d: date_cls, ts_id: int) -> bool:
+        return not self.occupancy.closed(field_id, d) & self.slots.bit(ts_id)
+
+    def is_taken(self, field_id: int, d: date_cls, ts_id: int) -> bool:
+        return bool(self.occupancy.taken(field_id, d) & self.slots.bit(ts_id))
+
+    def status(self, field_id: int, d: date_cls, ts_id: int) -> str:
+        if not self.is_open(field_id, d, ts_id):
+            return SLOT_CLOSED
+        if self.is_taken(field_id, d, ts_id):
+            return SLOT_BOOKED
+        return SLOT_AVAILABLE
+
+    def skip_reason(self, field_id: int, d: date_cls, ts_id: int) -> str | None:
+        """None if the slot can be held, otherwise one of the SKIP_* reasons."""
+        mask = self.slots.bit(ts_id)
+        if self.occupancy.blackout(field_id, d) & mask:
+            return SKIP_BLACKOUT
+        if self.occupancy.closed(field_id, d) & mask:
+            return SKIP_CLOSED
+        if self.occupancy.taken(field_id, d) & mask:
+            return SKIP_TAKEN
+        return None
+
+    def days(self, since: date_cls | None = None):
+        start = max(self.start, since) if since else self.start
+        return iter_days(start, self.end)
+
+    # ---- payload builders ----
+    def _labels(self, mask: int) -> list[str]:
+        return [slot_label(ts.start_time, ts.end_time) for ts in self.slots.timeslots_in(mask)]
+
+    def _day_map(self, mask_for_day, since: date_cls | None) -> dict[str, list[str]]:
+        out: dict[str, list[str]] = {}
+        for d in self.days(since):
+            mask = mask_for_day(d)
+            if mask:
+                out[d.isoformat()] = self._labels(mask)
+        return out
+
+    def free_labels(self, field_id: int, d: date_cls) -> list[str]:
+        return self._labels(self.occupancy.free(field_id, d))
+
+    def available_map(self, field_id: int, since: date_cls | None = None) -> dict[str, list[str]]:
+        """{"YYYY-MM-DD": ["HH:MM - HH:MM", ...]} for days with at least one free slot."""
+        return self._day_map(lambda d: self.occupancy.free(field_id, d), since)
+
+    def merged_map(self, field_ids: list[int], since: date_cls | None = None) -> tuple[dict, dict]:
+        """
+        Availability across several fields (e.g. every pitch of one sport type).
+
+        Returns ({"YYYY-MM-DD": [labels free on any field]},
+                 {"YYYY-MM-DD": {label: [free field ids]}}).
+        """
+        available: dict[str, list[str]] = {}
+        free_fields: dict[str, dict[str, list[int]]] = {}
+        for d in self.days(since):
+            any_free = self.occupancy.free_any(field_ids, d)
+            if not any_free:
+                continue
+            free_by_field = [(fid, self.occupancy.free(fid, d)) for fid in field_ids]
+            per_slot = {}
+            for pos in iter_bits(any_free):
+                ts = self.slots.timeslot(pos)
+                per_slot[slot_label(ts.start_time, ts.end_time)] = [
+                    fid for fid, mask in free_by_field if mask >> pos & 1
+                ]
+            available[d.isoformat()] = list(per_slot)
+            free_fields[d.isoformat()] = per_slot
+        return available, free_fields
+
+    def booked_map(self, field_id: int, since: date_cls | None = None) -> dict[str, list[str]]:
+        """{"YYYY-MM-DD": [labels]} of APPROVED bookings only."""
+        return self._day_map(lambda d: self.occupancy.approved(field_id, d), since)
+
+    def day_slots(self, field_id: int, d: date_cls) -> list[dict]:
+        """Per-slot status rows for one day (BookingAvailabilityView payload)."""
+        return [
+            {
+                "label": slot_label(ts.start_time, ts.end_time),
+                "status": self.status(field_id, d, ts.id),
+                "start_time": str(ts.start_time)[:5],
+                "end_time": str(ts.end_time)[:5],
+            }
+            for ts in self.timeslots
+        ]
+
+
+def plan_occurrences(
+    field: Field, ts: Timeslot, dates: list[date_cls], today: date_cls
+) -> tuple[list[date_cls], list[tuple[date_cls, str]]]:
+    """
+    Split series dates into (bookable, [(date, SKIP_* reason)]).
+    One grid covers every date, so this costs a fixed number of queries.
+    """
+    bookable: list[date_cls] = []
+    skipped: list[tuple[date_cls, str]] = []
+    if not dates:
+        return bookable, skipped
+
+    grid = AvailabilityGrid.load([field], min(dates), max(dates) + timedelta(days=1), timeslots=[ts])
+    for d in dates:
+        reason = SKIP_PAST if d < today else grid.skip_reason(field.id, d, ts.id)
+        if reason:
+            skipped.append((d, reason))
+        else:
+            bookable.append(d)
+    return bookable, skipped
@@ -0,0 +1,230 @@
+# booking/availability_cache.py
+"""
+Versioned cache for availability payloads.
+
+Every (field, month) has a version counter in the AvailabilityVersion table.
+Booking / FieldBlackout writes bump the month, FieldWeeklySlot / Field
+writes bump the whole field and Timeslot writes bump a global generation
+(see the receivers in booking/models.py). The counters live in the database,
+not the per-process cache, so writes from other workers and from management
+commands move them too, inside the writer's transaction. An ETag is derived
+from the versions a response depends on (one SELECT), and rendered payloads
+are kept in a bounded in-process LRU keyed by that ETag, so a payload is
+never served once any input has changed.
+
+PENDING holds expire by time, not by a write. When a grid is built we
+record the earliest hold expiry it saw per (field, month), keeping the
+earlier of that and any expiry already recorded; the first read after that
+instant bumps the month version so the expired hold drops out.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import date as date_cls
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+
+from .availability import AvailabilityGrid
+from .models import AvailabilityVersion
+
+AVAILABILITY_CACHE_SIZE = int(getattr(settings, "AVAILABILITY_CACHE_SIZE", 512))
+
+_clock = time.time
+
+_GLOBAL_KEY = "gen"
+
+
+def _field_key(field_id: int) -> str:
+    return f"f:{field_id}"
+
+
+def _month_key(field_id: int, year: int, month: int) -> str:
+    return f"m:{field_id}:{year:04d}{month:02d}"
+
+
+def months_in(start: date_cls, end: date_cls) -> list[tuple[int, int]]:
+    """(year, month) pairs touched by [start, end)."""
+    out = []
+    y, m = start.year, start.month
+    while end > date_cls(y, m, 1):
+        out.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+# ============================================================================
+# Version counters
+# ============================================================================
+# Each write is one INSERT ... ON CONFLICT DO UPDATE where the backend has
+# it; a missing row counts as version 0.
+_BUMP = "version = {t}.version + 1, stale_at = NULL"
+_EARLIEST = "stale_at = CASE WHEN {t}.stale_at IS NULL OR EXCLUDED.stale_at < {t}.stale_at " \
+            "THEN EXCLUDED.stale_at ELSE {t}.stale_at END"
+
+
+def _upsert(rows: list[tuple], on_conflict: str) -> bool:
+    """(key, version, stale_at) rows; False when the backend has no ON CONFLICT (target)."""
+    connection = connections[router.db_for_write(AvailabilityVersion)]
+    if not connection.features.supports_update_conflicts_with_target:
+        return False
+    qn = connection.ops.quote_name
+    table = qn(AvailabilityVersion._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} ({qn('key')}, {qn('version')}, {qn('stale_at')}) "
+        f"VALUES {', '.join(['(%s, %s, %s)'] * len(rows))} "
+        f"ON CONFLICT ({qn('key')}) DO UPDATE SET " + on_conflict.format(t=table)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+    return True
+
+
+def _bump_keys(keys: list[str]) -> None:
+    if not keys or _upsert([(key, 1, None) for key in keys], _BUMP):
+        return
+    with transaction.atomic():
+        AvailabilityVersion.objects.bulk_create([AvailabilityVersion(key=k) for k in keys], ignore_conflicts=True)
+        AvailabilityVersion.objects.filter(key__in=keys).update(version=F("version") + 1, stale_at=None)
+
+
+def bump_global() -> None:
+    _bump_keys([_GLOBAL_KEY])
+
+
+def bump_field(field_id: int | None) -> None:
+    if field_id is not None:
+        _bump_keys([_field_key(field_id)])
+
+
+def bump_month(field_id: int | None, d: date_cls | None) -> None:
+    if field_id is not None and d is not None:
+        _bump_keys([_month_key(field_id, d.year, d.month)])
+
+
+def bump_months(field_id: int, dates: Iterable[date_cls]) -> None:
+    """Invalidate every month touched by `dates` (for writes that skip signals)."""
+    _bump_keys([_month_key(field_id, y, m) for y, m in sorted({(d.year, d.month) for d in dates})])
+
+
+def _versions(field_ids: Iterable[int], months: list[tuple[int, int]]) -> list:
+    field_ids = list(field_ids)
+    month_keys = [_month_key(fid, y, m) for fid in field_ids for (y, m) in months]
+    keys = [_GLOBAL_KEY] + [_field_key(fid) for fid in field_ids] + month_keys
+    rows = {
+        key: (version, stale_at)
+        for key, version, stale_at in AvailabilityVersion.objects.filter(key__in=keys)
+        .values_list("key", "version", "stale_at")
+    }
+
+    # Expire months whose earliest pending hold has lapsed. The stale_at
+    # condition makes concurrent readers bump each lapse only once.
+    now = _clock()
+    lapsed = [k for k in month_keys if k in rows and rows[k][1] is not None and now >= rows[k][1]]
+    if lapsed:
+        AvailabilityVersion.objects.filter(key__in=lapsed, stale_at__lte=now).update(
+            version=F("version") + 1, stale_at=None
+        )
+        rows.update(
+            (key, (version, None))
+            for key, version in AvailabilityVersion.objects.filter(key__in=lapsed).values_list("key", "version")
+        )
+    return [rows.get(key, (0, None))[0] for key in keys]
+
+
+def _record_hold_expiry(grid: AvailabilityGrid) -> None:
+    """Keep the earlier of each month's recorded expiry and the one this grid saw."""
+    rows = [
+        (_month_key(fid, y, m), 0, expires_at.timestamp())
+        for (fid, y, m), expires_at in sorted(grid.next_hold_expiry.items())
+    ]
+    if not rows or _upsert(rows, _EARLIEST):
+        return
+    with transaction.atomic():
+        AvailabilityVersion.objects.bulk_create(
+            [AvailabilityVersion(key=key) for key, _, _ in rows], ignore_conflicts=True
+        )
+        for key, _, stale_at in rows:
+            AvailabilityVersion.objects.filter(Q(stale_at__isnull=True) | Q(stale_at__gt=stale_at), key=key).update(
+                stale_at=stale_at
+            )
+
+
+# ============================================================================
+# Rendered payload LRU
+# ============================================================================
+class _LRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_payloads = _LRU(AVAILABILITY_CACHE_SIZE)
+
+
+def clear() -> None:
+    """Drop every rendered payload held by this process."""
+    _payloads.clear()
+
+
+def availability_etag(
+    kind: str,
+    field_ids: Iterable[int],
+    start: date_cls,
+    end: date_cls,
+    since: date_cls | None = None,
+) -> str:
+    """Strong ETag for a payload over these fields and dates, at their current versions."""
+    field_ids = sorted(field_ids)
+    versions = _versions(field_ids, months_in(start, end))
+    raw = "|".join(
+        str(part) for part in (
+            kind, field_ids, start, end, since,
+            getattr(settings, "ALWAYS_OPEN_SLOTS", False), versions,
+        )
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cached_render(
+    etag: str,
+    fields: list,
+    start: date_cls,
+    end: date_cls,
+    render: Callable[[AvailabilityGrid], object],
+):
+    """Return the payload for `etag`, building the grid and rendering it on a miss."""
+    payload = _payloads.get(etag)
+    if payload is None:
+        grid = AvailabilityGrid.load(fields, start, end)
+        _record_hold_expiry(grid)
+        payload = render(grid)
+        _payloads.put(etag, payload)
+    return payload
@@ -0,0 +1,346 @@
+# booking/chapa.py
+"""
+Chapa payment gateway client.
+
+One shared requests.Session per process (keep-alive, bounded connection
+pool), split connect/read timeouts, retries with exponential backoff and full
+jitter, and a circuit breaker that fails fast while the gateway is degraded.
+
+Settings (all optional):
+    CHAPA_BASE_URL              https://api.chapa.co
+    CHAPA_CONNECT_TIMEOUT_SEC   3.05
+    CHAPA_READ_TIMEOUT_SEC      HTTP_TIMEOUT_SEC (20)
+    CHAPA_POOL_MAXSIZE          10
+    CHAPA_MAX_RETRIES           2
+    CHAPA_BACKOFF_BASE_SEC      0.25
+    CHAPA_BREAKER_THRESHOLD     5 consecutive failed calls
+    CHAPA_BREAKER_RESET_SEC     30
+    CHAPA_STUB                  False; True routes every call to StubChapaAdapter
+    CHAPA_STUB_LATENCY_SEC      0; simulated gateway latency of the stub
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 502, 503, 504}
+# Statuses that mean the request was not processed, so even a POST may be resent
+SAFE_RETRY_STATUSES = {429, 503}
+
+
+class ChapaError(RuntimeError):
+    """The gateway answered, but not with what we asked for."""
+
+
+class ChapaUnavailable(ChapaError):
+    """The gateway could not be reached, kept failing, or the breaker is open."""
+
+
+# ============================================================================
+# Circuit breaker
+# ============================================================================
+class CircuitBreaker:
+    """
+    closed -> (threshold consecutive failures) -> open -> (reset_after) ->
+    half-open: one trial call; success closes, failure re-opens.
+    """
+
+    def __init__(self, threshold: int, reset_after: float, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at < self.reset_after or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = self._clock()
+
+
+# ============================================================================
+# Client
+# ============================================================================
+class ChapaClient:
+    def __init__(
+        self,
+        secret_key: str,
+        base_url: str = "https://api.chapa.co",
+        connect_timeout: float = 3.05,
+        read_timeout: float = 20,
+        pool_maxsize: int = 10,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        breaker: CircuitBreaker | None = None,
+        adapter: BaseAdapter | None = None,
+        sleep=time.sleep,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker or CircuitBreaker(threshold=5, reset_after=30)
+        self._sleep = sleep
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "Accept": "application/json",
+        })
+        # Retries are handled here (with jitter and breaker accounting), not by urllib3
+        adapter = adapter or HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount(self.base_url, adapter)
+
+    @classmethod
+    def from_settings(cls, **overrides) -> "ChapaClient":
+        """Client configured from settings; keyword arguments override individual options."""
+        read_timeout = float(getattr(settings, "HTTP_TIMEOUT_SEC", 20))
+        base_url = getattr(settings, "CHAPA_BASE_URL", "https://api.chapa.co")
+        options = dict(
+            secret_key=getattr(settings, "CHAPA_SECRET_KEY", ""),
+            base_url=base_url,
+            connect_timeout=float(getattr(settings, "CHAPA_CONNECT_TIMEOUT_SEC", 3.05)),
+            read_timeout=float(getattr(settings, "CHAPA_READ_TIMEOUT_SEC", read_timeout)),
+            pool_maxsize=int(getattr(settings, "CHAPA_POOL_MAXSIZE", 10)),
+            max_retries=int(getattr(settings, "CHAPA_MAX_RETRIES", 2)),
+            backoff_base=float(getattr(settings, "CHAPA_BACKOFF_BASE_SEC", 0.25)),
+            breaker=CircuitBreaker(
+                threshold=int(getattr(settings, "CHAPA_BREAKER_THRESHOLD", 5)),
+                reset_after=float(getattr(settings, "CHAPA_BREAKER_RESET_SEC", 30)),
+            ),
+            adapter=(
+                StubChapaAdapter(latency=float(getattr(settings, "CHAPA_STUB_LATENCY_SEC", 0)))
+                if getattr(settings, "CHAPA_STUB", False) else None
+            ),
+        )
+        options.update(overrides)
+        return cls(**options)
+
+    # ---- API ----
+    def initialize(self, payload: dict) -> dict:
+        """POST /v1/transaction/initialize -> parsed body; raises ChapaError unless it has a checkout_url."""
+        resp = self._request("POST", "/v1/transaction/initialize", idempotent=False, json=payload)
+        data = _json(resp)
+        if resp.status_code >= 400 or not data.get("status"):
+            logger.error("Chapa initialize failed: %s", data)
+            raise ChapaError("Chapa initialize failed")
+        if not (data.get("data") or {}).get("checkout_url"):
+            raise ChapaError("Chapa did not return checkout_url")
+        return data
+
+    def verify(self, tx_ref: str) -> dict:
+        """GET /v1/transaction/verify/<tx_ref> -> parsed body (check is_success())."""
+        resp = self._request("GET", f"/v1/transaction/verify/{tx_ref}", idempotent=True)
+        return _json(resp)
+
+    @staticmethod
+    def is_success(data: dict) -> bool:
+        return bool(data.get("status")) and str((data.get("data") or {}).get("status", "")).lower() == "success"
+
+    # ---- transport ----
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, base * 2^attempt]
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    def _request(self, method: str, path: str, idempotent: bool, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise ChapaUnavailable("Chapa circuit open")
+
+        url = f"{self.base_url}{path}"
+        last_error: Exception | None = None
+        # Every way out records a result, or a half-open trial would never end
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self._sleep(self._backoff(attempt - 1))
+                try:
+                    resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                except requests.ConnectTimeout as e:
+                    last_error = e  # never reached the gateway: safe to resend
+                    continue
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    last_error = e
+                    if idempotent:
+                        continue
+                    break
+                except requests.RequestException as e:
+                    last_error = e  # bad URL, redirect loop, broken body: resending will not help
+                    break
+
+                retryable = resp.status_code in (RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES)
+                if retryable and attempt < self.max_retries:
+                    last_error = ChapaUnavailable(f"Chapa returned {resp.status_code}")
+                    continue
+                if resp.status_code >= 500 or retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return resp
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_failure()
+        raise ChapaUnavailable(f"Chapa unreachable: {last_error}") from last_error
+
+def _json(resp: requests.Response) -> dict:
+    try:
+        return resp.json() if resp.content else {}
+    except ValueError:
+        return {}
+
+
+# ============================================================================
+# Webhook signatures
+# ============================================================================
+SIGNATURE_HEADERS = ("x-chapa-signature", "chapa-signature")
+
+
+def sign_webhook(body: bytes, secret: str) -> str:
+    """Hex HMAC-SHA256 of the raw request body keyed with the webhook secret."""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_webhook_signature(body: bytes, signature: str | None, secret: str) -> bool:
+    if not (secret and signature):
+        return False
+    return hmac.compare_digest(sign_webhook(body, secret), signature.strip().lower())
+
+
+# ============================================================================
+# In-process stub gateway
+# ============================================================================
+class StubChapaAdapter(BaseAdapter):
+    """
+    requests transport that answers Chapa calls in-process, for offline runs
+    and load tests. Initialised transactions verify as success.
+
+    latency:        seconds to sleep per call (simulates the network)
+    failure_rate:   fraction of calls answered with 503
+    unknown_status: if set, verify reports this status for tx_refs it never
+                    initialised (e.g. "success" to reconcile an existing DB)
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, unknown_status: str | None = None):
+        super().__init__()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.unknown_status = unknown_status
+        self.transactions: dict[str, dict] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            return self._response(request, 503, {"status": "failed", "message": "stub unavailable"})
+
+        path = urlparse(request.url).path
+        if request.method == "POST" and path.endswith("/transaction/initialize"):
+            payload = json.loads(request.body or b"{}")
+            tx_ref = payload.get("tx_ref")
+            if not tx_ref:
+                return self._response(request, 400, {"status": "failed", "message": "tx_ref is required"})
+            with self._lock:
+                self.transactions[tx_ref] = {**payload, "status": "success"}
+            return self._response(request, 200, {
+                "status": "success",
+                "message": "Hosted Link",
+                "data": {"checkout_url": f"https://checkout.chapa.stub/{tx_ref}"},
+            })
+
+        if request.method == "GET" and "/transaction/verify/" in path:
+            tx_ref = path.rsplit("/", 1)[-1]
+            tx = self.transactions.get(tx_ref)
+            if tx is None and self.unknown_status:
+                tx = {"status": self.unknown_status}
+            if tx is None:
+                return self._response(request, 404, {"status": "failed", "message": "Invalid transaction"})
+            return self._response(request, 200, {
+                "status": "success",
+                "data": {"tx_ref": tx_ref, "status": tx["status"], "amount": tx.get("amount"),
+                         "currency": tx.get("currency")},
+            })
+
+        return self._response(request, 404, {"status": "failed", "message": "Not found"})
+
+    @staticmethod
+    def _response(request, status_code: int, body: dict) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = status_code
+        resp._content = json.dumps(body).encode()
+        resp.headers["Content-Type"] = "application/json"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+# ============================================================================
+# Shared instance
+# ============================================================================
+_client: ChapaClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ChapaClient:
+    """Process-wide client, built from settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ChapaClient.from_settings()
+        return _client
+
+
+def reset_client() -> None:
+    """Drop the shared client (after settings change, or between tests)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
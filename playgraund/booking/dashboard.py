@@ -0,0 +1,143 @@
+# booking/dashboard.py
+"""
+Admin dashboard widgets, computed together from shared queries.
+
+Each widget has the same payload as its standalone endpoint (bookings/stats/,
+revenue/, bookings/per_month/, revenue/per_playground/, activities/), and
+those endpoints build their payloads with the functions below. A dashboard
+request asks for any subset; the daily widgets share one grouped read of the
+rollup over the union of their windows:
+
+    bookings_stats, revenue, bookings_per_month   1 query (daily rollup totals)
+    revenue_per_playground                        2 queries (per-field revenue, fields)
+    activities                                    1 query
+
+Whole payloads are cached per (widgets, window) for DASHBOARD_CACHE_SEC.
+"""
+from __future__ import annotations
+
+import calendar
+from datetime import date as date_cls, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from field.models import Field
+
+from .analytics import CENTS, daily_totals, revenue_rows
+from .availability import iter_days, slot_label
+from .models import Booking
+
+DASHBOARD_WIDGETS = ("bookings_stats", "revenue", "bookings_per_month", "revenue_per_playground", "activities")
+DASHBOARD_CACHE_SEC = int(getattr(settings, "DASHBOARD_CACHE_SEC", 60))
+RECENT_ACTIVITY_COUNT = 5
+
+_DAILY_WIDGETS = {"bookings_stats", "revenue", "bookings_per_month"}
+_CACHE_PREFIX = "booking:dashboard"
+
+
+def month_end(month_start: date_cls) -> date_cls:
+    return month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
+
+
+# ============================================================================
+# Widget payloads
+# ============================================================================
+def stats_payload(per_day: dict[date_cls, int], start: date_cls, end: date_cls) -> dict:
+    """bookings/stats/ body from {day: bookings}; days without bookings count 0."""
+    days = list(iter_days(start, end + timedelta(days=1)))
+    # Weekday names only identify a day within a single week
+    label_fmt = "%a" if len(days) <= 7 else "%b %d"
+    values = [per_day.get(d, 0) for d in days]
+    return {
+        "labels": [d.strftime(label_fmt) for d in days],
+        "dates": [d.isoformat() for d in days],
+        "values": values,
+        "total": sum(values),
+    }
+
+
+def revenue_per_field_payload(start: date_cls | None = None, end: date_cls | None = None) -> list[dict]:
+    """
+    revenue/per_playground/ body: every active field, with 0 where it took
+    nothing, plus inactive fields that did take money (so the rows still add
+    up to the revenue total).
+    """
+    totals = {r["field_id"]: r["total_etb"] for r in revenue_rows(start, end, ["field"])}
+    fields = Field.objects.filter(Q(is_active=True) | Q(id__in=list(totals))).order_by("name")
+    return [
+        {
+            "playground_id": field_id,
+            "playground_name": name,
+            "total_revenue": totals.get(field_id, 0),
+        }
+        for field_id, name in fields.values_list("id", "name")
+    ]
+
+
+def activities_payload(limit: int = RECENT_ACTIVITY_COUNT) -> list[dict]:
+    """activities/ body: the latest bookings, one query."""
+    items = []
+    for b in Booking.objects.select_related("playground", "time_slot", "user").order_by("-id")[:limit]:
+        items.append(
+            {
+                "id": b.id,
+                "text": f"{b.guest_name or getattr(b.user, 'full_name', 'User')} "
+                        f"booked {b.playground.name} ({slot_label(b.time_slot.start_time, b.time_slot.end_time)})",
+                "time": b.date.isoformat(),
+                "status": b.status,
+            }
+        )
+    return items
+
+
+# ============================================================================
+# Dashboard
+# ============================================================================
+def build(widgets, start: date_cls, end: date_cls, month_start: date_cls) -> dict:
+    """
+    Payloads for `widgets`: bookings_stats over [start, end], revenue and
+    bookings_per_month over the calendar month starting at month_start.
+    """
+    widgets = [w for w in DASHBOARD_WIDGETS if w in set(widgets)]
+    out = {}
+    month_last = month_end(month_start)
+
+    if _DAILY_WIDGETS.intersection(widgets):
+        windows = []
+        if "bookings_stats" in widgets:
+            windows.append((start, end))
+        if {"revenue", "bookings_per_month"}.intersection(widgets):
+            windows.append((month_start, month_last))
+        totals = daily_totals(min(lo for lo, _ in windows), max(hi for _, hi in windows))
+        in_month = [v for d, v in totals.items() if month_start <= d <= month_last]
+
+        if "bookings_stats" in widgets:
+            out["bookings_stats"] = stats_payload({d: n for d, (n, _) in totals.items()}, start, end)
+        if "revenue" in widgets:
+            total = sum((amount for _, amount in in_month), Decimal("0")).quantize(CENTS)
+            out["revenue"] = {"total_etb": str(total)}
+        if "bookings_per_month" in widgets:
+            out["bookings_per_month"] = {
+                "year": month_start.year, "month": month_start.month,
+                "bookings": sum(n for n, _ in in_month),
+            }
+    if "revenue_per_playground" in widgets:
+        out["revenue_per_playground"] = revenue_per_field_payload()
+    if "activities" in widgets:
+        out["activities"] = activities_payload()
+    return out
+
+
+def cached_build(widgets, start: date_cls, end: date_cls, month_start: date_cls) -> tuple[dict, bool]:
+    """build() through the cache; returns (payload, served_from_cache)."""
+    widgets = [w for w in DASHBOARD_WIDGETS if w in set(widgets)]
+    key = f"{_CACHE_PREFIX}:{','.join(widgets)}:{start}:{end}:{month_start}"
+    payload = cache.get(key)
+    if payload is not None:
+        return payload, True
+    payload = build(widgets, start, end, month_start)
+    cache.set(key, payload, timeout=DASHBOARD_CACHE_SEC)
+    return payload, False
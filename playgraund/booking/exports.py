@@ -0,0 +1,205 @@
+# booking/exports.py
+"""
+Streaming exports of bookings, series and payments as CSV or NDJSON.
+
+Rows are read with values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+no model instances, no serializers, and a server-side cursor where the
+backend has one, so an export holds one chunk in memory whether it covers
+a thousand rows or millions. iter_export() yields text lines for
+StreamingHttpResponse (see the export views) or the export_data command.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import re
+from datetime import date as date_cls, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from .models import Booking, BookingSeries, BookingStatus, ChapaPayment, PaymentStatus, SeriesStatus
+
+EXPORT_CHUNK_SIZE = int(getattr(settings, "EXPORT_CHUNK_SIZE", 2000))
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# dataset -> model, column (header, ORM path) pairs, the date ?start=/&end=
+# filter on, and the statuses ?status= accepts
+DATASETS = {
+    "bookings": {
+        "model": Booking,
+        "date": "date",
+        "statuses": BookingStatus.values,
+        "columns": (
+            ("id", "id"),
+            ("date", "date"),
+            ("field_id", "playground_id"),
+            ("field_name", "playground__name"),
+            ("start_time", "time_slot__start_time"),
+            ("end_time", "time_slot__end_time"),
+            ("status", "status"),
+            ("is_paid", "is_paid"),
+            ("price_etb", "playground__price_per_session"),
+            ("user_id", "user_id"),
+            ("guest_name", "guest_name"),
+            ("guest_email", "guest_email"),
+            ("guest_phone", "guest_phone"),
+            ("series", "series__group_key"),
+            ("tx_ref", "chapa_tx_ref"),
+            ("created_at", "created_at"),
+        ),
+    },
+    "series": {
+        "model": BookingSeries,
+        "date": "created_at",
+        "statuses": SeriesStatus.values,
+        "columns": (
+            ("id", "id"),
+            ("group_key", "group_key"),
+            ("status", "status"),
+            ("field_id", "playground_id"),
+            ("field_name", "playground__name"),
+            ("weekday", "weekday"),
+            ("start_time", "time_slot__start_time"),
+            ("end_time", "time_slot__end_time"),
+            ("months", "months"),
+            ("start_date", "start_date"),
+            ("amount_etb", "amount_etb"),
+            ("currency", "currency"),
+            ("purchaser_id", "purchaser_id"),
+            ("guest_name", "guest_name"),
+            ("guest_email", "guest_email"),
+            ("guest_phone", "guest_phone"),
+            ("tx_ref", "chapa_tx_ref"),
+            ("created_at", "created_at"),
+        ),
+    },
+    "payments": {
+        "model": ChapaPayment,
+        "date": "created_at",
+        "statuses": PaymentStatus.values,
+        "columns": (
+            ("id", "id"),
+            ("tx_ref", "tx_ref"),
+            ("status", "status"),
+            ("amount_etb", "amount_etb"),
+            ("currency", "currency"),
+            ("paid_at", "paid_at"),
+            ("series", "series__group_key"),
+            ("field_id", "series__playground_id"),
+            ("field_name", "series__playground__name"),
+            ("guest_name", "series__guest_name"),
+            ("guest_email", "series__guest_email"),
+            ("guest_phone", "series__guest_phone"),
+            ("created_at", "created_at"),
+        ),
+    },
+}
+
+
+def export_queryset(dataset: str, start: date_cls | None = None, end: date_cls | None = None,
+                    status: str | None = None):
+    """values_list queryset for a dataset, oldest first. Raises ValueError on bad input."""
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise ValueError(f"dataset must be one of {', '.join(DATASETS)}")
+    qs = spec["model"].objects.all()
+    date_path = spec["date"]
+    if date_path == "created_at":
+        # Whole local days, as timestamp bounds so the created_at index is usable
+        if start:
+            qs = qs.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+        if end:
+            qs = qs.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    else:
+        if start:
+            qs = qs.filter(**{f"{date_path}__gte": start})
+        if end:
+            qs = qs.filter(**{f"{date_path}__lte": end})
+    if status:
+        if status not in spec["statuses"]:
+            raise ValueError(f"status must be one of {', '.join(spec['statuses'])}")
+        qs = qs.filter(status=status)
+    return qs.order_by("pk").values_list(*(path for _, path in spec["columns"]))
+
+
+# Leading characters that make spreadsheets evaluate a cell as a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Phone numbers and signed numbers ("+251 911 223344", "-12.50") cannot call a function
+_PLAIN_NUMBER = re.compile(r"[+-]?[\d .()-]+\Z")
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    return value
+
+
+def _csv_cell(value):
+    """_cell() for CSV: user-entered text (guest names) must not run as a formula."""
+    value = _cell(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES) and not _PLAIN_NUMBER.match(value):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export(dataset: str, fmt: str = "csv", chunk_size: int = EXPORT_CHUNK_SIZE, **filters):
+    """
+    Yield the export line by line: a header row then one line per record
+    for CSV, one JSON object per line for NDJSON. Raises ValueError on bad
+    input before the first line, so callers can still answer with a 400.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    qs = export_queryset(dataset, **filters)
+    headers = [name for name, _ in DATASETS[dataset]["columns"]]
+
+    def _lines():
+        rows = qs.iterator(chunk_size=chunk_size)
+        if fmt == "csv":
+            writer = csv.writer(_Echo())
+            yield writer.writerow(headers)
+            for row in rows:
+                yield writer.writerow([_csv_cell(v) for v in row])
+        else:
+            encoder = DjangoJSONEncoder()
+            for row in rows:
+                yield encoder.encode(dict(zip(headers, map(_cell, row)))) + "\n"
+
+    return _lines()
+
+
+# ============================================================================
+# Renderers
+# ============================================================================
+# Registered on the streaming views so DRF's ?format= negotiation accepts
+# csv / ndjson. The exports bypass them by returning StreamingHttpResponse;
+# they only render error bodies, as JSON labelled as JSON.
+
+class _StreamRenderer(BaseRenderer):
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get("response")
+        if response is not None:
+            response["Content-Type"] = f"application/json; charset={self.charset}"
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class CSVRenderer(_StreamRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONRenderer(_StreamRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
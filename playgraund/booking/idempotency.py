@@ -0,0 +1,229 @@
+# booking/idempotency.py
+"""
+Idempotency-Key support for unsafe endpoints.
+
+The first request carrying a key claims it and runs normally; its rendered
+response is kept in the IdempotencyRecord table for IDEMPOTENCY_TTL_SEC, so
+every worker sees it. A replay with the same key gets the stored bytes back
+from one indexed read without running the view at all: no validation, no
+other DB writes, no calls to Chapa. Expired rows are taken over in place and
+purged by `manage.py sweep_expired_holds`.
+
+    @method_decorator(idempotent("checkout"), name="dispatch")   # APIView
+    @idempotent("callback", key_from=..., match_body=False)     # above @api_view
+
+Keys are scoped per endpoint and per user, as resolved by the view's DRF
+authenticators. Bodies over 1 KB are stored zlib-compressed.
+
+Settings (optional):
+    IDEMPOTENCY_TTL_SEC    86400   how long a stored response is replayed
+    IDEMPOTENCY_LOCK_SEC   60      max time a key stays "in progress" if its request dies
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_TTL_SEC = int(getattr(settings, "IDEMPOTENCY_TTL_SEC", 24 * 3600))
+IDEMPOTENCY_LOCK_SEC = int(getattr(settings, "IDEMPOTENCY_LOCK_SEC", 60))
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_COMPRESS_OVER = 1024
+# Response headers worth replaying (e.g. the async checkout's status URL)
+_KEPT_HEADERS = ("Location", "Retry-After")
+_UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def header_key(request: HttpRequest) -> str | None:
+    return request.headers.get(HEADER)
+
+
+def _not_server_error(response) -> bool:
+    return response.status_code < 500
+
+
+def _authentication_classes(view) -> list:
+    # @api_view functions carry .cls; method_decorator passes a partial of the bound dispatch
+    cls = getattr(view, "cls", None)
+    if cls is None:
+        bound = getattr(getattr(view, "func", None), "__self__", None)
+        cls = type(bound) if bound is not None else None
+    return getattr(cls, "authentication_classes", api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+
+
+def _owner(request: HttpRequest, view) -> str | None:
+    """
+    Who the key belongs to: the user the view's DRF authenticators resolve
+    (the decorator runs before DRF authenticates), "anon" without
+    credentials, None when the credentials are rejected.
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in _authentication_classes(view)])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return str(user.pk) if user.is_authenticated else "anon"
+
+
+def _entry_key(scope: str, owner: str, key: str) -> str:
+    return hashlib.sha256(f"{scope}|{owner}|{key}".encode()).hexdigest()
+
+
+def _fingerprint(request: HttpRequest) -> str:
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(request.get_full_path().encode())
+    body = request.body  # read first so later form parsing leaves it available
+    if (request.content_type or "").startswith("multipart/"):
+        # Boundaries differ between retries; hash the parsed fields instead
+        h.update(repr(sorted(request.POST.lists())).encode())
+    else:
+        h.update(body)
+    return h.hexdigest()[:32]
+
+
+def _claim(entry_key: str, fingerprint: str | None) -> bool:
+    """Mark the key in progress; False if another live request or stored response holds it."""
+    now = timezone.now()
+    claim = dict(fingerprint=fingerprint, status=None, content_type="", headers=[], compressed=False,
+                 body=b"", expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_SEC))
+    # A lapsed claim (its request died) or an expired response is taken over
+    if IdempotencyRecord.objects.filter(key=entry_key, expires_at__lte=now).update(**claim):
+        return True
+    try:
+        with transaction.atomic():
+            IdempotencyRecord.objects.create(key=entry_key, **claim)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _store(entry_key: str, response) -> None:
+    body = response.content
+    compressed = len(body) > _COMPRESS_OVER
+    IdempotencyRecord.objects.filter(key=entry_key).update(
+        status=response.status_code,
+        content_type=response.get("Content-Type", "application/json"),
+        headers=[[h, response[h]] for h in _KEPT_HEADERS if response.has_header(h)],
+        compressed=compressed,
+        body=zlib.compress(body) if compressed else body,
+        expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_TTL_SEC),
+    )
+
+
+def _unpack(record: IdempotencyRecord) -> HttpResponse:
+    body = bytes(record.body)
+    response = HttpResponse(zlib.decompress(body) if record.compressed else body, status=record.status,
+                            content_type=record.content_type)
+    for name, value in record.headers:
+        response[name] = value
+    response[REPLAY_HEADER] = "true"
+    return response
+
+
+def _in_progress() -> JsonResponse:
+    response = JsonResponse({"error": f"A request with this {HEADER} is still being processed."}, status=409)
+    response["Retry-After"] = "1"
+    return response
+
+
+def idempotent(
+    scope: str,
+    key_from: Callable[[HttpRequest], str | None] = header_key,
+    store_if: Callable[[object], bool] = _not_server_error,
+    match_body: bool = True,
+):
+    """
+    Make an unsafe view replay its first response per key.
+
+    key_from:   pulls the key from the request; requests without one run as usual
+    store_if:   which responses to keep (default: anything but 5xx, so a
+                gateway or server failure can be retried with the same key)
+    match_body: reject (422) a key reused with a different method/path/body
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            # Works for plain views (request first) and dispatch(self, request)
+            request = next(a for a in args if isinstance(a, HttpRequest))
+            key = key_from(request) if request.method in _UNSAFE_METHODS else None
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return JsonResponse({"error": f"{HEADER} is too long."}, status=400)
+
+            owner = _owner(request, view)
+            if owner is None:
+                # Let the view answer the bad credentials
+                return view(*args, **kwargs)
+            entry_key = _entry_key(scope, owner, key)
+            fingerprint = _fingerprint(request) if match_body else None
+
+            stored = IdempotencyRecord.objects.filter(key=entry_key, expires_at__gt=timezone.now()).first()
+            if stored is not None:
+                if stored.status is None:
+                    return _in_progress()
+                if match_body and stored.fingerprint != fingerprint:
+                    return JsonResponse(
+                        {"error": f"{HEADER} was already used for a different request."}, status=422
+                    )
+                return _unpack(stored)
+
+            if not _claim(entry_key, fingerprint):
+                return _in_progress()
+            kept = False
+            try:
+                response = view(*args, **kwargs)
+                if hasattr(response, "render") and not getattr(response, "is_rendered", True):
+                    response.render()
+                if not getattr(response, "streaming", False) and store_if(response):
+                    _store(entry_key, response)
+                    kept = True
+                return response
+            finally:
+                if not kept:
+                    # Free the key so the same request can be retried
+                    IdempotencyRecord.objects.filter(key=entry_key, status__isnull=True).delete()
+
+        return wrapped
+
+    return decorator
+
+
+def body_or_query_value(request: HttpRequest, name: str) -> str | None:
+    """
+    Read `name` from a JSON/form body or the query string before DRF parses
+    the request (DRF reuses the parsed form and the cached body).
+    """
+    value = None
+    content_type = request.content_type or ""
+    if request.method in _UNSAFE_METHODS:
+        # Cache the raw body before form parsing so the view can still read it
+        body = request.body
+        if content_type == "application/json" and body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                value = data.get(name)
+        elif content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+            value = request.POST.get(name)
+    return str(value) if value else request.GET.get(name)
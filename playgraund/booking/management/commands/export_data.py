@@ -0,0 +1,57 @@
+# booking/management/commands/export_data.py
+"""
+Stream bookings, series or payments to a CSV or NDJSON file.
+
+Rows are read in chunks through a server-side cursor and written as they
+arrive, so memory stays flat however many rows match.
+
+    python manage.py export_data payments --output payments.csv
+    python manage.py export_data bookings --format ndjson --start 2025-01-01 --end 2025-12-31
+    python manage.py export_data series --status approved > series.csv
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.exports import DATASETS, EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_export
+
+
+def _date(raw: str):
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date {raw!r}; use YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Export bookings, series or payments as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=list(DATASETS))
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", "-o", help="File to write; standard output by default.")
+        parser.add_argument("--start", type=_date, help="First day (YYYY-MM-DD).")
+        parser.add_argument("--end", type=_date, help="Last day (YYYY-MM-DD).")
+        parser.add_argument("--status")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        try:
+            lines = iter_export(
+                opts["dataset"], opts["format"], chunk_size=opts["chunk_size"],
+                start=opts["start"], end=opts["end"], status=opts["status"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not opts["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        written = 0
+        with open(opts["output"], "w", encoding="utf-8", newline="") as out:
+            for line in lines:
+                out.write(line)
+                written += 1
+        rows = written - 1 if opts["format"] == "csv" else written
+        self.stderr.write(f"Wrote {rows} {opts['dataset']} rows to {opts['output']}")
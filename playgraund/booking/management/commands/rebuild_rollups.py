@@ -0,0 +1,57 @@
+# booking/management/commands/rebuild_rollups.py
+"""
+Backfill or repair the reporting rollups from the source tables.
+
+Migration 0007 backfills the table when it is created; run this after any
+write that bypassed the model layer. Each chunk of days is recomputed and swapped in
+its own transaction, so the command can be stopped and rerun at will.
+Customer totals cover all history, so every run recomputes them in full.
+
+    python manage.py rebuild_rollups                                   # all history
+    python manage.py rebuild_rollups --start 2025-01-01 --end 2025-03-31
+    python manage.py rebuild_rollups --chunk-days 7
+"""
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import rollups
+
+
+def _date(raw: str):
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date {raw!r}; use YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Recompute DailyBookingRollup rows over a date range (default: all history) and CustomerRollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=_date, help="First day (YYYY-MM-DD).")
+        parser.add_argument("--end", type=_date, help="Last day (YYYY-MM-DD).")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days per transaction.")
+
+    def handle(self, *args, **opts):
+        if opts["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+        started = time.monotonic()
+        customers = rollups.rebuild_customers()
+        self.stdout.write(f"Rebuilt {customers} customer rows in {time.monotonic() - started:.1f}s")
+
+        span = rollups.history_span()
+        if span is None and not (opts["start"] and opts["end"]):
+            self.stdout.write("Nothing to roll up.")
+            return
+        start = opts["start"] or span[0]
+        end = opts["end"] or span[1]
+        if end < start:
+            raise CommandError("--end must not be before --start")
+
+        started = time.monotonic()
+        written = rollups.rebuild(start, end, opts["chunk_days"])
+        self.stdout.write(
+            f"Rebuilt {start}..{end}: {written} rollup rows in {time.monotonic() - started:.1f}s"
+        )
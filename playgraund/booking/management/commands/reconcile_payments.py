@@ -0,0 +1,140 @@
+# booking/management/commands/reconcile_payments.py
+"""
+Settle payments whose Chapa callback never arrived.
+
+Unresolved payments (initiated, or abandoned by sweep_expired_holds) are
+read in primary-key order one batch at a time, verified against Chapa on a
+bounded thread pool sharing one pooled session, and applied with the same
+approval logic as chapa_callback, one bulk approve_transactions() per batch.
+Worker threads only do HTTP; all DB work stays on the main thread.
+
+    python manage.py reconcile_payments                      # payments older than 5 minutes
+    python manage.py reconcile_payments --workers 32 --since-days 30
+    python manage.py reconcile_payments --stub --stub-status success --stub-latency 0.2
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from booking.approvals import approve_transactions
+from booking.chapa import ChapaClient, ChapaError, ChapaUnavailable, StubChapaAdapter
+from booking.models import ChapaPayment, PaymentStatus
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = [PaymentStatus.INITIATED, PaymentStatus.ABANDONED]
+# Chapa verify statuses that close a transaction without payment
+FAILED_STATUSES = {"failed", "cancelled"}
+
+
+def unresolved_batches(older_than, newer_than, batch_size: int):
+    """Yield lists of tx_refs, keyset-paginated on pk so memory stays flat."""
+    qs = ChapaPayment.objects.filter(
+        status__in=UNRESOLVED, created_at__lt=older_than, created_at__gte=newer_than
+    ).order_by("pk")
+    last_pk = 0
+    while True:
+        rows = list(qs.filter(pk__gt=last_pk).values_list("pk", "tx_ref")[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield [tx_ref for _, tx_ref in rows]
+
+
+def _verify(client: ChapaClient, tx_ref: str):
+    """(tx_ref, outcome, payload) with outcome one of paid / failed / pending / error."""
+    try:
+        data = client.verify(tx_ref)
+    except (ChapaError, requests.RequestException) as e:
+        # One broken response (e.g. a truncated body) must not stop the run
+        return tx_ref, "error", {"error": str(e)}
+    if client.is_success(data):
+        return tx_ref, "paid", data
+    if str((data.get("data") or {}).get("status", "")).lower() in FAILED_STATUSES:
+        return tx_ref, "failed", data
+    return tx_ref, "pending", data
+
+
+def reconcile(client: ChapaClient, workers: int, batch_size: int, older_than, newer_than) -> dict:
+    counts = {"checked": 0, "paid": 0, "approved_bookings": 0, "failed": 0, "pending": 0, "error": 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconcile") as pool:
+        for tx_refs in unresolved_batches(older_than, newer_than, batch_size):
+            paid, failed = {}, []
+            for tx_ref, outcome, data in pool.map(lambda ref: _verify(client, ref), tx_refs):
+                counts[outcome] += 1
+                if outcome == "paid":
+                    paid[tx_ref] = {**data, "source": "reconcile"}
+                elif outcome == "failed":
+                    failed.append(tx_ref)
+            counts["checked"] += len(tx_refs)
+
+            for tx_ref, approved in approve_transactions(paid).items():
+                counts["approved_bookings"] += approved
+                if not approved:
+                    # Paid after its holds lapsed: money taken, nothing booked
+                    logger.error("Reconciled payment %s approved no bookings; needs review", tx_ref)
+            if failed:
+                ChapaPayment.objects.filter(tx_ref__in=failed, status__in=UNRESOLVED).update(
+                    status=PaymentStatus.FAILED, updated_at=timezone.now()
+                )
+            if client.breaker.state == "open":
+                # Results so far are applied; the rest would only fail fast
+                raise ChapaUnavailable("Chapa circuit open")
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Verify unresolved Chapa payments and approve the ones that were paid."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="Concurrent verify calls.")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--min-age", type=float, default=5,
+                            help="Minutes; younger payments may still get their callback.")
+        parser.add_argument("--since-days", type=float, default=7,
+                            help="Ignore payments created longer ago than this.")
+        parser.add_argument("--stub", action="store_true", help="Verify against StubChapaAdapter.")
+        parser.add_argument("--stub-latency", type=float, default=0.0)
+        parser.add_argument("--stub-failure-rate", type=float, default=0.0)
+        parser.add_argument("--stub-status", choices=["success", "failed", "pending"],
+                            help="Status the stub reports for every transaction; required with --stub.")
+
+    def handle(self, *args, **opts):
+        overrides = {"pool_maxsize": opts["workers"]}
+        if opts["stub"]:
+            if not opts["stub_status"]:
+                # The stub answers for every payment; never default to "paid"
+                raise CommandError("--stub-status is required with --stub")
+            overrides["adapter"] = StubChapaAdapter(
+                latency=opts["stub_latency"],
+                failure_rate=opts["stub_failure_rate"],
+                unknown_status=opts["stub_status"],
+            )
+        client = ChapaClient.from_settings(**overrides)
+
+        now = timezone.now()
+        started = time.monotonic()
+        try:
+            counts = reconcile(
+                client, opts["workers"], opts["batch_size"],
+                older_than=now - timedelta(minutes=opts["min_age"]),
+                newer_than=now - timedelta(days=opts["since_days"]),
+            )
+        except ChapaUnavailable as e:
+            self.stderr.write(f"Stopped: Chapa unavailable ({e}); rerun to continue.")
+            return
+        finally:
+            client.session.close()
+
+        elapsed = time.monotonic() - started
+        rate = counts["checked"] / elapsed if elapsed else 0.0
+        self.stdout.write(
+            "Checked {checked} payments: {paid} paid ({approved_bookings} bookings approved), "
+            "{failed} failed, {pending} still pending, {error} errors".format(**counts)
+            + f" in {elapsed:.1f}s ({rate:.0f}/s)"
+        )
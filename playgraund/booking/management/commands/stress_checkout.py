@@ -0,0 +1,180 @@
+# booking/management/commands/stress_checkout.py
+"""
+Concurrency stress test for series checkout.
+
+Fires many StartCheckoutSeriesView requests from a thread pool at a small
+set of (field, timeslot) pairs that all start on the same date, so every
+request competes for the same weekly slots. Afterwards it checks that no
+(field, date, timeslot) has more than one active booking and that every
+response's occurrence count matches the holds it actually owns, then reports
+throughput and latency percentiles. A run in which no checkout succeeded
+fails too: it proves nothing about double booking.
+
+Chapa is always the in-process stub. The run writes scratch fields (and
+timeslots, when there are not enough) plus their bookings to the configured
+database, so it refuses to start without --write-scratch; they are removed
+afterwards unless --keep is given.
+
+    python manage.py stress_checkout --write-scratch --threads 32 --requests 400 --fields 2 --slots 2
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as time_cls, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from booking import chapa
+from booking.models import ACTIVE_BOOKING_STATUSES, Booking, BookingSeries
+from booking.views import StartCheckoutSeriesView
+from field.models import Field
+from timeslot.models import Timeslot
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def run_stress(fields, timeslots, threads: int, requests: int, months: int = 1, stub_latency: float = 0.0) -> dict:
+    """Run the checkouts and return the report dict (see Command.handle for the fields)."""
+    start_date = timezone.localdate() + timedelta(days=7)
+    targets = [(f.id, ts.id) for f in fields for ts in timeslots]
+    view = StartCheckoutSeriesView.as_view()
+    factory = RequestFactory()
+    results = []
+    results_lock = threading.Lock()
+
+    def one(i):
+        field_id, ts_id = targets[i % len(targets)]
+        request = factory.post("/series/start-checkout/", {
+            "playground": field_id, "time_slot": ts_id, "start_date": str(start_date),
+            "months": months, "guest_name": f"Stress {i}",
+        })
+        request.user = AnonymousUser()
+        began = time.perf_counter()
+        try:
+            response = view(request)
+            response.render()
+            body = response.data if isinstance(response.data, dict) else {}
+            row = (response.status_code, time.perf_counter() - began, body.get("tx_ref"), body.get("occurrences"))
+        except Exception as e:  # report, do not kill the pool
+            row = (type(e).__name__, time.perf_counter() - began, None, None)
+        finally:
+            close_old_connections()
+        with results_lock:
+            results.append(row)
+
+    with override_settings(CHAPA_STUB=True, CHAPA_STUB_LATENCY_SEC=stub_latency):
+        chapa.reset_client()
+        try:
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="stress") as pool:
+                list(pool.map(one, range(requests)))
+            wall = time.perf_counter() - wall_start
+        finally:
+            chapa.reset_client()
+
+    field_ids = [f.id for f in fields]
+    double_booked = (
+        Booking.objects.filter(playground_id__in=field_ids, status__in=ACTIVE_BOOKING_STATUSES)
+        .order_by().values("playground_id", "date", "time_slot_id")
+        .annotate(n=Count("id")).filter(n__gt=1).count()
+    )
+    held = dict(
+        Booking.objects.filter(playground_id__in=field_ids, status__in=ACTIVE_BOOKING_STATUSES)
+        .exclude(chapa_tx_ref="").order_by().values("chapa_tx_ref").annotate(n=Count("id"))
+        .values_list("chapa_tx_ref", "n")
+    )
+    mismatched = sum(1 for st, _, tx_ref, occ in results if st == 200 and held.get(tx_ref, 0) != occ)
+
+    latencies = sorted(lat for _, lat, _, _ in results)
+    statuses = {}
+    for st, *_ in results:
+        statuses[str(st)] = statuses.get(str(st), 0) + 1
+    return {
+        "requests": len(results),
+        "succeeded": statuses.get("200", 0),
+        "statuses": statuses,
+        "held": sum(held.values()),
+        "double_booked": double_booked,
+        "mismatched": mismatched,
+        "wall_sec": wall,
+        "throughput": len(results) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = "Fire concurrent checkouts at the same slots and verify nothing is double-booked."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--fields", type=int, default=1, help="Scratch fields to spread load over.")
+        parser.add_argument("--slots", type=int, default=2, help="Timeslots per field.")
+        parser.add_argument("--months", type=int, choices=[1, 3, 6], default=1)
+        parser.add_argument("--stub-latency", type=float, default=0.0,
+                            help="Seconds the stub gateway takes per call.")
+        parser.add_argument("--keep", action="store_true", help="Keep the scratch data.")
+        parser.add_argument("--write-scratch", action="store_true",
+                            help="Confirm the run may create scratch rows in the configured database.")
+
+    def handle(self, *args, **opts):
+        if not opts["write_scratch"]:
+            db_name = connections[DEFAULT_DB_ALIAS].settings_dict["NAME"]
+            raise CommandError(
+                f"stress_checkout creates scratch fields and bookings in {db_name}; "
+                "pass --write-scratch to confirm (preferably against a copy)."
+            )
+
+        run_id = timezone.now().strftime("%Y%m%d%H%M%S")
+        fields, created_slots = [], []
+        try:
+            for i in range(opts["fields"]):
+                fields.append(Field.objects.create(name=f"Stress {run_id} #{i}", type="football",
+                                                   price_per_session=Decimal("100.00")))
+            timeslots = list(Timeslot.objects.order_by("start_time")[:opts["slots"]])
+            hour = 0
+            while len(timeslots) < opts["slots"] and hour < 23:
+                ts, made = Timeslot.objects.get_or_create(start_time=time_cls(hour), end_time=time_cls(hour + 1))
+                if ts not in timeslots:
+                    timeslots.append(ts)
+                    if made:
+                        created_slots.append(ts)
+                hour += 1
+
+            report = run_stress(fields, timeslots, opts["threads"], opts["requests"],
+                                opts["months"], opts["stub_latency"])
+        finally:
+            if not opts["keep"]:
+                Booking.objects.filter(playground__in=fields).delete()
+                BookingSeries.objects.filter(playground__in=fields).delete()
+                for obj in fields + created_slots:
+                    obj.delete()
+
+        self.stdout.write(
+            "{requests} checkouts in {wall_sec:.2f}s: {throughput:.1f} req/s, "
+            "p50 {p50_ms:.1f} ms, p99 {p99_ms:.1f} ms, max {max_ms:.1f} ms".format(**report)
+        )
+        self.stdout.write(f"Responses: {report['statuses']}; holds: {report['held']}")
+        if report["double_booked"] or report["mismatched"]:
+            raise CommandError(
+                f"{report['double_booked']} double-booked slots, "
+                f"{report['mismatched']} responses disagree with their holds"
+            )
+        if not (report["succeeded"] and report["held"]):
+            raise CommandError("No checkout succeeded, so the run checked nothing; see the responses above")
+        self.stdout.write(self.style.SUCCESS("No double bookings."))
@@ -0,0 +1,106 @@
+# booking/management/commands/sweep_expired_holds.py
+"""
+Free slots held by abandoned checkouts.
+
+PENDING bookings past their hold_expires_at are already treated as
+free by availability, but their rows still own the active-slot unique key
+until a checkout for that exact slot releases them. This command deletes
+them in batches and marks the DRAFT/PENDING series and
+initiated payments they belonged to as abandoned. It also purges expired
+Idempotency-Key records.
+
+    python manage.py sweep_expired_holds               # one pass
+    python manage.py sweep_expired_holds --every 60    # keep sweeping every minute
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from booking.availability import hold_cutoff
+from booking.models import (
+    Booking,
+    BookingSeries,
+    BookingStatus,
+    ChapaPayment,
+    IdempotencyRecord,
+    PaymentStatus,
+    SeriesStatus,
+)
+
+
+def _in_batches(qs, batch_size, apply) -> int:
+    """Run `apply(pk_list)` over `qs` one short transaction per batch; returns rows touched."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(qs.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += apply(ids)
+
+
+def sweep(batch_size: int = 500) -> dict[str, int]:
+    cutoff = hold_cutoff()
+
+    def _delete_holds(ids):
+        # A regular delete, so the post_delete receivers keep the rollups and
+        # availability versions in step with the rows that go
+        deleted, _ = Booking.objects.filter(pk__in=ids).delete()
+        return deleted
+
+    holds = _in_batches(
+        Booking.objects.filter(status=BookingStatus.PENDING, hold_expires_at__lte=timezone.now()),
+        batch_size, _delete_holds,
+    )
+    # QuerySet.update() skips auto_now, so stamp updated_at explicitly
+    series = _in_batches(
+        BookingSeries.objects.filter(
+            status__in=[SeriesStatus.DRAFT, SeriesStatus.PENDING], created_at__lt=cutoff
+        ),
+        batch_size,
+        lambda ids: BookingSeries.objects.filter(pk__in=ids).update(
+            status=SeriesStatus.ABANDONED, updated_at=timezone.now()
+        ),
+    )
+    payments = _in_batches(
+        ChapaPayment.objects.filter(status=PaymentStatus.INITIATED, created_at__lt=cutoff),
+        batch_size,
+        lambda ids: ChapaPayment.objects.filter(pk__in=ids).update(
+            status=PaymentStatus.ABANDONED, updated_at=timezone.now()
+        ),
+    )
+    now = timezone.now()
+    expired_keys = IdempotencyRecord.objects.filter(expires_at__lte=now)
+    keys = _in_batches(
+        expired_keys, batch_size,
+        # Re-check expiry so a key claimed again meanwhile is kept
+        lambda ids: expired_keys.filter(pk__in=ids).delete()[0],
+    )
+    return {"holds": holds, "series": series, "payments": payments, "keys": keys}
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired PENDING holds, mark their series/payments abandoned "
+        "and purge expired idempotency keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--every", type=float, default=0,
+            help="Seconds between sweeps; 0 (default) runs a single pass.",
+        )
+
+    def handle(self, *args, **opts):
+        while True:
+            counts = sweep(opts["batch_size"])
+            self.stdout.write(
+                "Swept {holds} expired holds, {series} series, {payments} payments, "
+                "{keys} idempotency keys".format(**counts)
+            )
+            if not opts["every"]:
+                return
+            time.sleep(opts["every"])
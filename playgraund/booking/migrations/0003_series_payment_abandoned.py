@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookingseries',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('pending', 'Pending Payment'), ('approved', 'Approved'), ('cancelled', 'Cancelled'), ('abandoned', 'Abandoned')], default='draft', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='chapapayment',
+            name='status',
+            field=models.CharField(choices=[('initiated', 'Initiated'), ('paid', 'Paid'), ('failed', 'Failed'), ('cancelled', 'Cancelled'), ('abandoned', 'Abandoned')], default='initiated', max_length=20),
+        ),
+    ]
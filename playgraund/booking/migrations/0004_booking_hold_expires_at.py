@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:32
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def stamp_pending_holds(apps, schema_editor):
+    # Existing holds expire where the old created_at + TTL rule put them
+    Booking = apps.get_model('booking', 'Booking')
+    ttl = timedelta(minutes=int(getattr(settings, 'PENDING_HOLD_TTL_MINUTES', 10)))
+    Booking.objects.filter(status='pending', hold_expires_at__isnull=True).update(
+        hold_expires_at=models.F('created_at') + ttl
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_series_payment_abandoned'),
+        ('field', '0001_initial'),
+        ('timeslot', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['playground', 'date', 'time_slot', 'status', 'hold_expires_at'], name='booking_live_slot_idx'),
+        ),
+        migrations.RunPython(stamp_pending_holds, migrations.RunPython.noop),
+    ]
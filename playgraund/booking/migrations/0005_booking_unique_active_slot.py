@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def release_inactive_slots(apps, schema_editor):
+    Booking = apps.get_model('booking', 'Booking')
+    # Lapsed holds would keep owning their slot under the new constraint
+    Booking.objects.filter(status='pending', hold_expires_at__lte=timezone.now()).delete()
+
+    # Databases that never enforced unique_together may hold several active
+    # rows per slot: keep approved over pending, then the oldest, cancel the rest
+    active = Booking.objects.filter(status__in=['pending', 'approved'])
+    dupes = (
+        active.values('playground_id', 'date', 'time_slot_id')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+    )
+    for key in dupes:
+        rows = list(
+            active.filter(
+                playground_id=key['playground_id'], date=key['date'], time_slot_id=key['time_slot_id']
+            ).order_by('status', 'created_at', 'id').values_list('id', flat=True)
+        )
+        Booking.objects.filter(id__in=rows[1:]).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_booking_hold_expires_at'),
+        ('field', '0001_initial'),
+        ('timeslot', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='booking',
+            unique_together=set(),
+        ),
+        migrations.RunPython(release_inactive_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'approved'])), fields=('playground', 'date', 'time_slot'), name='booking_unique_active_slot'),
+        ),
+    ]
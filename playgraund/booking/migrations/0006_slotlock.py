@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_booking_unique_active_slot'),
+        ('field', '0001_initial'),
+        ('timeslot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('playground', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='field.field')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='timeslot.timeslot')),
+            ],
+            options={
+                'unique_together': {('playground', 'time_slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:47
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    # Same sources as booking.rollups.rebuild(), over all history at once, so
+    # analytics read real totals from the first request after deploy
+    Booking = apps.get_model('booking', 'Booking')
+    ChapaPayment = apps.get_model('booking', 'ChapaPayment')
+    DailyBookingRollup = apps.get_model('booking', 'DailyBookingRollup')
+    rows = defaultdict(lambda: [0, 0, Decimal('0'), 0])
+
+    slots = (
+        Booking.objects.order_by()
+        .values_list('date', 'playground_id', 'time_slot_id', 'status', 'is_paid')
+        .annotate(n=models.Count('pk'))
+    )
+    for day, field_id, ts_id, status, is_paid, n in slots:
+        row = rows[(day, field_id, ts_id, status)]
+        row[0] += n
+        row[1] += n * is_paid
+
+    payments = (
+        ChapaPayment.objects.filter(status='paid', paid_at__isnull=False)
+        .annotate(day=TruncDate('paid_at')).order_by()
+        .values_list('day', 'series__playground_id', 'series__time_slot_id')
+        .annotate(total=models.Sum('amount_etb'), n=models.Count('pk'))
+    )
+    walk_ins = (
+        Booking.objects.filter(status='approved', is_paid=True, series__isnull=True)
+        .annotate(day=TruncDate('created_at')).order_by()
+        .values_list('day', 'playground_id', 'time_slot_id')
+        .annotate(total=models.Sum('playground__price_per_session'), n=models.Count('pk'))
+    )
+    for day, field_id, ts_id, total, n in [*payments, *walk_ins]:
+        row = rows[(day, field_id, ts_id, 'approved')]
+        row[2] += total or 0
+        row[3] += n
+
+    DailyBookingRollup.objects.bulk_create(
+        [
+            DailyBookingRollup(
+                date=day, playground_id=field_id, time_slot_id=ts_id, status=status,
+                bookings=n, paid_bookings=paid, revenue_etb=amount, revenue_count=revenue_n,
+            )
+            for (day, field_id, ts_id, status), (n, paid, amount, revenue_n) in rows.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_slotlock'),
+        ('field', '0001_initial'),
+        ('timeslot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('bookings', models.IntegerField(default=0)),
+                ('paid_bookings', models.IntegerField(default=0)),
+                ('revenue_etb', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('revenue_count', models.IntegerField(default=0)),
+                ('playground', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='field.field')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='timeslot.timeslot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'playground', 'time_slot', 'status'), name='rollup_unique_day_slot_status')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:07
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_customers(apps, schema_editor):
+    # Same sources as booking.rollups.rebuild_customers(), through historical models
+    from booking.rollups import customer_of
+
+    Booking = apps.get_model('booking', 'Booking')
+    ChapaPayment = apps.get_model('booking', 'ChapaPayment')
+    CustomerRollup = apps.get_model('booking', 'CustomerRollup')
+    rows = defaultdict(lambda: {'bookings': 0, 'approved_bookings': 0, 'spend_etb': Decimal('0'),
+                                'last_booking': None, 'user_id': None, 'guest_name': ''})
+    who = ('user_id', 'guest_email', 'guest_phone')
+
+    bookings = (
+        Booking.objects.order_by().values_list(*who)
+        .annotate(n=models.Count('pk'), approved=models.Count('pk', filter=models.Q(status='approved')),
+                  last=models.Max('date'), name=models.Max('guest_name'))
+    )
+    for user_id, email, phone, n, approved, last, name in bookings:
+        customer = customer_of(user_id, email, phone)
+        if customer is None:
+            continue
+        row = rows[customer]
+        row['bookings'] += n
+        row['approved_bookings'] += approved
+        row['last_booking'] = max(filter(None, (row['last_booking'], last)), default=None)
+        row['user_id'] = user_id
+        row['guest_name'] = name or row['guest_name']
+
+    payments = (
+        ChapaPayment.objects.filter(status='paid', paid_at__isnull=False).order_by()
+        .values_list('series__purchaser_id', 'series__guest_email', 'series__guest_phone')
+        .annotate(total=models.Sum('amount_etb'))
+    )
+    walk_ins = (
+        Booking.objects.filter(status='approved', is_paid=True, series__isnull=True).order_by()
+        .values_list(*who).annotate(total=models.Sum('playground__price_per_session'))
+    )
+    for user_id, email, phone, total in [*payments, *walk_ins]:
+        customer = customer_of(user_id, email, phone)
+        if customer is not None:
+            rows[customer]['spend_etb'] += Decimal(total or 0)
+
+    CustomerRollup.objects.bulk_create(
+        [CustomerRollup(customer=customer, **row) for customer, row in rows.items()], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_booking_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.CharField(max_length=32, unique=True)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('guest_name', models.CharField(blank=True, default='', max_length=100)),
+                ('bookings', models.IntegerField(default=0)),
+                ('approved_bookings', models.IntegerField(default=0)),
+                ('spend_etb', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('last_booking', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-bookings', 'customer'], name='customer_rollup_bookings_idx'), models.Index(fields=['-spend_etb', 'customer'], name='customer_rollup_spend_idx'), models.Index(fields=['-last_booking', 'customer'], name='customer_rollup_last_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
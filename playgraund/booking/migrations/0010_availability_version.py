@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_customer_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('stale_at', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+    ]
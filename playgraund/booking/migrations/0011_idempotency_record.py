@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_availability_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('fingerprint', models.CharField(blank=True, max_length=32, null=True)),
+                ('status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('content_type', models.CharField(blank=True, default='', max_length=100)),
+                ('headers', models.JSONField(blank=True, default=list)),
+                ('compressed', models.BooleanField(default=False)),
+                ('body', models.BinaryField(blank=True, default=b'')),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -3,6 +3,9 @@ from __future__ import annotations
 import uuid
 from decimal import Decimal
 
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
@@ -14,6 +17,10 @@ from field.models import Field
 from timeslot.models import Timeslot
 
 
+# How long a PENDING checkout hold blocks its slot (stamped on each hold)
+PENDING_HOLD_TTL_MINUTES = int(getattr(settings, "PENDING_HOLD_TTL_MINUTES", 10))
+
+
 # =========================
 # Choices
 # =========================
@@ -24,11 +31,16 @@ class BookingStatus(models.TextChoices):
     CANCELLED = "cancelled", "Cancelled"   # admin-only (policy says: no refunds)
 
 
+# Statuses that occupy their (playground, date, time_slot)
+ACTIVE_BOOKING_STATUSES = [BookingStatus.PENDING, BookingStatus.APPROVED]
+
+
 class SeriesStatus(models.TextChoices):
     DRAFT = "draft", "Draft"               # created, before checkout
     PENDING = "pending", "Pending Payment" # checkout started (hold)
     APPROVED = "approved", "Approved"      # paid
     CANCELLED = "cancelled", "Cancelled"   # admin-only
+    ABANDONED = "abandoned", "Abandoned"   # checkout never completed (swept)
 
 
 class PaymentStatus(models.TextChoices):
@@ -36,6 +48,7 @@ class PaymentStatus(models.TextChoices):
     PAID = "paid", "Paid"
     FAILED = "failed", "Failed"
     CANCELLED = "cancelled", "Cancelled"
+    ABANDONED = "abandoned", "Abandoned"   # never paid within the hold TTL (swept)
 
 
 class EthiopianWeekday(models.IntegerChoices):
@@ -206,22 +219,52 @@ class Booking(models.Model):
     # Link to Chapa (filled if created directly via occurrence – normally series drives payment)
     chapa_tx_ref = models.CharField(max_length=128, blank=True, default="")
 
+    # PENDING holds stop blocking the slot at this instant (fixed when the hold
+    # is taken, so later TTL changes do not move existing holds)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = [("playground", "date", "time_slot")]
         ordering = ["-created_at"]
+        # Only active rows own a slot: cancelled bookings (and expired holds,
+        # once released) leave it free to be sold again
+        constraints = [
+            models.UniqueConstraint(
+                fields=["playground", "date", "time_slot"],
+                condition=models.Q(status__in=ACTIVE_BOOKING_STATUSES),
+                name="booking_unique_active_slot",
+            ),
+        ]
         indexes = [
             models.Index(fields=["date"]),
             models.Index(fields=["status"]),
             models.Index(fields=["playground", "date"]),
+            # "is this slot taken right now": equality on the first three,
+            # status / hold_expires_at checked inside the index
+            models.Index(
+                fields=["playground", "date", "time_slot", "status", "hold_expires_at"],
+                name="booking_live_slot_idx",
+            ),
+            # Keyset pagination of the booking list, newest first
+            models.Index(fields=["created_at", "id"], name="booking_created_id_idx"),
         ]
 
     def __str__(self):
         who = self.user or self.guest_name or "Guest"
         return f"{self.playground} @ {self.date} {self.time_slot} [{self.get_status_display()}] by {who}"
 
+    @staticmethod
+    def hold_expiry(now=None):
+        """Expiry to stamp on a hold taken at `now`."""
+        return (now or timezone.now()) + timedelta(minutes=PENDING_HOLD_TTL_MINUTES)
+
+    def save(self, *args, **kwargs):
+        if self.status == BookingStatus.PENDING and self.hold_expires_at is None:
+            self.hold_expires_at = self.hold_expiry()
+        super().save(*args, **kwargs)
+
     @property
     def price_etb(self) -> Decimal:
         """
@@ -285,6 +328,136 @@ class ChapaPayment(models.Model):
         self.save(update_fields=["status", "paid_at", "payload", "updated_at"])
 
 
+# =========================
+# Reservation locks
+# =========================
+
+class SlotLock(models.Model):
+    """
+    One row per (field, timeslot), locked with SELECT ... FOR UPDATE while a
+    reservation for that pair is written (see booking/reservations.py).
+    Rows are created on first use and never change.
+    """
+    playground = models.ForeignKey(Field, on_delete=models.CASCADE, related_name="+")
+    time_slot = models.ForeignKey(Timeslot, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        unique_together = [("playground", "time_slot")]
+
+    def __str__(self):
+        return f"SlotLock {self.playground_id}/{self.time_slot_id}"
+
+
+# =========================
+# Availability versions
+# =========================
+
+class AvailabilityVersion(models.Model):
+    """
+    Version counters behind availability ETags (booking/availability_cache.py),
+    kept in the database so every worker and management command sees the
+    same ones. key is "gen", "f:<field>" or "m:<field>:<yyyymm>"; on month
+    rows, stale_at (epoch seconds) is when the earliest pending hold seen in
+    that month lapses, which moves the version on without a write.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    version = models.BigIntegerField(default=0)
+    stale_at = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"AvailabilityVersion {self.key}={self.version}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Responses stored per Idempotency-Key (booking/idempotency.py), in the
+    database so a retry that lands on another worker is still replayed. key
+    is a digest of (scope, user, client key). status is null while the first
+    request is still running; expires_at is then when that claim lapses, and
+    afterwards when the stored response stops being replayed.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=32, null=True, blank=True)
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default="")
+    headers = models.JSONField(default=list, blank=True)
+    compressed = models.BooleanField(default=False)
+    body = models.BinaryField(default=b"", blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"IdempotencyRecord {self.key} ({self.status or 'in progress'})"
+
+
+# =========================
+# Reporting rollup
+# =========================
+
+class DailyBookingRollup(models.Model):
+    """
+    Per-day totals for the analytics endpoints, kept current by
+    booking/rollups.py and rebuilt by `manage.py rebuild_rollups`.
+
+    bookings / paid_bookings count Booking rows by their play date and
+    current status. revenue_etb / revenue_count are recognised on the local
+    day the money was taken (paid_at of a Chapa payment, created_at of a paid
+    admin booking without a series) and always sit on the APPROVED row.
+    """
+    date = models.DateField()
+    playground = models.ForeignKey(Field, on_delete=models.CASCADE, related_name="+")
+    time_slot = models.ForeignKey(Timeslot, on_delete=models.CASCADE, related_name="+")
+    status = models.CharField(max_length=20, choices=BookingStatus.choices)
+
+    bookings = models.IntegerField(default=0)
+    paid_bookings = models.IntegerField(default=0)
+    revenue_etb = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    revenue_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "playground", "time_slot", "status"], name="rollup_unique_day_slot_status",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.date} {self.playground_id}/{self.time_slot_id} {self.status}: {self.bookings}"
+
+
+class CustomerRollup(models.Model):
+    """
+    All-time totals per customer for the leaderboard (bookings/per_user/),
+    kept with DailyBookingRollup by booking/rollups.py.
+
+    `customer` is a digest of who booked (profile, else normalised email,
+    else phone; see rollups.customer_of), so the table holds no contact
+    details. spend_etb is what the customer paid: their series' paid Chapa
+    payments plus paid admin bookings at the field price. last_booking only
+    moves forward between rebuilds.
+    """
+    customer = models.CharField(max_length=32, unique=True)
+    # Plain id, not a ForeignKey: deleting a profile nulls Booking.user in
+    # bulk, which only rebuild_rollups can re-attribute
+    user_id = models.BigIntegerField(null=True, blank=True)
+    guest_name = models.CharField(max_length=100, blank=True, default="")
+
+    bookings = models.IntegerField(default=0)
+    approved_bookings = models.IntegerField(default=0)
+    spend_etb = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    last_booking = models.DateField(null=True, blank=True)
+
+    class Meta:
+        # One per leaderboard sort, matching its keyset order
+        indexes = [
+            models.Index(fields=["-bookings", "customer"], name="customer_rollup_bookings_idx"),
+            models.Index(fields=["-spend_etb", "customer"], name="customer_rollup_spend_idx"),
+            models.Index(fields=["-last_booking", "customer"], name="customer_rollup_last_idx"),
+        ]
+
+    def __str__(self):
+        return f"Customer {self.customer}: {self.bookings} bookings, {self.spend_etb} ETB"
+
+
 # =========================
 # Signals: keep flags aligned
 # =========================
@@ -306,3 +479,102 @@ def _sync_flags_on_approved(sender, instance: Booking, **kwargs):
         if updates:
             # Avoid recursion: update only the fields we changed
             Booking.objects.filter(pk=instance.pk).update(**{k: getattr(instance, k) for k in updates})
+
+
+# =========================
+# Signals: availability cache versions
+# =========================
+
+from datetime import date as date_cls
+
+from django.db.models.signals import post_delete, post_init
+
+from .signals import series_approved
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=FieldBlackout)
+def _remember_availability_origin(sender, instance, **kwargs):
+    """
+    Remember where a row sat when loaded, so moving it to another
+    field/date also invalidates the month it left.
+    """
+    # Read __dict__ directly so deferred fields are not fetched
+    instance._availability_origin = (
+        instance.__dict__.get("playground_id"), instance.__dict__.get("date")
+    )
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=FieldBlackout)
+@receiver(post_delete, sender=FieldBlackout)
+def _bump_month_availability(sender, instance, **kwargs):
+    from . import availability_cache
+
+    availability_cache.bump_month(instance.playground_id, instance.date)
+    origin = getattr(instance, "_availability_origin", None)
+    if origin and origin != (instance.playground_id, instance.date):
+        availability_cache.bump_month(*origin)
+    instance._availability_origin = (instance.playground_id, instance.date)
+
+
+@receiver(series_approved)
+def _bump_series_availability(sender, series, **kwargs):
+    """Bulk approval skips post_save; invalidate every month the series spans."""
+    from . import availability_cache
+
+    end = series.start_date + timedelta(days=31 * series.months + 1)
+    for y, m in availability_cache.months_in(series.start_date, end):
+        availability_cache.bump_month(series.playground_id, date_cls(y, m, 1))
+
+
+@receiver(post_save, sender=FieldWeeklySlot)
+@receiver(post_delete, sender=FieldWeeklySlot)
+@receiver(post_save, sender=Field)
+@receiver(post_delete, sender=Field)
+def _bump_field_availability(sender, instance, **kwargs):
+    from . import availability_cache
+
+    availability_cache.bump_field(instance.pk if sender is Field else instance.playground_id)
+
+
+@receiver(post_save, sender=Timeslot)
+@receiver(post_delete, sender=Timeslot)
+def _bump_global_availability(sender, instance, **kwargs):
+    from . import availability_cache
+
+    availability_cache.bump_global()
+
+
+# =========================
+# Signals: reporting rollup
+# =========================
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=ChapaPayment)
+def _remember_rollup_origin(sender, instance, **kwargs):
+    from . import rollups
+
+    instance._rollup_origin = rollups.state_of(instance)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=ChapaPayment)
+def _update_rollup_on_save(sender, instance, created, **kwargs):
+    from . import rollups
+
+    new = rollups.state_of(instance)
+    old = None if created else getattr(instance, "_rollup_origin", None)
+    # A row saved from a partial load has an unknown old contribution; leave
+    # it to rebuild_rollups rather than count it twice
+    if created or old is not None:
+        rollups.apply_change(sender, old, new)
+    instance._rollup_origin = new
+
+
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=ChapaPayment)
+def _update_rollup_on_delete(sender, instance, **kwargs):
+    from . import rollups
+
+    rollups.apply_change(sender, getattr(instance, "_rollup_origin", None) or rollups.state_of(instance), None)
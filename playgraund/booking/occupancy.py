@@ -0,0 +1,166 @@
+# booking/occupancy.py
+"""
+Compact per-(field, date) occupancy bitsets.
+
+Every Timeslot gets one bit, assigned in start_time order (its "sequence").
+For each field we keep one machine word per day in an ``array`` for each of
+four layers:
+
+    closed    weekly rule closed or blacked out
+    blackout  blacked out (subset of closed)
+    taken     held by an approved or fresh pending booking
+    approved  held by an approved booking (subset of taken)
+
+A month for a field is 4 x 31 x 8 bytes, so all fields fit in a few KB and
+every lookup is an index + bit test.
+"""
+from __future__ import annotations
+
+from array import array
+from datetime import date as date_cls
+from functools import reduce
+from typing import Iterable, Sequence
+
+# One 64-bit word per day; wider timeslot sets fall back to Python ints
+_WORD_BITS = 64
+
+
+def union(*masks: int) -> int:
+    return reduce(lambda a, b: a | b, masks, 0)
+
+
+def intersection(*masks: int) -> int:
+    if not masks:
+        return 0
+    return reduce(lambda a, b: a & b, masks)
+
+
+def first_bit(mask: int) -> int | None:
+    """Index of the lowest set bit, or None for an empty mask."""
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def iter_bits(mask: int):
+    """Yield set bit indexes in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SlotBits:
+    """Bidirectional Timeslot <-> bit position mapping."""
+
+    def __init__(self, timeslots: Sequence):
+        self.timeslots = list(timeslots)
+        self._bit_by_id = {ts.id: i for i, ts in enumerate(self.timeslots)}
+        self.full = (1 << len(self.timeslots)) - 1
+
+    def __len__(self):
+        return len(self.timeslots)
+
+    def bit(self, ts_id: int | None) -> int:
+        """Mask for a timeslot id; None (whole day) or unknown ids map to all / no bits."""
+        if ts_id is None:
+            return self.full
+        pos = self._bit_by_id.get(ts_id)
+        return 0 if pos is None else 1 << pos
+
+    def timeslot(self, pos: int):
+        return self.timeslots[pos]
+
+    def timeslots_in(self, mask: int) -> list:
+        return [self.timeslots[i] for i in iter_bits(mask)]
+
+
+class OccupancyIndex:
+    """Day-indexed closed/blackout/taken/approved bitmasks for a set of fields over [start, end)."""
+
+    LAYERS = ("closed", "blackout", "taken", "approved")
+
+    def __init__(self, field_ids: Iterable[int], slots: SlotBits, start: date_cls, end: date_cls):
+        self.slots = slots
+        self.start = start
+        self.end = end
+        self.ndays = max((end - start).days, 0)
+        self._layers: dict[str, dict[int, Sequence[int]]] = {
+            layer: {fid: self._empty() for fid in field_ids} for layer in self.LAYERS
+        }
+
+    def _empty(self):
+        if len(self.slots) <= _WORD_BITS:
+            return array("Q", bytes(8 * self.ndays))
+        return [0] * self.ndays
+
+    def _offset(self, d: date_cls) -> int | None:
+        i = (d - self.start).days
+        return i if 0 <= i < self.ndays else None
+
+    @property
+    def field_ids(self) -> list[int]:
+        return list(self._layers["closed"])
+
+    def nbytes(self) -> int:
+        total = 0
+        for layer in self._layers.values():
+            for masks in layer.values():
+                total += masks.itemsize * len(masks) if isinstance(masks, array) else 8 * len(masks)
+        return total
+
+    # ---- writes (used while loading) ----
+    def mark(self, layer: str, field_id: int, d: date_cls, mask: int) -> None:
+        i = self._offset(d)
+        masks = self._layers[layer].get(field_id)
+        if i is None or masks is None or not mask:
+            return
+        masks[i] |= mask
+
+    def mark_all_days(self, layer: str, field_id: int, mask_for_weekday: Sequence[int]) -> None:
+        """OR a weekday -> mask table into every day of the window."""
+        masks = self._layers[layer].get(field_id)
+        if masks is None or not any(mask_for_weekday):
+            return
+        first_dow = self.start.weekday()
+        for i in range(self.ndays):
+            masks[i] |= mask_for_weekday[(first_dow + i) % 7]
+
+    # ---- reads ----
+    def get(self, layer: str, field_id: int, d: date_cls) -> int:
+        i = self._offset(d)
+        masks = self._layers[layer].get(field_id)
+        if i is None or masks is None:
+            return 0
+        return masks[i]
+
+    def closed(self, field_id: int, d: date_cls) -> int:
+        return self.get("closed", field_id, d)
+
+    def blackout(self, field_id: int, d: date_cls) -> int:
+        return self.get("blackout", field_id, d)
+
+    def taken(self, field_id: int, d: date_cls) -> int:
+        return self.get("taken", field_id, d)
+
+    def approved(self, field_id: int, d: date_cls) -> int:
+        return self.get("approved", field_id, d)
+
+    def free(self, field_id: int, d: date_cls) -> int:
+        """Slots that are open and not held."""
+        if field_id not in self._layers["closed"]:
+            return 0
+        return self.slots.full & ~(self.closed(field_id, d) | self.taken(field_id, d))
+
+    def free_any(self, field_ids: Iterable[int], d: date_cls) -> int:
+        """Slots free on at least one of the fields."""
+        return union(*(self.free(fid, d) for fid in field_ids))
+
+    def free_all(self, field_ids: Iterable[int], d: date_cls) -> int:
+        """Slots free on every one of the fields."""
+        return intersection(*(self.free(fid, d) for fid in field_ids))
+
+    def first_free(self, field_id: int, d: date_cls):
+        """Earliest free Timeslot on that day, or None."""
+        pos = first_bit(self.free(field_id, d))
+        return None if pos is None else self.slots.timeslot(pos)
@@ -0,0 +1,149 @@
+# booking/reservations.py
+"""
+Slot reservation with per-(field, timeslot) locking.
+
+Every write that can take a slot runs inside slot_reservation(field, ts):
+one transaction that holds an exclusive lock on that (field, timeslot) pair
+until it ends. Checkouts for different pairs never wait on each other; two
+checkouts for the same pair queue instead of racing to the unique
+constraint, which stays in place as the last line of defence.
+
+The lock depends on the backend:
+
+    postgresql           pg_advisory_xact_lock on a key derived from the pair
+    select_for_update    SELECT ... FOR UPDATE on the pair's SlotLock row
+    others (SQLite)      a process-local lock; SQLite already admits a
+                         single writer, so this only orders threads of one
+                         process (run one worker process against SQLite)
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import date as date_cls
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import rollups
+from .availability_cache import bump_months
+from .models import Booking, BookingStatus, SlotLock
+
+_ADVISORY_NAMESPACE = "booking.slot"
+
+
+def _advisory_key(field_id: int, ts_id: int) -> int:
+    # Signed 64-bit key, namespaced so it cannot collide with other advisory lock users
+    digest = hashlib.blake2b(f"{_ADVISORY_NAMESPACE}:{field_id}:{ts_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class _LocalLocks:
+    """Process-wide lock per key, dropped again once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: dict[tuple, list] = {}  # key -> [lock, users]
+
+    @contextmanager
+    def hold(self, key: tuple):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+_local_locks = _LocalLocks()
+
+
+def _lock_in_db(using: str, field_id: int, ts_id: int) -> None:
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_advisory_key(field_id, ts_id)])
+    else:
+        SlotLock.objects.using(using).get_or_create(playground_id=field_id, time_slot_id=ts_id)
+        SlotLock.objects.using(using).select_for_update().get(playground_id=field_id, time_slot_id=ts_id)
+
+
+@contextmanager
+def slot_reservation(field_id: int, ts_id: int, using: str | None = None):
+    """transaction.atomic() that owns the (field, timeslot) lock for its whole duration."""
+    using = using or router.db_for_write(Booking)
+    connection = connections[using]
+    in_db = connection.vendor == "postgresql" or connection.features.has_select_for_update
+    if in_db:
+        with transaction.atomic(using=using):
+            _lock_in_db(using, field_id, ts_id)
+            yield
+    else:
+        # Taken outside the transaction so it is only released after commit
+        with _local_locks.hold((using, field_id, ts_id)), transaction.atomic(using=using):
+            yield
+
+
+def release_expired_holds(field, ts, dates) -> None:
+    """
+    Delete lapsed PENDING holds on exactly these slots. They no longer count
+    as taken, but still own the active-slot unique key until removed.
+    """
+    Booking.objects.filter(
+        playground=field, time_slot=ts, date__in=list(dates),
+        status=BookingStatus.PENDING, hold_expires_at__lte=timezone.now(),
+    ).delete()
+
+
+def reserve_holds(series, field, ts, dates, tx_ref) -> set[date_cls]:
+    """
+    Insert PENDING holds for `dates` in one statement and return the dates
+    this series actually got; the rest were taken by someone else since they
+    were planned. Must run inside slot_reservation(field, ts).
+    """
+    if not dates:
+        return set()
+    release_expired_holds(field, ts, dates)
+    expires_at = Booking.hold_expiry()
+    Booking.objects.bulk_create(
+        [
+            Booking(
+                series=series,
+                user=series.purchaser,
+                guest_name=series.guest_name,
+                guest_email=series.guest_email,
+                guest_phone=series.guest_phone,
+                playground=field,
+                time_slot=ts,
+                date=d,
+                status=BookingStatus.PENDING,
+                is_booked=False,
+                is_paid=False,
+                chapa_tx_ref=tx_ref,
+                hold_expires_at=expires_at,
+            )
+            for d in dates
+        ],
+        # Writers that bypass the lock (admin edits) can still collide
+        ignore_conflicts=True,
+    )
+    got = set(Booking.objects.filter(series=series, date__in=dates).values_list("date", flat=True))
+    # bulk_create skips post_save, so invalidate cached availability and
+    # count the holds here
+    transaction.on_commit(lambda: bump_months(field.id, dates))
+    deltas = rollups.new_deltas()
+    for d in got:
+        rollups.add_bookings(deltas, (d, field.id, ts.id, BookingStatus.PENDING), 1)
+    if got:
+        rollups.add_customer(
+            deltas, rollups.customer_of(series.purchaser_id, series.guest_email, series.guest_phone),
+            bookings=len(got), day=max(got), user_id=series.purchaser_id, name=series.guest_name,
+        )
+    rollups.apply(deltas)
+    return got
@@ -0,0 +1,423 @@
+# booking/rollups.py
+"""
+Incremental maintenance of DailyBookingRollup and CustomerRollup.
+
+Every write path turns its change into deltas keyed by
+(date, field, timeslot, status) and by customer, and applies them with
+apply() inside the writer's own transaction, as one upsert per table:
+
+    single rows             post_init / post_save / post_delete receivers (models.py)
+    reserve_holds           the inserted holds, from the dates it got
+    approve_transactions    one grouped read of the holds before their UPDATE,
+                            plus the revenue of the payments it marks paid
+    sweep_expired_holds     one grouped read per deleted batch
+
+Writes that bypass all of these (queryset .update() from a shell, restored
+dumps) are repaired by rebuild() and rebuild_customers(), which
+`manage.py rebuild_rollups` runs (the daily rollup over any date range, in
+chunks).
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import defaultdict
+from datetime import date as date_cls, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from field.models import Field
+
+from .models import (
+    Booking,
+    BookingSeries,
+    BookingStatus,
+    ChapaPayment,
+    CustomerRollup,
+    DailyBookingRollup,
+    PaymentStatus,
+)
+
+_DAILY_ZERO = (0, 0, Decimal("0"), 0)
+_PHONE_NOISE = re.compile(r"[\s\-+().]")
+
+
+class Deltas:
+    """Pending changes to both rollups; apply() writes each table in one statement."""
+
+    def __init__(self):
+        # (date, field, timeslot, status) -> [bookings, paid_bookings, revenue_etb, revenue_count]
+        self.daily = defaultdict(lambda: list(_DAILY_ZERO))
+        # customer -> [bookings, approved_bookings, spend_etb, last_booking, user_id, guest_name]
+        self.customers = defaultdict(lambda: [0, 0, Decimal("0"), None, None, ""])
+
+
+def new_deltas() -> Deltas:
+    return Deltas()
+
+
+def customer_of(user_id, email, phone) -> str | None:
+    """
+    Who a booking or series belongs to, as an opaque digest: the profile
+    when there is one, otherwise the lowercased email, otherwise the last 9
+    phone digits (Ethiopian numbers written as 09..., 2519... or +251 9...
+    all end in the same 9). None when there is nothing to tell them apart.
+    """
+    if user_id is not None:
+        identity = f"user:{user_id}"
+    elif (email or "").strip():
+        identity = f"email:{email.strip().lower()}"
+    elif (phone or "").strip():
+        identity = f"phone:{_PHONE_NOISE.sub('', phone)[-9:]}"
+    else:
+        return None
+    return hashlib.blake2b(identity.encode(), digest_size=12).hexdigest()
+
+
+def add_bookings(deltas, key: tuple, n: int, paid: int = 0) -> None:
+    row = deltas.daily[key]
+    row[0] += n
+    row[1] += paid
+
+
+def add_revenue(deltas, day: date_cls, field_id: int, ts_id: int, amount, n: int = 1) -> None:
+    row = deltas.daily[(day, field_id, ts_id, BookingStatus.APPROVED)]
+    row[2] += Decimal(amount or 0)
+    row[3] += n
+
+
+def add_customer(deltas, customer: str | None, bookings: int = 0, approved: int = 0, spend=0,
+                 day: date_cls | None = None, user_id: int | None = None, name: str | None = "") -> None:
+    if customer is None:
+        return
+    row = deltas.customers[customer]
+    row[0] += bookings
+    row[1] += approved
+    row[2] += Decimal(spend or 0)
+    if day is not None and (row[3] is None or day > row[3]):
+        row[3] = day
+    if user_id is not None:
+        row[4] = user_id
+    if name:
+        row[5] = name
+
+
+def add_payment(deltas, day: date_cls, field_id: int, ts_id: int, customer: str | None, amount, n: int = 1) -> None:
+    """A paid Chapa payment: revenue on `day` and spend for the series' customer."""
+    add_revenue(deltas, day, field_id, ts_id, amount, n)
+    add_customer(deltas, customer, spend=amount)
+
+
+def _slot_counts(qs):
+    return (
+        qs.order_by()
+        .values_list("date", "playground_id", "time_slot_id", "status", "is_paid",
+                     "user_id", "guest_email", "guest_phone")
+        .annotate(n=Count("pk"))
+    )
+
+
+def add_update(deltas, qs, **changes) -> None:
+    """
+    Deltas for qs.update(**changes) where changes set status and/or is_paid.
+    Call before the UPDATE. Only for rows that carry no walk-in revenue
+    (series holds), which is every bulk path today.
+    """
+    for day, field_id, ts_id, status, is_paid, user_id, email, phone, n in _slot_counts(qs):
+        new_status, new_paid = changes.get("status", status), changes.get("is_paid", is_paid)
+        add_bookings(deltas, (day, field_id, ts_id, status), -n, -n * is_paid)
+        add_bookings(deltas, (day, field_id, ts_id, new_status), n, n * new_paid)
+        approved = (new_status == BookingStatus.APPROVED) - (status == BookingStatus.APPROVED)
+        add_customer(deltas, customer_of(user_id, email, phone), approved=n * approved)
+
+
+def add_delete(deltas, qs) -> None:
+    """Deltas for deleting qs without signals; same restriction as add_update()."""
+    for day, field_id, ts_id, status, is_paid, user_id, email, phone, n in _slot_counts(qs):
+        add_bookings(deltas, (day, field_id, ts_id, status), -n, -n * is_paid)
+        add_customer(deltas, customer_of(user_id, email, phone),
+                     bookings=-n, approved=-n * (status == BookingStatus.APPROVED))
+
+
+# ============================================================================
+# Writing deltas
+# ============================================================================
+# How a conflicting row takes each column of the new one
+_ADD = "{old} + {new}"
+_LATEST = "CASE WHEN {old} IS NULL OR {new} > {old} THEN {new} ELSE {old} END"
+_KEEP = "COALESCE({old}, {new})"
+_NON_EMPTY = "CASE WHEN {new} <> '' THEN {new} ELSE {old} END"
+
+_TABLES = (
+    # model, conflict key, (column, rule) in delta order, rows worth writing
+    (
+        DailyBookingRollup, ("date", "playground_id", "time_slot_id", "status"),
+        (("bookings", _ADD), ("paid_bookings", _ADD), ("revenue_etb", _ADD), ("revenue_count", _ADD)),
+        lambda row: any(row),
+    ),
+    (
+        CustomerRollup, ("customer",),
+        (("bookings", _ADD), ("approved_bookings", _ADD), ("spend_etb", _ADD), ("last_booking", _LATEST),
+         ("user_id", _KEEP), ("guest_name", _NON_EMPTY)),
+        lambda row: any(row[:4]),
+    ),
+)
+# Rows per upsert statement; at most 8 parameters each keeps it under SQLite's 999
+_UPSERT_BATCH = 100
+
+
+def _upsert_sql(connection, model, keys: tuple, columns: tuple, rows: int) -> str:
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = keys + tuple(c for c, _ in columns)
+    placeholders = "(" + ", ".join(["%s"] * len(names)) + ")"
+    return (
+        f"INSERT INTO {table} ({', '.join(map(qn, names))}) "
+        f"VALUES {', '.join([placeholders] * rows)} "
+        f"ON CONFLICT ({', '.join(map(qn, keys))}) DO UPDATE SET "
+        + ", ".join(
+            f"{qn(c)} = " + rule.format(old=f"{table}.{qn(c)}", new=f"EXCLUDED.{qn(c)}") for c, rule in columns
+        )
+    )
+
+
+def apply(deltas) -> None:
+    """
+    Write the deltas, creating missing rows: one INSERT ... ON CONFLICT DO
+    UPDATE per table per _UPSERT_BATCH keys, so a bulk write adds a single
+    statement per table however many days it touches.
+    """
+    using = router.db_for_write(DailyBookingRollup)
+    connection = connections[using]
+    for (model, keys, columns, worth), changes in zip(_TABLES, (deltas.daily, deltas.customers)):
+        rows = [(*(key if isinstance(key, tuple) else (key,)), *row) for key, row in changes.items() if worth(row)]
+        if not rows:
+            continue
+        if not connection.features.supports_update_conflicts_with_target:
+            _apply_per_row(model, keys, columns, rows, using)
+            continue
+        with connection.cursor() as cursor:
+            for i in range(0, len(rows), _UPSERT_BATCH):
+                batch = rows[i:i + _UPSERT_BATCH]
+                cursor.execute(_upsert_sql(connection, model, keys, columns, len(batch)),
+                               [value for row in batch for value in row])
+
+
+def _orm_assignment(model, column: str, rule: str, value):
+    if rule is _ADD:
+        return F(column) + value
+    if value is None or value == "":
+        return None
+    if rule is _LATEST:
+        return Case(
+            When(Q(**{f"{column}__isnull": True}) | Q(**{f"{column}__lt": value}), then=Value(value)),
+            default=F(column), output_field=model._meta.get_field(column),
+        )
+    if rule is _KEEP:
+        return Coalesce(F(column), Value(value), output_field=model._meta.get_field(column))
+    return value
+
+
+def _apply_per_row(model, keys: tuple, columns: tuple, rows, using: str) -> None:
+    """Backends without ON CONFLICT (target): create missing rows, then one UPDATE per key."""
+    objects = model.objects.using(using)
+    with transaction.atomic(using=using):
+        objects.bulk_create([model(**dict(zip(keys, row))) for row in rows], ignore_conflicts=True)
+        for row in rows:
+            key, values = dict(zip(keys, row)), row[len(keys):]
+            assignments = {
+                column: _orm_assignment(model, column, rule, value)
+                for (column, rule), value in zip(columns, values)
+            }
+            objects.filter(**key).update(**{c: a for c, a in assignments.items() if a is not None})
+
+
+# ============================================================================
+# Single rows (signal receivers in models.py)
+# ============================================================================
+_BOOKING_STATE = (
+    "playground_id", "time_slot_id", "date", "status", "is_paid", "series_id", "created_at",
+    "user_id", "guest_email", "guest_phone", "guest_name",
+)
+_PAYMENT_STATE = ("status", "paid_at", "amount_etb", "series_id")
+
+
+def state_of(instance) -> tuple | None:
+    """
+    What the row contributes to the rollups, read from __dict__ so deferred
+    fields are not fetched. None when a needed field was not loaded.
+    """
+    names = _BOOKING_STATE if isinstance(instance, Booking) else _PAYMENT_STATE
+    values = instance.__dict__
+    if any(name not in values for name in names):
+        return None
+    return tuple(values[name] for name in names)
+
+
+def _booking_deltas(deltas, state, sign: int) -> None:
+    field_id, ts_id, day, status, is_paid, series_id, created_at, user_id, email, phone, name = state
+    approved = status == BookingStatus.APPROVED
+    customer = customer_of(user_id, email, phone)
+    add_bookings(deltas, (day, field_id, ts_id, status), sign, sign * bool(is_paid))
+    add_customer(deltas, customer, bookings=sign, approved=sign * approved,
+                 day=day if sign > 0 else None, user_id=user_id, name=name)
+    if approved and is_paid and series_id is None and created_at:
+        # Paid admin booking: revenue at the field price, on the day it was made
+        price = Field.objects.filter(pk=field_id).values_list("price_per_session", flat=True).first() or 0
+        add_revenue(deltas, timezone.localdate(created_at), field_id, ts_id, sign * price, sign)
+        add_customer(deltas, customer, spend=sign * price)
+
+
+def _payment_deltas(deltas, state, sign: int) -> None:
+    status, paid_at, amount, series_id = state
+    if status != PaymentStatus.PAID or paid_at is None:
+        return
+    series = (
+        BookingSeries.objects.filter(pk=series_id)
+        .values_list("playground_id", "time_slot_id", "purchaser_id", "guest_email", "guest_phone").first()
+    )
+    if series:
+        field_id, ts_id, *who = series
+        add_payment(deltas, timezone.localdate(paid_at), field_id, ts_id, customer_of(*who), sign * amount, sign)
+
+
+def apply_change(model, old: tuple | None, new: tuple | None) -> None:
+    """Replace a row's old contribution (None: it did not exist) with its new one."""
+    if old == new:
+        return
+    add = _booking_deltas if model is Booking else _payment_deltas
+    deltas = new_deltas()
+    if old:
+        add(deltas, old, -1)
+    if new:
+        add(deltas, new, 1)
+    apply(deltas)
+
+
+# ============================================================================
+# Rebuild
+# ============================================================================
+def _day_bounds(start: date_cls, end: date_cls):
+    """Aware [start 00:00, end+1 00:00) in local time."""
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+
+
+def _chunk_deltas(start: date_cls, end: date_cls):
+    deltas = new_deltas()
+    for day, field_id, ts_id, status, is_paid, *_, n in _slot_counts(Booking.objects.filter(date__range=(start, end))):
+        add_bookings(deltas, (day, field_id, ts_id, status), n, n * is_paid)
+
+    lo, hi = _day_bounds(start, end)
+    payments = (
+        ChapaPayment.objects.filter(status=PaymentStatus.PAID, paid_at__gte=lo, paid_at__lt=hi)
+        .annotate(day=TruncDate("paid_at")).order_by()
+        .values_list("day", "series__playground_id", "series__time_slot_id")
+        .annotate(total=Sum("amount_etb"), n=Count("pk"))
+    )
+    walk_ins = (
+        Booking.objects.filter(
+            status=BookingStatus.APPROVED, is_paid=True, series__isnull=True, created_at__gte=lo, created_at__lt=hi,
+        )
+        .annotate(day=TruncDate("created_at")).order_by()
+        .values_list("day", "playground_id", "time_slot_id")
+        .annotate(total=Sum("playground__price_per_session"), n=Count("pk"))
+    )
+    for day, field_id, ts_id, total, n in list(payments) + list(walk_ins):
+        add_revenue(deltas, day, field_id, ts_id, total, n)
+    return deltas
+
+
+def rebuild(start: date_cls, end: date_cls, chunk_days: int = 31) -> int:
+    """
+    Recompute the rollup for [start, end] from the source tables, one
+    transaction per `chunk_days` so memory and lock time stay bounded.
+    Returns the number of rollup rows written.
+    """
+    written = 0
+    day = start
+    while day <= end:
+        stop = min(day + timedelta(days=chunk_days - 1), end)
+        with transaction.atomic():
+            deltas = _chunk_deltas(day, stop)
+            DailyBookingRollup.objects.filter(date__range=(day, stop)).delete()
+            rows = DailyBookingRollup.objects.bulk_create(
+                [
+                    DailyBookingRollup(
+                        date=d, playground_id=field_id, time_slot_id=ts_id, status=status,
+                        bookings=n, paid_bookings=paid, revenue_etb=amount, revenue_count=revenue_n,
+                    )
+                    for (d, field_id, ts_id, status), (n, paid, amount, revenue_n) in deltas.daily.items()
+                    if any((n, paid, amount, revenue_n))
+                ],
+                batch_size=500,
+            )
+            written += len(rows)
+        day = stop + timedelta(days=1)
+    return written
+
+
+def rebuild_customers() -> int:
+    """
+    Recompute CustomerRollup from all history in one transaction: a grouped
+    read per source, merged by customer in Python. Returns rows written.
+    """
+    who = ("user_id", "guest_email", "guest_phone")
+    deltas = new_deltas()
+    bookings = (
+        Booking.objects.order_by().values_list(*who)
+        .annotate(
+            n=Count("pk"), approved=Count("pk", filter=Q(status=BookingStatus.APPROVED)),
+            last=Max("date"), name=Max("guest_name"),
+        )
+    )
+    for user_id, email, phone, n, approved, last, name in bookings:
+        add_customer(deltas, customer_of(user_id, email, phone), n, approved, 0, last, user_id, name)
+
+    payments = (
+        ChapaPayment.objects.filter(status=PaymentStatus.PAID, paid_at__isnull=False).order_by()
+        .values_list("series__purchaser_id", "series__guest_email", "series__guest_phone")
+        .annotate(total=Sum("amount_etb"))
+    )
+    walk_ins = (
+        Booking.objects.filter(status=BookingStatus.APPROVED, is_paid=True, series__isnull=True).order_by()
+        .values_list(*who).annotate(total=Sum("playground__price_per_session"))
+    )
+    for user_id, email, phone, total in [*payments, *walk_ins]:
+        add_customer(deltas, customer_of(user_id, email, phone), spend=total)
+
+    with transaction.atomic():
+        CustomerRollup.objects.all().delete()
+        rows = CustomerRollup.objects.bulk_create(
+            [
+                CustomerRollup(
+                    customer=customer, user_id=user_id, guest_name=name or "",
+                    bookings=n, approved_bookings=approved, spend_etb=spend, last_booking=last,
+                )
+                for customer, (n, approved, spend, last, user_id, name) in deltas.customers.items()
+            ],
+            batch_size=500,
+        )
+    return len(rows)
+
+
+def history_span() -> tuple[date_cls, date_cls] | None:
+    """First and last day anything (bookings, revenue or stale rollup rows) falls on."""
+    days = []
+    bookings = Booking.objects.aggregate(
+        lo=Min("date"), hi=Max("date"), made_lo=Min("created_at"), made_hi=Max("created_at"),
+    )
+    paid = ChapaPayment.objects.filter(paid_at__isnull=False).aggregate(lo=Min("paid_at"), hi=Max("paid_at"))
+    rollup = DailyBookingRollup.objects.aggregate(lo=Min("date"), hi=Max("date"))
+    for value in [*bookings.values(), *paid.values(), *rollup.values()]:
+        if isinstance(value, datetime):
+            value = timezone.localdate(value)
+        if value is not None:
+            days.append(value)
+    return (min(days), max(days)) if days else None
@@ -148,28 +148,7 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         d: date_cls = data["date"]
         if d < timezone.localdate():
             raise serializers.ValidationError({"date": "Cannot book in the past."})
-
-        # Weekly open/close (OPEN BY DEFAULT, and allow global bypass)
-        dow = d.weekday()
-        if not getattr(settings, "ALWAYS_OPEN_SLOTS", False):
-            weekly_qs = FieldWeeklySlot.objects.filter(
-                playground=data["playground"],
-                day_of_week=dow,
-                time_slot=data["time_slot"],
-            )
-            # If there are weekly rows and none is open -> closed
-            if weekly_qs.exists() and not weekly_qs.filter(is_open=True).exists():
-                raise serializers.ValidationError("This field/weekday/timeslot is currently closed weekly.")
-
-        # Blackout check (still enforced)
-        blocked = FieldBlackout.objects.filter(
-            playground=data["playground"], date=d
-        ).filter(
-            models.Q(time_slot__isnull=True) | models.Q(time_slot=data["time_slot"])
-        ).exists()
-        if blocked:
-            raise serializers.ValidationError("This date/slot is blacked out.")
-
+        # Weekly rules, blackouts and conflicts are checked by BookingView.post against the grid
         return data
 
 
@@ -247,6 +226,19 @@ class BookingSeriesCreateSerializer(serializers.ModelSerializer):
         return BookingSeries.objects.create(**validated_data)
 
 
+class BookingSeriesQuoteSerializer(serializers.Serializer):
+    """Inputs for a read-only package quote (no rows are written)."""
+    playground = serializers.PrimaryKeyRelatedField(queryset=Field.objects.all())
+    time_slot = serializers.PrimaryKeyRelatedField(queryset=Timeslot.objects.all())
+    start_date = serializers.DateField()
+    months = serializers.ChoiceField(choices=[1, 3, 6])
+
+    def validate_start_date(self, value):
+        if value < timezone.localdate():
+            raise serializers.ValidationError("Start date cannot be in the past.")
+        return value
+
+
 # =========================
 # Payment
 # =========================
@@ -0,0 +1,7 @@
+# booking/signals.py
+from django.dispatch import Signal
+
+# Sent once per paid transaction after its holds were approved in bulk and
+# the transaction committed (row-level post_save is not fired for them).
+# kwargs: series, payment, approved (number of bookings approved)
+series_approved = Signal()
@@ -1,3 +1,1059 @@
-from django.test import TestCase
+import csv
+import json
+import time as time_mod
+from io import StringIO
+from datetime import date, time, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+import requests
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from field.models import Field
+from timeslot.models import Timeslot
+
+from . import availability_cache, chapa, idempotency, rollups
+from .approvals import approve_transaction
+from .availability import live_booking_q
+from .models import (
+    Booking,
+    BookingSeries,
+    BookingStatus,
+    ChapaPayment,
+    CustomerRollup,
+    DailyBookingRollup,
+    FieldBlackout,
+    FieldWeeklySlot,
+    IdempotencyRecord,
+    PaymentStatus,
+    SeriesStatus,
+)
+from .occupancy import OccupancyIndex, SlotBits, first_bit, intersection, iter_bits, union
+from .signals import series_approved
+
+
+def make_field(name="Pitch A", type="football", price="500.00"):
+    return Field.objects.create(name=name, type=type, price_per_session=Decimal(price))
+
+
+def make_timeslots(n, first_hour=6):
+    return [
+        Timeslot.objects.create(start_time=time(first_hour + i), end_time=time(first_hour + i + 1))
+        for i in range(n)
+    ]
+
+
+class AvailabilityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        availability_cache.clear()
+        self.field = make_field()
+
+
+@override_settings(ALWAYS_OPEN_SLOTS=False)
+class AvailabilityMapTests(AvailabilityTestCase):
+
+    def _query_count(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_independent_of_days_and_slots(self):
+        slots = make_timeslots(2)
+        url = f"/availability/available-map/?field_id={self.field.id}&year=2031&month=%d&only_future=0"
+        feb = self._query_count(url % 2)
+        make_timeslots(6, first_hour=12)
+        Booking.objects.create(playground=self.field, time_slot=slots[0], date=date(2031, 1, 5),
+                               status=BookingStatus.APPROVED)
+        jan = self._query_count(url % 1)
+        self.assertEqual(feb, jan)
+
+    def test_map_honours_rules_blackouts_and_bookings(self):
+        a, b = make_timeslots(2)
+        FieldWeeklySlot.objects.create(playground=self.field, day_of_week=date(2031, 1, 6).weekday(),
+                                       time_slot=a, is_open=False)
+        FieldBlackout.objects.create(playground=self.field, date=date(2031, 1, 7))
+        Booking.objects.create(playground=self.field, time_slot=b, date=date(2031, 1, 8),
+                               status=BookingStatus.APPROVED)
+
+        resp = self.client.get(f"/availability/available-map/?field_id={self.field.id}&year=2031&month=1")
+        available = resp.json()["available"]
+        self.assertEqual(available["2031-01-06"], ["07:00 - 08:00"])
+        self.assertNotIn("2031-01-07", available)
+        self.assertEqual(available["2031-01-08"], ["06:00 - 07:00"])
+        self.assertEqual(len(available["2031-01-09"]), 2)
+
+    def test_by_type_merges_every_active_field(self):
+        a, _ = make_timeslots(2)
+        second = make_field(name="Pitch B")
+        make_field(name="Court", type="tennis")
+        Booking.objects.create(playground=self.field, time_slot=a, date=date(2031, 1, 5),
+                               status=BookingStatus.APPROVED)
+
+        url = "/availability/by-type/?type=football&year=2031&month=%d&only_future=0"
+        one_month = self._query_count(url % 2)
+        make_field(name="Pitch C")
+        self.assertEqual(self._query_count(url % 1), one_month)
+
+        body = self.client.get(url % 1).json()
+        self.assertEqual(len(body["fields"]), 3)
+        self.assertIn("06:00 - 07:00", body["available"]["2031-01-05"])
+        self.assertNotIn(self.field.id, body["free_fields"]["2031-01-05"]["06:00 - 07:00"])
+        self.assertIn(second.id, body["free_fields"]["2031-01-05"]["06:00 - 07:00"])
+
+    def test_range_streams_days_with_batched_reads(self):
+        a, _ = make_timeslots(2)
+        second = make_field(name="Pitch B")
+        Booking.objects.create(playground=second, time_slot=a, date=date(2031, 3, 2),
+                               status=BookingStatus.APPROVED)
+        url = f"/availability/range/?start=2031-01-15&end=%s&field_id={self.field.id},{second.id}"
+
+        with CaptureQueriesContext(connection) as one_month:
+            resp = self.client.get(url % "2031-01-31")
+            b"".join(resp.streaming_content)
+        with CaptureQueriesContext(connection) as three_months:
+            resp = self.client.get(url % "2031-03-31")
+            body = json.loads(b"".join(resp.streaming_content))
+
+        # timeslots once, then a fixed number per month regardless of days
+        per_month = len(one_month.captured_queries) - 2
+        self.assertEqual(len(three_months.captured_queries), 2 + 3 * per_month)
+        self.assertEqual(len(body["days"]), 17 + 28 + 31)
+        march_2 = next(row for row in body["days"] if row["date"] == "2031-03-02")
+        self.assertEqual(march_2["available"][str(second.id)], ["07:00 - 08:00"])
+        self.assertEqual(len(march_2["available"][str(self.field.id)]), 2)
+
+    def test_range_as_ndjson_writes_one_day_per_line(self):
+        make_timeslots(2)
+        url = f"/availability/range/?start=2031-01-30&end=2031-02-02&field_id={self.field.id}&format=ndjson"
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([r["date"] for r in rows], ["2031-01-30", "2031-01-31", "2031-02-01", "2031-02-02"])
+        self.assertEqual(len(rows[0]["available"][str(self.field.id)]), 2)
+
+        bad = self.client.get(url.replace("end=2031-02-02", "end=2031-01-01"))
+        self.assertEqual(bad.status_code, 400)
+        self.assertTrue(bad["Content-Type"].startswith("application/json"))
+
+
+class OccupancyTests(SimpleTestCase):
+    def _slots(self, n):
+        return SlotBits([SimpleNamespace(id=100 + i) for i in range(n)])
+
+    def test_bit_helpers(self):
+        self.assertEqual(union(), 0)
+        self.assertEqual(union(0b0011, 0b0110, 0b1000), 0b1111)
+        self.assertEqual(intersection(), 0)
+        self.assertEqual(intersection(0b0111, 0b0110, 0b1110), 0b0110)
+        self.assertEqual((first_bit(0), first_bit(0b10100), first_bit(1 << 70)), (None, 2, 70))
+        self.assertEqual(list(iter_bits(0b101001)), [0, 3, 5])
+        self.assertEqual(list(iter_bits(1 << 70 | 1)), [0, 70])
+
+        slots = self._slots(3)
+        self.assertEqual(slots.full, 0b111)
+        self.assertEqual((slots.bit(101), slots.bit(None), slots.bit(999)), (0b010, 0b111, 0))
+        self.assertEqual([ts.id for ts in slots.timeslots_in(0b101)], [100, 102])
+
+    def test_layers_and_free_across_fields(self):
+        start = date(2031, 1, 1)  # a Wednesday
+        for n in (3, 70):  # one array word per day, and the wide int fallback
+            slots = self._slots(n)
+            occ = OccupancyIndex([1, 2], slots, start, start + timedelta(days=7))
+            occ.mark_all_days("closed", 1, [0b001, 0, 0, 0, 0, 0, 0])  # slot 0 closed on Mondays
+            occ.mark("taken", 1, start, slots.bit(101))
+            occ.mark("taken", 2, start, slots.bit(100) | slots.bit(101))
+            occ.mark("taken", 2, start - timedelta(days=1), slots.full)  # outside the window: ignored
+
+            self.assertEqual(occ.free(1, start), slots.full & ~0b010)
+            self.assertEqual(occ.free(1, date(2031, 1, 6)), slots.full & ~0b001)
+            self.assertEqual(occ.free(3, start), 0)
+            self.assertEqual(occ.free_any([1, 2], start), slots.full & ~0b010)
+            self.assertEqual(occ.free_any([], start), 0)
+            self.assertEqual(occ.free_all([1, 2], start), slots.full & ~0b011)
+            self.assertEqual(occ.free_all([1, 2], date(2031, 1, 6)), slots.full & ~0b001)
+            self.assertEqual(occ.free_all([1, 3], start), 0)
+            self.assertEqual(occ.first_free(1, start).id, 100)
+            self.assertEqual(occ.first_free(2, start).id, 102)
+            self.assertEqual(occ.first_free(1, date(2031, 1, 6)).id, 101)
+            occ.mark("closed", 2, date(2031, 1, 2), slots.full)
+            self.assertIsNone(occ.first_free(2, date(2031, 1, 2)))
+            self.assertIsNone(occ.first_free(3, start))
+            self.assertEqual(occ.nbytes(), 4 * 2 * 7 * 8)
+
+
+class AvailabilityCacheTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.slot = make_timeslots(1)[0]
+        self.url = f"/availability/available-map/?field_id={self.field.id}&year=2031&month=1"
+
+    def test_etag_round_trip_and_invalidation(self):
+        first = self.client.get(self.url)
+        etag = first["ETag"]
+        # Versions live in the database, not in this process's cache
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Booking.objects.create(playground=self.field, time_slot=self.slot, date=date(2031, 1, 5),
+                               status=BookingStatus.APPROVED)
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+        self.assertNotIn("2031-01-05", resp.json()["available"])
+
+    def test_expired_hold_invalidates_on_time(self):
+        hold = Booking.objects.create(playground=self.field, time_slot=self.slot, date=date(2031, 1, 5))
+        resp = self.client.get(self.url)
+        self.assertNotIn("2031-01-05", resp.json()["available"])
+
+        # Let the hold lapse without a write (queryset update skips the signals)
+        Booking.objects.filter(pk=hold.pk).update(hold_expires_at=timezone.now() - timedelta(seconds=1))
+        later = time_mod.time() + 3600
+        with mock.patch.object(availability_cache, "_clock", return_value=later):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("2031-01-05", resp.json()["available"])
+
+    def test_later_hold_in_a_day_view_keeps_the_earlier_expiry(self):
+        early = Booking.objects.create(playground=self.field, time_slot=self.slot, date=date(2031, 1, 5))
+        late = Booking.objects.create(playground=self.field, time_slot=self.slot, date=date(2031, 1, 20))
+        Booking.objects.filter(pk=late.pk).update(hold_expires_at=timezone.now() + timedelta(hours=2))
+        month = self.client.get(self.url)
+        self.client.get(f"/availability/?field_id={self.field.id}&date=2031-01-20")
+
+        Booking.objects.filter(pk=early.pk).update(hold_expires_at=timezone.now() - timedelta(seconds=1))
+        between = time_mod.time() + 3600
+        with mock.patch.object(availability_cache, "_clock", return_value=between):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=month["ETag"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("2031-01-05", resp.json()["available"])
+        self.assertNotIn("2031-01-20", resp.json()["available"])
+
+
+class SeriesQuoteTests(AvailabilityTestCase):
+    def test_quote_lists_skips_and_prices_without_writes(self):
+        slot = make_timeslots(1)[0]
+        start = timezone.localdate() + timedelta(days=7)
+        FieldBlackout.objects.create(playground=self.field, date=start + timedelta(days=7), time_slot=slot)
+        Booking.objects.create(playground=self.field, time_slot=slot, date=start + timedelta(days=14),
+                               status=BookingStatus.APPROVED)
+
+        url = f"/series/quote/?playground={self.field.id}&time_slot={slot.id}&start_date={start}&months=%d"
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url % 1)
+        with CaptureQueriesContext(connection) as six:
+            resp = self.client.get(url % 6)
+        self.assertEqual(len(one.captured_queries), len(six.captured_queries))
+
+        body = resp.json()
+        reasons = {row["date"]: row["reason"] for row in body["skipped"]}
+        self.assertEqual(reasons[str(start + timedelta(days=7))], "blacked_out")
+        self.assertEqual(reasons[str(start + timedelta(days=14))], "taken")
+        self.assertEqual(body["occurrences"], len(body["bookable"]))
+        self.assertEqual(Decimal(body["amount_etb"]), Decimal("500.00") * body["occurrences"])
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+@override_settings(CHAPA_STUB=True)
+class StartCheckoutSeriesTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        chapa.reset_client()
+        self.addCleanup(chapa.reset_client)
+        self.slot = make_timeslots(1)[0]
+        self.start = timezone.localdate() + timedelta(days=7)
+
+    def _checkout(self, months=1, query=""):
+        return self.client.post(f"/series/start-checkout/{query}", {
+            "playground": self.field.id, "time_slot": self.slot.id,
+            "start_date": str(self.start), "months": months, "guest_name": "Abebe Kebede",
+        })
+
+    def test_holds_are_bulk_inserted_and_race_losers_reported(self):
+        lost = self.start + timedelta(days=14)
+        # Another checkout takes the slot between planning and reserving
+        Booking.objects.create(playground=self.field, time_slot=self.slot, date=lost)
+        with mock.patch("booking.views.plan_occurrences",
+                        side_effect=lambda field, ts, dates, today: (dates, [])):
+            resp = self._checkout()
+        self.assertEqual(resp.status_code, 200, resp.content)
+        body = resp.json()
+        self.assertIn({"date": str(lost), "reason": "lost_race"}, body["skipped"])
+        held = Booking.objects.filter(series__isnull=False).count()
+        self.assertEqual(body["occurrences"], held)
+        self.assertEqual(Decimal(body["amount_etb"]), Decimal("500.00") * held)
+
+    def test_cancelled_bookings_and_lapsed_holds_release_their_slot(self):
+        cancelled_day = self.start + timedelta(days=7)
+        lapsed_day = self.start + timedelta(days=14)
+        Booking.objects.create(playground=self.field, time_slot=self.slot, date=cancelled_day,
+                               status=BookingStatus.CANCELLED)
+        lapsed = Booking.objects.create(playground=self.field, time_slot=self.slot, date=lapsed_day)
+        Booking.objects.filter(pk=lapsed.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+        resp = self._checkout()
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json()["skipped"], [])
+        held = set(Booking.objects.filter(series__isnull=False).values_list("date", flat=True))
+        self.assertTrue({cancelled_day, lapsed_day} <= held)
+        self.assertFalse(Booking.objects.filter(pk=lapsed.pk).exists())
+        self.assertEqual(Booking.objects.filter(status=BookingStatus.CANCELLED).count(), 1)
+
+    def test_async_checkout_returns_202_and_status_becomes_ready(self):
+        inline = mock.Mock(submit=lambda fn, *args: fn(*args))
+        with mock.patch("booking.views._chapa_executor", return_value=inline), \
+                mock.patch("booking.views.close_old_connections"):
+            resp = self._checkout(query="?async=1")
+        self.assertEqual(resp.status_code, 202, resp.content)
+        self.assertEqual(resp.json()["checkout_status"], "initialising")
+
+        polled = self.client.get(resp["Location"]).json()
+        self.assertEqual(polled["checkout_status"], "ready")
+        self.assertTrue(polled["checkout_url"].startswith("https://checkout.chapa.stub/"))
+
+    @staticmethod
+    def _writes(ctx, table):
+        return [q for q in ctx.captured_queries
+                if q["sql"].startswith((f'UPDATE "{table}"', f'INSERT INTO "{table}"'))]
+
+    def test_callback_approves_holds_in_bulk_with_one_event(self):
+        with CaptureQueriesContext(connection) as checkout:
+            tx_ref = self._checkout(months=3).json()["tx_ref"]
+        held = Booking.objects.filter(chapa_tx_ref=tx_ref).count()
+        self.assertGreater(held, 10)
+        self.assertEqual(len(self._writes(checkout, "booking_dailybookingrollup")), 1)
+        received = []
+        series_approved.connect(lambda **kw: received.append(kw["approved"]), weak=False,
+                                dispatch_uid="test-approved")
+        self.addCleanup(series_approved.disconnect, dispatch_uid="test-approved")
+
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post("/payments/chapa/callback/", {"tx_ref": tx_ref})
+        self.assertEqual(resp.json(), {"status": "paid", "approved_bookings": held})
+        self.assertEqual(received, [held])
+        self.assertEqual(len(self._writes(ctx, "booking_booking")), 1)
+        # Held days move pending -> approved and the payment adds revenue: one upsert
+        self.assertEqual(len(self._writes(ctx, "booking_dailybookingrollup")), 1)
+        self.assertEqual(
+            Booking.objects.filter(chapa_tx_ref=tx_ref, status=BookingStatus.APPROVED, is_paid=True).count(),
+            held,
+        )
+
+    def test_signed_webhook_skips_verify_round_trip(self):
+        resp = self._checkout()
+        tx_ref, amount = resp.json()["tx_ref"], resp.json()["amount_etb"]
+        body = json.dumps({"tx_ref": tx_ref, "status": "success", "amount": amount, "currency": "ETB"})
+        confirm = mock.Mock()
+
+        with mock.patch("booking.views.CHAPA_WEBHOOK_SECRET", "whsec"), \
+                mock.patch.object(chapa.ChapaClient, "verify", return_value={}) as verify:
+            self.client.post("/payments/chapa/callback/", body, content_type="application/json",
+                             HTTP_X_CHAPA_SIGNATURE="bad")
+        verify.assert_called_once_with(tx_ref)
+
+        with mock.patch("booking.views.CHAPA_WEBHOOK_SECRET", "whsec"), \
+                mock.patch("booking.views._chapa_executor", return_value=confirm), \
+                mock.patch.object(chapa.ChapaClient, "verify") as verify, \
+                self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post("/payments/chapa/callback/", body, content_type="application/json",
+                                    HTTP_X_CHAPA_SIGNATURE=chapa.sign_webhook(body.encode(), "whsec"))
+        self.assertEqual(resp.json()["verification"], "pending")
+        verify.assert_not_called()
+        confirm.submit.assert_called_once()
+
+
+class IdempotencyTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        chapa.reset_client()
+        self.addCleanup(chapa.reset_client)
+        self.slot = make_timeslots(1)[0]
+        self.body = {"playground": self.field.id, "time_slot": self.slot.id,
+                     "start_date": str(timezone.localdate() + timedelta(days=7)), "months": 1}
+
+    @override_settings(CHAPA_STUB=True)
+    def test_checkout_replay_returns_stored_response_in_one_query(self):
+        first = self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="k-1")
+        self.assertEqual(first.status_code, 200, first.content)
+        cache.clear()  # stored in the database, not in this process's cache
+
+        with self.assertNumQueries(1), \
+                mock.patch.object(chapa.ChapaClient, "initialize") as initialize:
+            replay = self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="k-1")
+        initialize.assert_not_called()
+        self.assertEqual(replay.content, first.content)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(BookingSeries.objects.count(), 1)
+
+        other = {**self.body, "months": 3}
+        resp = self.client.post("/series/start-checkout/", other, HTTP_IDEMPOTENCY_KEY="k-1")
+        self.assertEqual(resp.status_code, 422)
+
+    @override_settings(CHAPA_STUB=True)
+    def test_in_progress_keys_conflict_and_expired_ones_are_reused(self):
+        claim = dict(key=idempotency._entry_key("start-checkout", "anon", "k-2"), fingerprint=None,
+                     expires_at=timezone.now() + timedelta(seconds=30))
+        record = IdempotencyRecord.objects.create(**claim)
+        busy = self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="k-2")
+        self.assertEqual(busy.status_code, 409)
+        self.assertEqual(busy["Retry-After"], "1")
+
+        # The claiming request died; once its claim lapses the key runs again
+        IdempotencyRecord.objects.filter(pk=record.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        resp = self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="k-2")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        stored = IdempotencyRecord.objects.get()
+        self.assertEqual(stored.status, 200)
+        self.assertGreater(stored.expires_at, timezone.now() + timedelta(hours=23))
+
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command("sweep_expired_holds", stdout=out)
+        self.assertIn("1 idempotency keys", out.getvalue())
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    @override_settings(CHAPA_STUB=True)
+    def test_keys_are_scoped_to_the_jwt_user(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from users.models import Profile
+
+        def post(user):
+            return self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="order-1",
+                                    HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+        alice = Profile.objects.create(username="alice", email="alice@example.com")
+        bob = Profile.objects.create(username="bob", email="bob@example.com")
+        first = post(alice)
+        self.assertEqual(first.status_code, 200, first.content)
+        self.body["start_date"] = str(timezone.localdate() + timedelta(days=8))
+        other = post(bob)
+        self.assertEqual(other.status_code, 200, other.content)
+        self.assertFalse(other.has_header("Idempotent-Replayed"))
+        self.assertNotEqual(other.json()["tx_ref"], first.json()["tx_ref"])
+        self.assertEqual(BookingSeries.objects.count(), 2)
+
+        resp = self.client.post("/series/start-checkout/", self.body, HTTP_IDEMPOTENCY_KEY="order-1",
+                                HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(resp.status_code, 401)
+
+    @override_settings(CHAPA_STUB=True)
+    def test_callback_replays_only_settled_outcomes(self):
+        tx_ref = self.client.post("/series/start-checkout/", self.body).json()["tx_ref"]
+
+        with mock.patch.object(chapa.ChapaClient, "verify", return_value={}) as verify:
+            self.client.post("/payments/chapa/callback/", {"tx_ref": tx_ref})
+            self.client.post("/payments/chapa/callback/", {"tx_ref": tx_ref})
+        self.assertEqual(verify.call_count, 2)
+
+        paid = self.client.post("/payments/chapa/callback/", {"tx_ref": tx_ref})
+        self.assertEqual(paid.json()["status"], "paid")
+        with mock.patch.object(chapa.ChapaClient, "verify") as verify:
+            replay = self.client.post("/payments/chapa/callback/", {"tx_ref": tx_ref})
+        verify.assert_not_called()
+        self.assertEqual(replay.content, paid.content)
+
+
+class ChapaClientTests(TestCase):
+    def _client(self, adapter, **kwargs):
+        return chapa.ChapaClient("sk_test", adapter=adapter, sleep=lambda _: None, **kwargs)
+
+    def test_stub_round_trip(self):
+        client = self._client(chapa.StubChapaAdapter())
+        data = client.initialize({"tx_ref": "TX-1", "amount": "500.00", "currency": "ETB"})
+        self.assertEqual(data["data"]["checkout_url"], "https://checkout.chapa.stub/TX-1")
+        self.assertTrue(client.is_success(client.verify("TX-1")))
+        self.assertFalse(client.is_success(client.verify("TX-unknown")))
+
+    def test_retries_then_breaker_fails_fast(self):
+        stub = chapa.StubChapaAdapter(failure_rate=1.0)
+        breaker = chapa.CircuitBreaker(threshold=2, reset_after=60)
+        client = self._client(stub, max_retries=2, breaker=breaker)
+
+        for _ in range(2):
+            client.verify("TX-1")
+        self.assertEqual(stub.calls, 6)
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(chapa.ChapaUnavailable):
+            client.verify("TX-1")
+        self.assertEqual(stub.calls, 6)
+
+    def test_any_transport_error_settles_a_half_open_trial(self):
+        now = [0.0]
+        breaker = chapa.CircuitBreaker(threshold=1, reset_after=30, clock=lambda: now[0])
+        stub = chapa.StubChapaAdapter()
+        client = self._client(stub, breaker=breaker)
+        breaker.record_failure()
+        now[0] = 31
+        self.assertEqual(breaker.state, "half-open")
+
+        for error in (requests.exceptions.ChunkedEncodingError("cut off"), requests.TooManyRedirects("loop")):
+            with mock.patch.object(stub, "send", side_effect=error):
+                with self.assertRaises(chapa.ChapaUnavailable):
+                    client.verify("TX-1")
+            self.assertEqual(breaker.state, "open")
+            now[0] += 31
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            now[0] += 31
+
+        with mock.patch.object(stub, "send", side_effect=RuntimeError("adapter bug")):
+            with self.assertRaises(RuntimeError):
+                client.verify("TX-1")
+        self.assertEqual(breaker.state, "open")
+        now[0] += 31
+        client.verify("TX-1")
+        self.assertEqual(breaker.state, "closed")
+
+
+class HoldExpiryTests(AvailabilityTestCase):
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN output checked is SQLite's")
+    def test_pending_hold_is_stamped_and_probe_uses_an_index(self):
+        slot = make_timeslots(1)[0]
+        day = timezone.localdate() + timedelta(days=1)
+        before = timezone.now()
+        hold = Booking.objects.create(playground=self.field, time_slot=slot, date=day)
+        self.assertGreater(hold.hold_expires_at, before)
+
+        plan = Booking.objects.filter(
+            live_booking_q(), playground=self.field, date=day, time_slot=slot
+        ).explain()
+        self.assertIn("USING INDEX", plan.upper().replace("COVERING INDEX", "INDEX"))
+        self.assertNotIn("SCAN", plan.upper())
+
+
+class SweepExpiredHoldsTests(AvailabilityTestCase):
+    def test_sweep_frees_expired_holds_and_abandons_checkout(self):
+        slot = make_timeslots(1)[0]
+        day = timezone.localdate() + timedelta(days=3)
+        series = BookingSeries.objects.create(playground=self.field, time_slot=slot, weekday=day.weekday(),
+                                              months=1, start_date=day, status=SeriesStatus.PENDING,
+                                              chapa_tx_ref="TX-OLD")
+        ChapaPayment.objects.create(series=series, tx_ref="TX-OLD", amount_etb=Decimal("500.00"))
+        Booking.objects.create(series=series, playground=self.field, time_slot=slot, date=day)
+        fresh = Booking.objects.create(playground=self.field, time_slot=slot, date=day + timedelta(days=1))
+        long_ago = timezone.now() - timedelta(hours=1)
+        Booking.objects.exclude(pk=fresh.pk).update(hold_expires_at=long_ago)
+        BookingSeries.objects.update(created_at=long_ago)
+        ChapaPayment.objects.update(created_at=long_ago)
+
+        before = timezone.now()
+        call_command("sweep_expired_holds", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(Booking.objects.values_list("pk", flat=True)), [fresh.pk])
+        series, payment = BookingSeries.objects.get(), ChapaPayment.objects.get()
+        self.assertEqual(series.status, SeriesStatus.ABANDONED)
+        self.assertEqual(payment.status, PaymentStatus.ABANDONED)
+        self.assertGreaterEqual(series.updated_at, before)
+        self.assertGreaterEqual(payment.updated_at, before)
+        # The deleted hold no longer counts as pending in the rollup
+        self.assertEqual(DailyBookingRollup.objects.get(date=day, status=BookingStatus.PENDING).bookings, 0)
+
+
+class ReconcilePaymentsTests(AvailabilityTestCase):
+    def _stale_checkouts(self, n):
+        slot = make_timeslots(1)[0]
+        day = timezone.localdate() + timedelta(days=3)
+        for i in range(n):
+            tx_ref = f"TX-{i}"
+            series = BookingSeries.objects.create(
+                playground=self.field, time_slot=slot, weekday=day.weekday(), months=1,
+                start_date=day, status=SeriesStatus.PENDING, chapa_tx_ref=tx_ref,
+            )
+            ChapaPayment.objects.create(series=series, tx_ref=tx_ref, amount_etb=Decimal("500.00"))
+            Booking.objects.create(series=series, playground=self.field, time_slot=slot,
+                                   date=day + timedelta(days=i), chapa_tx_ref=tx_ref)
+        ChapaPayment.objects.update(created_at=timezone.now() - timedelta(minutes=30))
+
+    def test_paid_transactions_are_approved_in_batches(self):
+        self._stale_checkouts(5)
+        out = StringIO()
+        call_command("reconcile_payments", stub=True, stub_status="success", workers=3, batch_size=2, stdout=out)
+
+        self.assertIn("Checked 5 payments: 5 paid (5 bookings approved)", out.getvalue())
+        self.assertFalse(ChapaPayment.objects.exclude(status=PaymentStatus.PAID).exists())
+        self.assertFalse(BookingSeries.objects.exclude(status=SeriesStatus.APPROVED).exists())
+        self.assertEqual(Booking.objects.filter(status=BookingStatus.APPROVED, is_paid=True).count(), 5)
+
+    def test_failed_transactions_are_closed(self):
+        self._stale_checkouts(2)
+        call_command("reconcile_payments", stub=True, stub_status="failed", stdout=StringIO())
+        self.assertEqual(ChapaPayment.objects.filter(status=PaymentStatus.FAILED).count(), 2)
+        self.assertFalse(Booking.objects.filter(status=BookingStatus.APPROVED).exists())
+
+    def test_stub_needs_a_status_and_broken_responses_do_not_stop_the_run(self):
+        import requests
+
+        self._stale_checkouts(3)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_payments", stub=True, stdout=StringIO())
+        self.assertFalse(ChapaPayment.objects.filter(status=PaymentStatus.PAID).exists())
+
+        verify = chapa.ChapaClient.verify
+
+        def flaky(client, tx_ref):
+            if tx_ref == "TX-1":
+                raise requests.exceptions.ChunkedEncodingError("truncated")
+            return verify(client, tx_ref)
+
+        out = StringIO()
+        with mock.patch.object(chapa.ChapaClient, "verify", flaky):
+            call_command("reconcile_payments", stub=True, stub_status="success", stdout=out)
+        self.assertIn("2 paid", out.getvalue())
+        self.assertIn("1 errors", out.getvalue())
+
+
+class BookingsStatsTests(AvailabilityTestCase):
+    def test_range_is_one_query_and_zero_filled(self):
+        slot = make_timeslots(1)[0]
+        other = make_field("Pitch B")
+        Booking.objects.create(playground=self.field, time_slot=slot, date=date(2031, 3, 2),
+                               status=BookingStatus.APPROVED)
+        Booking.objects.create(playground=other, time_slot=slot, date=date(2031, 3, 2),
+                               status=BookingStatus.APPROVED)
+        Booking.objects.create(playground=self.field, time_slot=slot, date=date(2031, 5, 30))
+
+        with self.assertNumQueries(1):
+            body = self.client.get("/bookings/stats/?start=2031-03-01&end=2031-05-30").json()
+        self.assertEqual(len(body["values"]), 91)
+        self.assertEqual(body["values"][1], 2)
+        self.assertEqual(body["values"][-1], 1)
+        self.assertEqual(body["total"], 3)
+
+        body = self.client.get(
+            f"/bookings/stats/?start=2031-03-01&end=2031-03-07&field_id={self.field.id}&status=approved"
+        ).json()
+        self.assertEqual(body["values"], [0, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(body["labels"][0], "Sat")
+        self.assertEqual(self.client.get("/bookings/stats/?status=nope").status_code, 400)
+
+
+@override_settings(ALWAYS_OPEN_SLOTS=False)
+class HeatmapTests(AvailabilityTestCase):
+    def test_utilisation_against_open_capacity(self):
+        early, late = make_timeslots(2)
+        # Four full weeks, Monday 2031-03-03 .. Sunday 2031-03-30
+        FieldWeeklySlot.objects.create(playground=self.field, day_of_week=0, time_slot=late, is_open=False)
+        FieldBlackout.objects.create(playground=self.field, date=date(2031, 3, 4))
+        for d, ts in [(date(2031, 3, 3), early), (date(2031, 3, 10), early), (date(2031, 3, 11), late),
+                      (date(2031, 4, 7), early)]:
+            Booking.objects.create(playground=self.field, time_slot=ts, date=d, status=BookingStatus.APPROVED)
+        Booking.objects.create(playground=self.field, time_slot=early, date=date(2031, 3, 17))
+
+        with self.assertNumQueries(5):
+            body = self.client.get("/bookings/heatmap/?start=2031-03-03&end=2031-03-30").json()
+        self.assertEqual(body["weekdays"][0], "Monday")
+        heat = body["fields"][0]
+        self.assertEqual(heat["capacity"][0], [4, 0])
+        self.assertEqual(heat["capacity"][1], [3, 3])
+        self.assertEqual(heat["booked"][0], [2, 0])
+        self.assertEqual(heat["utilisation"][0], [0.5, None])
+        self.assertEqual(heat["utilisation"][1], [0.0, 0.3333])
+        self.assertEqual(heat["overall"], 0.06)  # 3 of 56 - 4 closed - 2 blacked out
+
+    def test_inactive_fields_only_when_asked_for(self):
+        make_timeslots(1)
+        closed = make_field("Old pitch")
+        Field.objects.filter(pk=closed.pk).update(is_active=False)
+        url = "/bookings/heatmap/?start=2031-03-03&end=2031-03-09"
+
+        self.assertEqual([f["field_id"] for f in self.client.get(url).json()["fields"]], [self.field.id])
+        only = self.client.get(f"{url}&field_id={closed.id}").json()["fields"]
+        self.assertEqual([f["field_id"] for f in only], [closed.id])
+
+
+class RevenueTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        self.slot = make_timeslots(1)[0]
+        self.tennis = make_field("Court 1", type="tennis", price="300.00")
+        paid_at = timezone.make_aware(timezone.datetime(2031, 3, 10, 12))
+        for i, (field, amount) in enumerate([(self.field, "1500.00"), (self.tennis, "900.00")]):
+            series = BookingSeries.objects.create(
+                playground=field, time_slot=self.slot, weekday=0, months=1,
+                start_date=date(2031, 3, 3), chapa_tx_ref=f"TX-{i}",
+            )
+            ChapaPayment.objects.create(series=series, tx_ref=f"TX-{i}", amount_etb=Decimal(amount),
+                                        status=PaymentStatus.PAID, paid_at=paid_at)
+        unpaid = BookingSeries.objects.create(playground=self.field, time_slot=self.slot, weekday=0,
+                                              months=1, start_date=date(2031, 3, 3), chapa_tx_ref="TX-X")
+        ChapaPayment.objects.create(series=unpaid, tx_ref="TX-X", amount_etb=Decimal("999.00"))
+        # Admin booking: paid at the field price, no payment row
+        walk_in = Booking.objects.create(playground=self.field, time_slot=self.slot, date=date(2031, 4, 1),
+                                         status=BookingStatus.APPROVED, is_paid=True)
+        Booking.objects.filter(pk=walk_in.pk).update(
+            created_at=timezone.make_aware(timezone.datetime(2031, 4, 1, 9))
+        )
+        # The raw update bypassed the rollup receivers
+        call_command("rebuild_rollups", stdout=StringIO())
+
+    def test_breakdown_groups_in_sql(self):
+        with self.assertNumQueries(1):
+            body = self.client.get(
+                "/revenue/breakdown/?start=2031-01-01&end=2031-12-31&group_by=month,type"
+            ).json()
+        self.assertEqual(body["total_etb"], "2900.00")
+        self.assertEqual(
+            [(r["month"], r["type"], r["total_etb"]) for r in body["rows"]],
+            [("2031-03", "football", "1500.00"), ("2031-03", "tennis", "900.00"),
+             ("2031-04", "football", "500.00")],
+        )
+        self.assertEqual(self.client.get("/revenue/breakdown/?group_by=weekday").status_code, 400)
+
+    def test_legacy_endpoints_use_payments(self):
+        self.assertEqual(self.client.get("/revenue/?month=2031-03").json(), {"total_etb": "2400.00"})
+        per_field = {r["playground_id"]: r["total_revenue"]
+                     for r in self.client.get("/revenue/per_playground/").json()}
+        self.assertEqual(per_field, {self.field.id: 2000, self.tennis.id: 900})
+
+        # Inactive fields are listed only where they took money
+        Field.objects.filter(pk=self.tennis.pk).update(is_active=False)
+        idle = make_field("Old pitch")
+        Field.objects.filter(pk=idle.pk).update(is_active=False)
+        per_field = {r["playground_id"]: r["total_revenue"]
+                     for r in self.client.get("/revenue/per_playground/").json()}
+        self.assertEqual(per_field, {self.field.id: 2000, self.tennis.id: 900})
+        april = self.client.get("/revenue/per_playground/?start=2031-04-01&end=2031-04-30").json()
+        self.assertEqual([r["playground_id"] for r in april], [self.field.id])
+
+
+class DailyRollupTests(AvailabilityTestCase):
+    def _rollup(self):
+        return sorted(
+            DailyBookingRollup.objects.exclude(bookings=0, paid_bookings=0, revenue_count=0)
+            .values_list("date", "playground_id", "time_slot_id", "status",
+                         "bookings", "paid_bookings", "revenue_etb", "revenue_count")
+        )
+
+    @override_settings(CHAPA_STUB=True)
+    def test_incremental_updates_match_a_rebuild(self):
+        chapa.reset_client()
+        self.addCleanup(chapa.reset_client)
+        slot = make_timeslots(1)[0]
+        start = timezone.localdate() + timedelta(days=7)
+        resp = self.client.post("/series/start-checkout/", {
+            "playground": self.field.id, "time_slot": slot.id, "start_date": str(start),
+            "months": 1, "guest_name": "Abebe Kebede",
+        })
+        self.assertEqual(resp.status_code, 200, resp.content)
+        approve_transaction(resp.json()["tx_ref"], {"status": "success"})
+
+        walk_in = Booking.objects.create(playground=self.field, time_slot=slot, date=start - timedelta(days=1),
+                                         status=BookingStatus.APPROVED)
+        cancelled = Booking.objects.create(playground=self.field, time_slot=slot, date=start - timedelta(days=2),
+                                           status=BookingStatus.APPROVED)
+        cancelled.status = BookingStatus.CANCELLED
+        cancelled.save()
+        Booking.objects.create(playground=self.field, time_slot=slot, date=start - timedelta(days=3)).delete()
+        Booking.objects.filter(pk=Booking.objects.create(
+            playground=self.field, time_slot=slot, date=start - timedelta(days=4)).pk
+        ).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        call_command("sweep_expired_holds", stdout=StringIO())
+
+        incremental = self._rollup()
+        call_command("rebuild_rollups", chunk_days=3, stdout=StringIO())
+        self.assertEqual(incremental, self._rollup())
+
+        # The series payment plus the walk-in at the field price
+        expected = ChapaPayment.objects.get().amount_etb + Decimal("500.00")
+        today = timezone.localdate()
+        approved = DailyBookingRollup.objects.get(date=today, status=BookingStatus.APPROVED)
+        self.assertEqual((approved.revenue_etb, approved.revenue_count), (expected, 2))
+        self.assertEqual(self.client.get(f"/revenue/?month={today:%Y-%m}").json(), {"total_etb": str(expected)})
+        self.assertTrue(Booking.objects.filter(pk=walk_in.pk, is_paid=True).exists())
+
+
+class DashboardTests(AvailabilityTestCase):
+    def test_widgets_match_their_endpoints_in_a_few_queries(self):
+        slot = make_timeslots(1)[0]
+        today = timezone.localdate()
+        for i in range(3):
+            Booking.objects.create(playground=self.field, time_slot=slot, date=today - timedelta(days=i),
+                                   status=BookingStatus.APPROVED, guest_name=f"Guest {i}")
+        make_field("Pitch B")
+
+        with self.assertNumQueries(4):
+            body = self.client.get("/dashboard/").json()
+        self.assertFalse(body["cached"])
+        widgets = body["widgets"]
+        self.assertEqual(widgets["bookings_stats"], self.client.get("/bookings/stats/").json())
+        self.assertEqual(widgets["activities"], self.client.get("/activities/").json())
+        self.assertEqual(widgets["revenue_per_playground"], self.client.get("/revenue/per_playground/").json())
+        self.assertEqual(widgets["revenue"], {"total_etb": "1500.00"})
+        self.assertEqual(widgets["bookings_per_month"]["bookings"],
+                         self.client.get("/bookings/per_month/").json()["bookings"])
+
+        with self.assertNumQueries(0):
+            again = self.client.get("/dashboard/").json()
+        self.assertTrue(again["cached"])
+        with self.assertNumQueries(1):
+            only = self.client.get("/dashboard/?widgets=revenue,bookings_per_month").json()
+        self.assertEqual(set(only["widgets"]), {"revenue", "bookings_per_month"})
+        self.assertEqual(self.client.get("/dashboard/?widgets=weather").status_code, 400)
+
+    def test_start_alone_runs_through_today(self):
+        slot = make_timeslots(1)[0]
+        today = timezone.localdate()
+        start = today - timedelta(days=20)
+        Booking.objects.create(playground=self.field, time_slot=slot, date=today,
+                               status=BookingStatus.APPROVED, is_paid=True)
+
+        stats = self.client.get(f"/bookings/stats/?start={start}").json()
+        self.assertEqual((stats["dates"][0], stats["dates"][-1]), (str(start), str(today)))
+        self.assertEqual(stats["total"], 1)
+        dashboard = self.client.get(f"/dashboard/?widgets=bookings_stats&start={start}").json()
+        self.assertEqual(dashboard["widgets"]["bookings_stats"], stats)
+        per_field = self.client.get(f"/revenue/per_playground/?start={start}").json()
+        self.assertEqual(per_field[0]["total_revenue"], 500)
+
+        for url in ("/bookings/stats/?start=%s", "/dashboard/?start=%s", "/revenue/per_playground/?start=%s"):
+            self.assertEqual(self.client.get(url % (today + timedelta(days=1))).status_code, 400)
+            self.assertEqual(self.client.get(url % (today - timedelta(days=400))).status_code, 400)
+            self.assertEqual(self.client.get(url % "2031/01/01").status_code, 400)
+
+
+class CustomerLeaderboardTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        from users.models import Profile
+
+        self.api = APIClient()
+        self.api.force_authenticate(Profile.objects.create(username="admin", is_staff=True))
+        self.slot = make_timeslots(1)[0]
+        self.abebe = Profile.objects.create(username="abebe", first_name="Abebe", last_name="Kebede")
+        day = iter(date(2031, 3, 1) + timedelta(days=i) for i in range(100))
+
+        def book(n, paid=0, **who):
+            for i in range(n):
+                # Approving marks a booking paid, so unpaid ones stay pending
+                status = BookingStatus.APPROVED if i < paid else BookingStatus.PENDING
+                Booking.objects.create(playground=self.field, time_slot=self.slot, date=next(day),
+                                       status=status, **who)
+
+        book(3, paid=3, user=self.abebe)
+        # Same guest, spelled three ways, grouped by email
+        book(1, paid=1, guest_name="Sara", guest_email="Sara@Example.com ")
+        book(1, guest_name="Sara", guest_email="sara@example.com")
+        book(2, guest_name="Sara", guest_email="SARA@example.com")
+        # Phone-only guest: local and international forms of one number
+        book(1, guest_name="Dawit", guest_phone="0911 22-33-44")
+        book(1, paid=1, guest_name="Dawit", guest_phone="+251911223344")
+        book(1, guest_name="Nobody")  # no user, email or phone: not a customer
+
+        self.abebe_id = rollups.customer_of(self.abebe.id, None, None)
+        self.sara_id = rollups.customer_of(None, "sara@example.com", None)
+        self.dawit_id = rollups.customer_of(None, None, "0911223344")
+
+    def test_groups_normalised_guests_and_pages_by_cursor(self):
+        with self.assertNumQueries(2):
+            body = self.api.get("/bookings/per_user/?limit=2").json()
+        self.assertEqual(
+            [(r["customer"], r["name"], r["total_bookings"]) for r in body["results"]],
+            [(self.sara_id, "Sara", 4), (self.abebe_id, "Abebe Kebede", 3)],
+        )
+        self.assertNotIn("sara", body["results"][0]["customer"])
+        self.assertEqual(body["results"][1]["spend_etb"], "1500.00")
+
+        last = self.api.get(f"/bookings/per_user/?limit=2&cursor={body['next']}").json()
+        self.assertEqual([r["customer"] for r in last["results"]], [self.dawit_id])
+        self.assertEqual(last["results"][0]["spend_etb"], "500.00")
+        self.assertIsNone(last["next"])
+        self.assertIn(self.client.get("/bookings/per_user/").status_code, (401, 403))
+
+    def test_spend_counts_paid_amounts_and_matches_a_rebuild(self):
+        series = BookingSeries.objects.create(
+            playground=self.field, time_slot=self.slot, weekday=0, months=1, start_date=date(2031, 6, 2),
+            guest_name="Sara", guest_email="sara@EXAMPLE.com", amount_etb=Decimal("1234.00"), chapa_tx_ref="tx-s",
+        )
+        ChapaPayment.objects.create(series=series, tx_ref="tx-s", amount_etb=Decimal("1234.00"),
+                                    status=PaymentStatus.PAID, paid_at=timezone.now())
+
+        body = self.api.get("/bookings/per_user/?sort=spend").json()
+        self.assertEqual([r["spend_etb"] for r in body["results"]], ["1734.00", "1500.00", "500.00"])
+        self.assertEqual(body["results"][0]["customer"], self.sara_id)
+
+        def snapshot():
+            return sorted(CustomerRollup.objects.values_list(
+                "customer", "user_id", "bookings", "approved_bookings", "spend_etb", "last_booking"))
+
+        incremental = snapshot()
+        rollups.rebuild_customers()
+        self.assertEqual(snapshot(), incremental)
+        self.assertEqual(self.api.get("/bookings/per_user/?sort=name").status_code, 400)
+        self.assertEqual(self.api.get("/bookings/per_user/?cursor=nope").status_code, 400)
+
+
+class ExportTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        from users.models import Profile
+
+        self.api = APIClient()
+        self.api.force_authenticate(Profile.objects.create(username="admin", is_staff=True))
+        slot = make_timeslots(1)[0]
+        for i in range(5):
+            Booking.objects.create(playground=self.field, time_slot=slot, date=date(2031, 3, 1 + i),
+                                   status=BookingStatus.APPROVED, guest_name=f"Guest {i}")
+        series = BookingSeries.objects.create(playground=self.field, time_slot=slot, weekday=0, months=1,
+                                              start_date=date(2031, 3, 3), chapa_tx_ref="TX-1")
+        ChapaPayment.objects.create(series=series, tx_ref="TX-1", amount_etb=Decimal("500.00"))
+
+    def test_csv_streams_in_one_query(self):
+        with self.assertNumQueries(1):
+            resp = self.api.get("/exports/bookings/?start=2031-03-02&end=2031-03-04")
+            self.assertTrue(resp.streaming)
+            lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(resp["Content-Type"], "text/csv")
+        self.assertEqual(lines[0].split(",")[:4], ["id", "date", "field_id", "field_name"])
+        self.assertEqual([line.split(",")[1] for line in lines[1:]], ["2031-03-02", "2031-03-03", "2031-03-04"])
+
+    def test_ndjson_command_and_validation(self):
+        resp = self.api.get("/exports/payments/?format=ndjson")
+        rows = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        self.assertEqual([(r["tx_ref"], r["amount_etb"], r["field_name"]) for r in rows],
+                         [("TX-1", "500.00", "Pitch A")])
+
+        out = StringIO()
+        call_command("export_data", "bookings", "--format", "ndjson", "--status", "approved", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+        self.assertEqual(self.client.get("/exports/bookings/").status_code, 401)
+        from rest_framework.test import APIClient
+        from users.models import Profile
+
+        member = APIClient()
+        member.force_authenticate(Profile.objects.create(username="member"))
+        denied = member.get("/exports/bookings/")
+        self.assertEqual(denied.status_code, 403)
+        self.assertTrue(denied["Content-Type"].startswith("application/json"))
+        bad = self.api.get("/exports/bookings/?status=nope")
+        self.assertEqual(bad.status_code, 400)
+        self.assertTrue(bad["Content-Type"].startswith("application/json"))
+        self.assertIn("status", bad.json()["error"])
+        self.assertEqual(self.api.get("/exports/users/").status_code, 400)
+
+    def test_csv_neutralises_formulas(self):
+        Booking.objects.filter(guest_name="Guest 0").update(guest_name='=HYPERLINK("http://x","y")',
+                                                            guest_phone="+cmd|' /C calc'!A0")
+        Booking.objects.filter(guest_name="Guest 1").update(guest_name="-2+3", guest_phone="+251 (911) 223-344")
+        resp = self.api.get("/exports/bookings/?end=2031-03-02")
+        rows = list(csv.DictReader(StringIO(b"".join(resp.streaming_content).decode())))
+        self.assertEqual([r["guest_name"] for r in rows], ['\'=HYPERLINK("http://x","y")', "'-2+3"])
+        # Phone numbers stay as typed; anything else starting with + is neutralised
+        self.assertEqual([r["guest_phone"] for r in rows], ["'+cmd|' /C calc'!A0", "+251 (911) 223-344"])
+
+        ndjson = self.api.get("/exports/bookings/?end=2031-03-01&format=ndjson")
+        self.assertEqual(json.loads(b"".join(ndjson.streaming_content))["guest_name"], '=HYPERLINK("http://x","y")')
+
+
+class BookingListTests(AvailabilityTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        from users.models import Profile
+
+        self.api = APIClient()
+        self.api.force_authenticate(Profile.objects.create(username="admin", is_staff=True))
+        slot = make_timeslots(1)[0]
+        other = make_field("Pitch B")
+        self.ids = [
+            Booking.objects.create(playground=self.field if i % 2 else other, time_slot=slot,
+                                   date=date(2031, 3, 1 + i), guest_name=f"Guest {i}",
+                                   status=BookingStatus.APPROVED if i < 4 else BookingStatus.PENDING).id
+            for i in range(7)
+        ]
+        # Ties on created_at are broken by id
+        Booking.objects.filter(id__in=self.ids[2:5]).update(created_at=timezone.now())
+
+    def test_pages_follow_the_cursor_in_one_query_each(self):
+        seen, url = [], "/booking/?limit=3"
+        while url:
+            with self.assertNumQueries(1):
+                body = self.api.get(url).json()
+            seen += [b["id"] for b in body["results"]]
+            self.assertTrue(all(b["price_etb"] and b["playground"]["name"] for b in body["results"]))
+            url = f"/booking/?limit=3&cursor={body['next']}" if body["next"] else None
+        expected = list(Booking.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_bad_input(self):
+        def ids(query):
+            return sorted(b["id"] for b in self.api.get(f"/booking/?{query}").json()["results"])
+
+        self.assertEqual(ids(f"field_id={self.field.id}&status=approved"), [self.ids[1], self.ids[3]])
+        self.assertEqual(ids("start=2031-03-06&end=2031-03-07"), self.ids[5:])
+        self.assertEqual(ids("guest=guest 4"), [self.ids[4]])
+        self.assertEqual(self.api.get("/booking/?cursor=nope").status_code, 400)
+        self.assertEqual(self.api.get("/booking/?start=03/01/2031").status_code, 400)
+        self.assertEqual(self.client.get("/booking/").json(), {"results": [], "next": None})
+
+    @override_settings(ALWAYS_OPEN_SLOTS=False)
+    def test_admin_create_checks_the_slot_against_the_grid(self):
+        slot = make_timeslots(1, first_hour=18)[0]
+        day = timezone.localdate() + timedelta(days=3)
+        FieldWeeklySlot.objects.create(playground=self.field, day_of_week=day.weekday(),
+                                       time_slot=slot, is_open=False)
+        FieldBlackout.objects.create(playground=self.field, date=day + timedelta(days=1))
+        Booking.objects.filter(pk=Booking.objects.create(
+            playground=self.field, time_slot=slot, date=day + timedelta(days=2)).pk
+        ).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+        def post(d):
+            return self.api.post("/booking/", {"playground": self.field.id, "time_slot": slot.id,
+                                               "date": str(d), "guest_name": "Walk-in"})
+
+        self.assertEqual(post(day).json(), {"error": "Slot closed or blacked out."})
+        self.assertEqual(post(day + timedelta(days=1)).json(), {"error": "Slot closed or blacked out."})
+        # The lapsed hold neither blocks the slot nor its unique key
+        self.assertEqual(post(day + timedelta(days=2)).status_code, 201)
+        self.assertEqual(post(day + timedelta(days=2)).json(), {"error": "Slot already taken."})
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_double_book(self):
+        from booking.management.commands.stress_checkout import run_stress
+
+        cache.clear()
+        fields = [make_field("Pitch A"), make_field("Pitch B")]
+        timeslots = make_timeslots(2)
+        report = run_stress(fields, timeslots, threads=8, requests=40)
+
+        self.assertEqual(report["requests"], 40)
+        self.assertEqual(report["double_booked"], 0)
+        self.assertEqual(report["mismatched"], 0)
+        # Every request either won its dates or was told they were gone
+        self.assertEqual(set(report["statuses"]) - {"200", "400"}, set())
+        self.assertGreater(report["succeeded"], 0)
+        self.assertGreater(report["held"], 0)
+        self.assertEqual(report["held"], Booking.objects.count())
+
+    def test_command_needs_consent_and_fails_when_nothing_succeeds(self):
+        from rest_framework.response import Response
+        from booking.views import StartCheckoutSeriesView
+
+        with self.assertRaisesMessage(CommandError, "--write-scratch"):
+            call_command("stress_checkout", stdout=StringIO())
+        self.assertFalse(Field.objects.exists())
+
+        broken = mock.patch.object(StartCheckoutSeriesView, "post",
+                                   lambda *a, **kw: Response({"error": "Chapa is not configured"}, status=500))
+        out = StringIO()
+        with broken, self.assertRaisesMessage(CommandError, "No checkout succeeded"):
+            call_command("stress_checkout", write_scratch=True, threads=2, requests=4, stdout=out)
+        self.assertIn("'500': 4", out.getvalue())
+        self.assertFalse(Field.objects.exists())
 
-# Create your tests here.
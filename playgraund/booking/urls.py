@@ -1,16 +1,18 @@
 from django.urls import path
 from .views import (
-    StartCheckoutSeriesView, chapa_callback,
-    booked_map, available_map, available_by_type,
+    StartCheckoutSeriesView, SeriesQuoteView, CheckoutStatusView, chapa_callback,
+    booked_map, available_map, available_by_type, available_range,
     BookingView, BookingDetailView, BookingAvailabilityView,
-    bookings_stats, revenue, recent_activities,
+    bookings_stats, bookings_heatmap, revenue, revenue_breakdown, recent_activities, dashboard,
     PaymentListView, PaymentDetailView,
     BookingsPerMonth, RevenuePerPlayground,
-    BookingsPerUser
+    BookingsPerUser, export_dataset,
 )
 
 urlpatterns = [
     path("series/start-checkout/", StartCheckoutSeriesView.as_view(), name="start-checkout-series"),
+    path("series/quote/", SeriesQuoteView.as_view(), name="series-quote"),
+    path("series/<uuid:group_key>/checkout-status/", CheckoutStatusView.as_view(), name="checkout-status"),
     path("payments/chapa/callback/", chapa_callback, name="chapa-callback"),
 
     # Payments (read-only)
@@ -20,17 +22,23 @@ urlpatterns = [
     path("availability/booked-map/", booked_map, name="booked-map"),
     path("availability/available-map/", available_map, name="available-map"),
     path("availability/by-type/", available_by_type, name="available-by-type"),
+    path("availability/range/", available_range, name="available-range"),
     path("availability/", BookingAvailabilityView.as_view(), name="availability-by-date"),
 
     path("booking/", BookingView.as_view(), name="booking"),
     path("booking/<int:pk>/", BookingDetailView.as_view(), name="booking-detail"),
 
     path("bookings/stats/", bookings_stats, name="bookings-stats"),
+    path("bookings/heatmap/", bookings_heatmap, name="bookings-heatmap"),
     path("revenue/", revenue, name="revenue"),
+    path("revenue/breakdown/", revenue_breakdown, name="revenue-breakdown"),
     path("activities/", recent_activities, name="recent-activities"),
+    path("dashboard/", dashboard, name="dashboard"),
 
     path("revenue/per_playground/", RevenuePerPlayground.as_view(), name="revenue-per-playground"),
     path("bookings/per_month/", BookingsPerMonth.as_view(), name="bookings-per-month"),
     path("bookings/per_user/", BookingsPerUser.as_view(), name="bookings-per-user"),
 
+    path("exports/<str:dataset>/", export_dataset, name="export-dataset"),
+
 ]
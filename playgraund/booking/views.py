@@ -1,20 +1,27 @@
 # booking/views.py
 from __future__ import annotations
 
+import base64
 import calendar
+import json
 import logging
-from collections import defaultdict
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date as date_cls, datetime as dt_cls, timedelta
-from django.db.models import Sum
-import requests
+from decimal import Decimal
 from django.conf import settings
-from django.db import transaction, IntegrityError, models
+from django.db import close_old_connections, transaction, IntegrityError, models
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
-from django.views.decorators.cache import never_cache
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import permissions, status, viewsets, generics
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
@@ -28,7 +35,9 @@ from .models import (
     Booking,
     ChapaPayment,
     BookingStatus,
+    EthiopianWeekday,
     SeriesStatus,
+    PaymentStatus,
 )
 from .serializers import (
     FieldSerializer,
@@ -39,8 +48,38 @@ from .serializers import (
     BookingCreateSerializer,
     BookingSeriesSerializer,
     BookingSeriesCreateSerializer,
+    BookingSeriesQuoteSerializer,
     ChapaPaymentSerializer,
 )
+from .availability import (
+    SKIP_LOST_RACE,
+    SKIP_TAKEN,
+    AvailabilityGrid,
+    plan_occurrences,
+    slot_label,
+)
+from .analytics import (
+    CUSTOMER_SORTS,
+    REVENUE_DIMENSIONS,
+    bookings_count,
+    bookings_per_day,
+    customer_leaderboard,
+    revenue_rows,
+    utilisation_heatmap,
+)
+from .approvals import approve_transaction
+from .chapa import SIGNATURE_HEADERS, get_client as get_chapa_client, verify_webhook_signature
+from .availability_cache import availability_etag, cached_render
+from .dashboard import (
+    DASHBOARD_WIDGETS,
+    activities_payload,
+    cached_build as cached_dashboard,
+    revenue_per_field_payload,
+    stats_payload,
+)
+from .exports import CSVRenderer, NDJSONRenderer, iter_export
+from .idempotency import body_or_query_value, header_key, idempotent
+from .reservations import release_expired_holds, reserve_holds, slot_reservation
 
 logger = logging.getLogger(__name__)
 
@@ -49,16 +88,12 @@ logger = logging.getLogger(__name__)
 # ============================================================================
 CHAPA_PUBLIC_KEY = getattr(settings, "CHAPA_PUBLIC_KEY", "")
 CHAPA_SECRET_KEY = getattr(settings, "CHAPA_SECRET_KEY", "")
-CHAPA_BASE_URL = getattr(settings, "CHAPA_BASE_URL", "https://api.chapa.co").rstrip("/")
-CHAPA_INIT_ENDPOINT = f"{CHAPA_BASE_URL}/v1/transaction/initialize"
-CHAPA_VERIFY_ENDPOINT = f"{CHAPA_BASE_URL}/v1/transaction/verify"
+CHAPA_WEBHOOK_SECRET = getattr(settings, "CHAPA_WEBHOOK_SECRET", "")
 
 CHAPA_RETURN_URL = getattr(settings, "CHAPA_RETURN_URL", "http://localhost:3000/payment-return")
 CHAPA_CALLBACK_URL = getattr(settings, "CHAPA_CALLBACK_URL", "http://localhost:8000/booking/payments/chapa/callback/")
 
-PENDING_HOLD_TTL_MINUTES = int(getattr(settings, "PENDING_HOLD_TTL_MINUTES", 10))
 CURRENCY = getattr(settings, "CURRENCY", "ETB")
-HTTP_TIMEOUT_SEC = int(getattr(settings, "HTTP_TIMEOUT_SEC", 20))
 
 
 def _require_chapa_config() -> tuple[bool, str]:
@@ -100,69 +135,53 @@ def _today_local():
 
 
 def _slot_label_from_times(start_t, end_t) -> str:
-    def _fmt(t):
-        if hasattr(t, "strftime"):
-            return t.strftime("%H:%M")
-        s = str(t)
-        parts = s.split(":")
-        return f"{parts[0]:0>2}:{parts[1]:0>2}"
-
-    return f"{_fmt(start_t)} - {_fmt(end_t)}"
+    return slot_label(start_t, end_t)
 
 
-# ============================================================================
-# Availability helpers
-# ============================================================================
-def _is_slot_open(field_obj: Field, d: date_cls, ts: Timeslot) -> bool:
-    """
-    OPEN BY DEFAULT.
-    - If settings.ALWAYS_OPEN_SLOTS is True: skip weekly rules entirely.
-    - If False: apply 'open-by-default if no weekly rows; closed if weekly rows exist
-      and none is open'.
-    - Blackouts are always enforced.
-    """
-    if not getattr(settings, "ALWAYS_OPEN_SLOTS", False):
-        dow = d.weekday()
-        weekly_qs = FieldWeeklySlot.objects.filter(
-            playground=field_obj,
-            day_of_week=dow,
-            time_slot=ts,
-        )
-        # If there are weekly rows and none of them is open -> closed
-        if weekly_qs.exists() and not weekly_qs.filter(is_open=True).exists():
-            return False
+def _optional_date(request, name: str) -> date_cls | None:
+    """?<name>=YYYY-MM-DD or None; raises ValueError with a client-facing message."""
+    raw = request.GET.get(name)
+    if not raw:
+        return None
+    try:
+        return dt_cls.strptime(raw, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid {name}; use YYYY-MM-DD")
 
-    # Blackouts by date (optionally per-timeslot)
-    blocked = FieldBlackout.objects.filter(
-        playground=field_obj,
-        date=d
-    ).filter(
-        models.Q(time_slot__isnull=True) | models.Q(time_slot=ts)
-    ).exists()
-    if blocked:
-        return False
 
-    return True
+def _page_limit(request, default: int, maximum: int) -> int:
+    """?limit= clamped to [1, maximum]; raises ValueError if not a number."""
+    try:
+        limit = int(request.GET.get("limit", default))
+    except ValueError:
+        raise ValueError("Invalid limit")
+    return max(1, min(limit, maximum))
 
 
-def _pending_fresh_q() -> models.Q:
-    cutoff = _now_local() - timedelta(minutes=PENDING_HOLD_TTL_MINUTES)
-    return models.Q(status=BookingStatus.PENDING, created_at__gte=cutoff)
+def _encode_cursor(position: dict) -> str:
+    """Opaque ?cursor= value for a keyset position."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
 
 
-def _has_conflict(field_obj: Field, d: date_cls, ts: Timeslot) -> bool:
-    return Booking.objects.filter(
-        playground=field_obj,
-        date=d,
-        time_slot=ts
-    ).filter(
-        models.Q(status=BookingStatus.APPROVED) | _pending_fresh_q()
-    ).exists()
+def _decode_cursor(raw: str) -> dict:
+    """Inverse of _encode_cursor; raises ValueError for anything malformed."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(raw.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
 
 
 # ============================================================================
 # Start checkout (series)
 # ============================================================================
+def _skipped_payload(skipped) -> list[dict]:
+    return [{"date": d.isoformat(), "reason": reason} for d, reason in sorted(skipped)]
+
+
+@method_decorator(idempotent("start-checkout"), name="dispatch")
 class StartCheckoutSeriesView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -209,7 +228,13 @@ class StartCheckoutSeriesView(APIView):
                 return Response({"detail": str(nfe[0]), **errs}, status=status.HTTP_400_BAD_REQUEST)
             return Response(errs, status=status.HTTP_400_BAD_REQUEST)
 
-        series: BookingSeries = create_ser.save(status=SeriesStatus.DRAFT)
+        # The tx_ref is unique, so drafts get theirs up front (not "") or
+        # concurrent checkouts would collide on it
+        group_key = uuid.uuid4()
+        tx_ref = f"FIELDBOOK-{group_key}"
+        series: BookingSeries = create_ser.save(
+            status=SeriesStatus.DRAFT, group_key=group_key, chapa_tx_ref=tx_ref
+        )
 
         # attach purchaser if logged-in
         if request.user.is_authenticated and getattr(series, "purchaser_id", None) is None:
@@ -224,54 +249,35 @@ class StartCheckoutSeriesView(APIView):
         start = series.start_date
         months = series.months
 
-        dates = weekly_dates(start, months)
-        total_count = 0
-        tx_ref = f"FIELDBOOK-{series.group_key}"
-
-        # Reserve occurrences
-        with transaction.atomic():
-            for d in dates:
-                if d < _today_local():
-                    continue
-                if not _is_slot_open(field_obj, d, ts):
-                    continue
-                if _has_conflict(field_obj, d, ts):
-                    continue
-
-                try:
-                    Booking.objects.create(
-                        series=series,
-                        user=series.purchaser,
-                        guest_name=series.guest_name,
-                        guest_email=series.guest_email,
-                        guest_phone=series.guest_phone,
-                        playground=field_obj,
-                        time_slot=ts,
-                        date=d,
-                        status=BookingStatus.PENDING,
-                        is_booked=False,
-                        is_paid=False,
-                        chapa_tx_ref=tx_ref,
-                    )
-                    total_count += 1
-                except IntegrityError:
-                    continue
+        # Plan outside the write transaction: fixed number of reads for all dates
+        planned, skipped = plan_occurrences(field_obj, ts, weekly_dates(start, months), _today_local())
 
-            if total_count == 0:
-                series.delete()
-                return Response(
-                    {"error": "No available occurrences to book for the selected package."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+        price = field_obj.price_per_session or 0
+        if price <= 0:
+            series.delete()
+            return Response(
+                {"error": "Invalid total amount (<= 0). Check field price_per_session."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Reserve occurrences under the (field, slot) lock: one bulk insert,
+        # one read-back to find dates taken since planning
+        with slot_reservation(field_obj.id, ts.id):
+            held = reserve_holds(series, field_obj, ts, planned, tx_ref)
+            skipped += [(d, SKIP_LOST_RACE) for d in planned if d not in held]
+            total_count = len(held)
 
-            amount = (field_obj.price_per_session or 0) * total_count
-            if amount <= 0:
+            if total_count == 0:
                 series.delete()
                 return Response(
-                    {"error": "Invalid total amount (<= 0). Check field price_per_session."},
+                    {
+                        "error": "No available occurrences to book for the selected package.",
+                        "skipped": _skipped_payload(skipped),
+                    },
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+            amount = price * total_count
             series.amount_etb = amount
             series.currency = CURRENCY
             series.chapa_tx_ref = tx_ref
@@ -282,68 +288,208 @@ class StartCheckoutSeriesView(APIView):
                 series=series, tx_ref=tx_ref, amount_etb=amount, currency=CURRENCY, status="initiated"
             )
 
-        # Initialize Chapa transaction
-        try:
-            headers = {
-                "Authorization": f"Bearer {CHAPA_SECRET_KEY}",
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-            }
-
-            name = (series.guest_name or getattr(series.purchaser, "full_name", "") or "Guest").strip()
-            email = (series.guest_email or getattr(series.purchaser, "email", "") or "guest@example.com").strip()
-            slot_text = _slot_label_from_times(ts.start_time, ts.end_time)
-
-            payload = {
-                "amount": str(amount),
-                "currency": series.currency or CURRENCY,
-                "email": email,
-                "first_name": name.split(" ", 1)[0] or name,
-                "last_name": (name.split(" ", 1)[1] if " " in name else name),
+        out = BookingSeriesSerializer(series).data
+        out.update(
+            {
                 "tx_ref": tx_ref,
-                "callback_url": CHAPA_CALLBACK_URL,
-                "return_url": CHAPA_RETURN_URL,
-                "customization[title]": "Playground Reservation",
-                "customization[description]": f"{field_obj.name} · {slot_text} · {months} month(s)",
+                "occurrences": total_count,
+                "amount_etb": str(amount),
+                "skipped": _skipped_payload(skipped),
             }
+        )
 
-            resp = requests.post(CHAPA_INIT_ENDPOINT, json=payload, headers=headers, timeout=HTTP_TIMEOUT_SEC)
-            data = resp.json() if resp.content else {}
-            if resp.status_code >= 400 or not data.get("status"):
-                logger.error("Chapa initialize failed: %s", data)
-                raise RuntimeError("Chapa initialize failed")
-
-            checkout_url = (data.get("data") or {}).get("checkout_url")
-            if not checkout_url:
-                raise RuntimeError("Chapa did not return checkout_url")
-
-            series.chapa_checkout_url = checkout_url
-            series.save(update_fields=["chapa_checkout_url", "updated_at"])
-            payment.checkout_url = checkout_url
-            payment.save(update_fields=["checkout_url", "updated_at"])
-
-            out = BookingSeriesSerializer(series).data
-            out.update(
-                {
-                    "checkout_url": checkout_url,
-                    "tx_ref": tx_ref,
-                    "occurrences": total_count,
-                    "amount_etb": str(amount),
-                }
+        # Async mode: hand Chapa initialisation to a worker, let the client poll
+        if _wants_async_checkout(request):
+            _chapa_executor().submit(_initialize_chapa_job, payment.pk)
+            status_url = request.build_absolute_uri(
+                reverse("checkout-status", kwargs={"group_key": series.group_key})
             )
-            return Response(out, status=status.HTTP_200_OK)
+            out.update({"checkout_status": CHECKOUT_INITIALISING, "status_url": status_url})
+            return Response(out, status=status.HTTP_202_ACCEPTED, headers={"Location": status_url})
 
+        # Initialize Chapa transaction
+        try:
+            checkout_url = _initialize_chapa(series, payment)
         except Exception as e:
             logger.exception("Chapa init error")
             return Response({"error": f"Failed to start payment: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
 
+        out["checkout_url"] = checkout_url
+        return Response(out, status=status.HTTP_200_OK)
+
+
+# ============================================================================
+# Chapa initialisation (inline or background)
+# ============================================================================
+CHAPA_ASYNC_CHECKOUT = bool(getattr(settings, "CHAPA_ASYNC_CHECKOUT", False))
+CHAPA_INIT_WORKERS = int(getattr(settings, "CHAPA_INIT_WORKERS", 4))
+
+CHECKOUT_INITIALISING = "initialising"
+CHECKOUT_READY = "ready"
+CHECKOUT_FAILED = "failed"
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _chapa_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CHAPA_INIT_WORKERS, thread_name_prefix="chapa")
+        return _executor
+
+
+def _wants_async_checkout(request) -> bool:
+    """Settings default, overridable per request with `Prefer: respond-async` or ?async=0|1."""
+    flag = request.query_params.get("async")
+    if flag is not None:
+        return flag not in ("0", "false", "no")
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    return CHAPA_ASYNC_CHECKOUT
+
+
+def _initialize_chapa(series: BookingSeries, payment: ChapaPayment) -> str:
+    """Create the Chapa transaction for `payment` and store its checkout_url."""
+    ts = series.time_slot
+    name = (series.guest_name or getattr(series.purchaser, "full_name", "") or "Guest").strip()
+    email = (series.guest_email or getattr(series.purchaser, "email", "") or "guest@example.com").strip()
+    slot_text = _slot_label_from_times(ts.start_time, ts.end_time)
+
+    payload = {
+        "amount": str(payment.amount_etb),
+        "currency": series.currency or CURRENCY,
+        "email": email,
+        "first_name": name.split(" ", 1)[0] or name,
+        "last_name": (name.split(" ", 1)[1] if " " in name else name),
+        "tx_ref": payment.tx_ref,
+        "callback_url": CHAPA_CALLBACK_URL,
+        "return_url": CHAPA_RETURN_URL,
+        "customization[title]": "Playground Reservation",
+        "customization[description]": f"{series.playground.name} · {slot_text} · {series.months} month(s)",
+    }
+
+    data = get_chapa_client().initialize(payload)
+    checkout_url = data["data"]["checkout_url"]
+
+    series.chapa_checkout_url = checkout_url
+    series.save(update_fields=["chapa_checkout_url", "updated_at"])
+    payment.checkout_url = checkout_url
+    payment.save(update_fields=["checkout_url", "updated_at"])
+    return checkout_url
+
+
+def _initialize_chapa_job(payment_id: int) -> None:
+    """Executor entry point: initialise Chapa and record failures on the payment."""
+    close_old_connections()
+    try:
+        payment = ChapaPayment.objects.select_related(
+            "series", "series__playground", "series__time_slot", "series__purchaser"
+        ).get(pk=payment_id)
+        try:
+            _initialize_chapa(payment.series, payment)
+        except Exception as e:
+            logger.exception("Chapa init error (async) for %s", payment.tx_ref)
+            payment.status = PaymentStatus.FAILED
+            payment.payload = {"init_error": str(e)}
+            payment.save(update_fields=["status", "payload", "updated_at"])
+    finally:
+        close_old_connections()
+
+
+class CheckoutStatusView(APIView):
+    """
+    GET /series/<group_key>/checkout-status/
+    -> {"checkout_status": "initialising"|"ready"|"failed", "checkout_url": ..., ...}
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, group_key):
+        payment = get_object_or_404(
+            ChapaPayment.objects.select_related("series"), series__group_key=group_key
+        )
+        if payment.checkout_url:
+            state = CHECKOUT_READY
+        elif payment.status == PaymentStatus.FAILED:
+            state = CHECKOUT_FAILED
+        else:
+            state = CHECKOUT_INITIALISING
+
+        out = {
+            "checkout_status": state,
+            "tx_ref": payment.tx_ref,
+            "payment_status": payment.status,
+            "checkout_url": payment.checkout_url or None,
+            "amount_etb": str(payment.amount_etb),
+        }
+        if state == CHECKOUT_FAILED:
+            out["error"] = (payment.payload or {}).get("init_error", "Failed to start payment")
+        elif state == CHECKOUT_INITIALISING:
+            out["retry_after"] = 1
+        return Response(out, status=200)
+
+
+# ============================================================================
+# Series quote (dry run)
+# ============================================================================
+class SeriesQuoteView(APIView):
+    """
+    GET /series/quote/?playground=1&time_slot=2&start_date=YYYY-MM-DD&months=1|3|6
+    Previews a package without writing rows: which weekly dates can be held,
+    which are skipped and why, and the total price.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        ser = BookingSeriesQuoteSerializer(data=request.query_params)
+        ser.is_valid(raise_exception=True)
+        field_obj = ser.validated_data["playground"]
+        ts = ser.validated_data["time_slot"]
+        start = ser.validated_data["start_date"]
+        months = ser.validated_data["months"]
+
+        bookable, skipped = plan_occurrences(field_obj, ts, weekly_dates(start, months), _today_local())
+        price = field_obj.price_per_session or 0
+        return Response(
+            {
+                "playground": field_obj.id,
+                "time_slot": ts.id,
+                "weekday": start.weekday(),
+                "start_date": start.isoformat(),
+                "months": months,
+                "price_per_session": str(price),
+                "occurrences": len(bookable),
+                "amount_etb": str(price * len(bookable)),
+                "currency": CURRENCY,
+                "bookable": [d.isoformat() for d in bookable],
+                "skipped": _skipped_payload(skipped),
+            },
+            status=200,
+        )
+
 
 # ============================================================================
 # Chapa verification
 # ============================================================================
+def _callback_idempotency_key(request) -> str | None:
+    # Chapa's retries carry no Idempotency-Key; one settled tx_ref is one event
+    return header_key(request) or body_or_query_value(request, "tx_ref")
+
+
+def _callback_settled(response) -> bool:
+    # Only replay final outcomes; "not_paid" and errors must be re-checked
+    return response.status_code == 200 and (getattr(response, "data", None) or {}).get("status") == "paid"
+
+
+@idempotent("chapa-callback", key_from=_callback_idempotency_key, store_if=_callback_settled,
+            match_body=False)
 @api_view(["POST"])
 @csrf_exempt
 def chapa_callback(request):
+    # Read the raw body before DRF parses it; the signature covers these bytes
+    raw_body = request.body
+
     ok, msg = _require_chapa_config()
     if not ok:
         return Response({"error": f"Payment config error: {msg}"}, status=500)
@@ -352,14 +498,21 @@ def chapa_callback(request):
     if not tx_ref:
         return Response({"error": "tx_ref is required"}, status=400)
 
+    # Fast path: a correctly signed success webhook is applied now and
+    # confirmed against the verify endpoint in the background
+    signature = next((request.headers.get(h) for h in SIGNATURE_HEADERS if request.headers.get(h)), None)
+    if signature and verify_webhook_signature(raw_body, signature, CHAPA_WEBHOOK_SECRET):
+        fast = _apply_signed_webhook(tx_ref, request.data)
+        if fast is not None:
+            return fast
+    elif signature:
+        logger.warning("Chapa callback for %s has an invalid signature; verifying", tx_ref)
+
     # Verify with Chapa
     try:
-        headers = {"Authorization": f"Bearer {CHAPA_SECRET_KEY}", "Accept": "application/json"}
-        url = f"{CHAPA_VERIFY_ENDPOINT}/{tx_ref}"
-        resp = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT_SEC)
-        data = resp.json() if resp.content else {}
-        ok = bool(data.get("status")) and str((data.get("data") or {}).get("status", "")).lower() == "success"
-        if not ok:
+        client = get_chapa_client()
+        data = client.verify(tx_ref)
+        if not client.is_success(data):
             return Response({"status": "not_paid", "chapa": data}, status=200)
     except Exception as e:
         logger.exception("Chapa verify error")
@@ -367,32 +520,7 @@ def chapa_callback(request):
 
     # Mark series + bookings
     try:
-        with transaction.atomic():
-            payment = ChapaPayment.objects.select_for_update().get(tx_ref=tx_ref)
-            series = payment.series
-
-            if payment.status != "paid":
-                payment.status = "paid"
-                payment.paid_at = _now_local()
-                payment.payload = data
-                payment.save(update_fields=["status", "paid_at", "payload", "updated_at"])
-
-            if series.status != SeriesStatus.APPROVED:
-                series.status = SeriesStatus.APPROVED
-                series.save(update_fields=["status", "updated_at"])
-
-            cutoff = _now_local() - timedelta(minutes=PENDING_HOLD_TTL_MINUTES)
-            qs = Booking.objects.select_for_update().filter(
-                chapa_tx_ref=tx_ref, status=BookingStatus.PENDING, created_at__gte=cutoff
-            )
-            updated = 0
-            for b in qs:
-                b.status = BookingStatus.APPROVED
-                b.is_paid = True
-                b.is_booked = True
-                b.save(update_fields=["status", "is_paid", "is_booked", "updated_at"])
-                updated += 1
-
+        updated = approve_transaction(tx_ref, data)
         return Response({"status": "paid", "approved_bookings": updated}, status=200)
 
     except ChapaPayment.DoesNotExist:
@@ -402,144 +530,283 @@ def chapa_callback(request):
         return Response({"error": str(e)}, status=500)
 
 
+def _apply_signed_webhook(tx_ref: str, body) -> Response | None:
+    """
+    Approve from a signed webhook when it reports success and agrees with the
+    stored payment. Returns None to fall back to the verify round-trip.
+    """
+    if str(body.get("status", "")).lower() != "success":
+        return None
+    payment = ChapaPayment.objects.filter(tx_ref=tx_ref).only("amount_etb", "currency").first()
+    if payment is None:
+        return None
+    try:
+        if "amount" in body and Decimal(str(body["amount"])) != payment.amount_etb:
+            raise ValueError("amount mismatch")
+    except (ArithmeticError, ValueError):
+        logger.warning("Signed Chapa webhook for %s disagrees on amount; verifying", tx_ref)
+        return None
+    if body.get("currency") and str(body["currency"]).upper() != payment.currency.upper():
+        logger.warning("Signed Chapa webhook for %s disagrees on currency; verifying", tx_ref)
+        return None
+
+    payload = {**dict(body.items()), "source": "webhook", "verified": None}
+    updated = approve_transaction(tx_ref, payload)
+    transaction.on_commit(lambda: _chapa_executor().submit(_confirm_payment_job, tx_ref))
+    return Response(
+        {"status": "paid", "approved_bookings": updated, "verification": "pending"}, status=200
+    )
+
+
+def _confirm_payment_job(tx_ref: str) -> None:
+    """Executor entry point: confirm a webhook-approved payment with Chapa."""
+    close_old_connections()
+    try:
+        client = get_chapa_client()
+        try:
+            verified = client.is_success(client.verify(tx_ref))
+        except Exception:
+            logger.exception("Chapa confirmation failed for %s", tx_ref)
+            verified = None
+        payment = ChapaPayment.objects.get(tx_ref=tx_ref)
+        payment.payload = {**(payment.payload or {}), "verified": verified}
+        payment.save(update_fields=["payload", "updated_at"])
+        if verified is False:
+            logger.error("Chapa did not confirm webhook-approved payment %s; needs review", tx_ref)
+    finally:
+        close_old_connections()
+
+
 # ============================================================================
 # Availability endpoints
 # ============================================================================
-@never_cache
+def _month_params(request):
+    year = int(request.GET.get("year"))
+    month = int(request.GET.get("month"))
+    only_future = (request.GET.get("only_future", "1") != "0")
+    start = date_cls(year, month, 1)
+    return start, add_months(start, 1), only_future
+
+
+def _cached_availability(request, kind, fields, start, end, render, since=None):
+    """
+    Serve an availability payload through the versioned cache.
+    Clients that send a matching If-None-Match get a 304 without the grid
+    being rebuilt; everyone must revalidate (no-cache) before reusing a copy.
+    """
+    etag = availability_etag(kind, [f.id for f in fields], start, end, since)
+    if etag in _if_none_match(request):
+        resp = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        resp = Response(cached_render(etag, fields, start, end, render), status=200)
+    resp["ETag"] = etag
+    patch_cache_control(resp, private=True, no_cache=True, max_age=0)
+    return resp
+
+
+def _if_none_match(request) -> set[str]:
+    raw = request.META.get("HTTP_IF_NONE_MATCH", "")
+    return {tag.strip() for tag in raw.split(",") if tag.strip()}
+
+
 @api_view(["GET"])
 def booked_map(request):
     try:
         field_id = int(request.GET.get("field_id"))
-        year = int(request.GET.get("year"))
-        month = int(request.GET.get("month"))
-        only_future = (request.GET.get("only_future", "1") != "0")
+        start, next_start, only_future = _month_params(request)
     except Exception:
         return Response({"error": "Provide valid field_id, year, month"}, status=400)
 
     field_obj = get_object_or_404(Field, pk=field_id)
-    start = date_cls(year, month, 1)
-    next_start = add_months(start, 1)
-    today = _today_local()
-
-    qs = Booking.objects.filter(
-        playground=field_obj,
-        date__gte=start,
-        date__lt=next_start,
-        status=BookingStatus.APPROVED
-    ).values("date", "time_slot__start_time", "time_slot__end_time")
-
-    booked = defaultdict(list)
-    for row in qs:
-        d = row["date"]
-        if only_future and d < today:
-            continue
-        label = _slot_label_from_times(row["time_slot__start_time"], row["time_slot__end_time"])
-        booked[d.isoformat()].append(label)
-
-    return Response({"booked": booked}, status=200)
+    since = _today_local() if only_future else None
+    return _cached_availability(
+        request, "booked", [field_obj], start, next_start,
+        lambda grid: {"booked": grid.booked_map(field_obj.id, since)}, since,
+    )
 
 
-@never_cache
 @api_view(["GET"])
 def available_map(request):
     try:
         field_id = int(request.GET.get("field_id"))
-        year = int(request.GET.get("year"))
-        month = int(request.GET.get("month"))
-        only_future = (request.GET.get("only_future", "1") != "0")
+        start, next_start, only_future = _month_params(request)
     except Exception:
         return Response({"error": "Provide valid field_id, year, month"}, status=400)
 
     field_obj = get_object_or_404(Field, pk=field_id)
-    start = date_cls(year, month, 1)
-    next_start = add_months(start, 1)
-    today = _today_local()
-    timeslots = list(Timeslot.objects.all().order_by("start_time"))
-
-    out: dict[str, list[str]] = {}
-    d = start
-    while d < next_start:
-        if only_future and d < today:
-            d += timedelta(days=1)
-            continue
-
-        avail_labels = []
-        for ts in timeslots:
-            if not _is_slot_open(field_obj, d, ts):
-                continue
-            if _has_conflict(field_obj, d, ts):
-                continue
-            avail_labels.append(_slot_label_from_times(ts.start_time, ts.end_time))
-
-        if avail_labels:
-            out[d.isoformat()] = avail_labels
-        d += timedelta(days=1)
-
-    return Response({"available": out}, status=200)
+    since = _today_local() if only_future else None
+    return _cached_availability(
+        request, "available", [field_obj], start, next_start,
+        lambda grid: {"available": grid.available_map(field_obj.id, since)}, since,
+    )
 
 
-@never_cache
 @api_view(["GET"])
 def available_by_type(request):
+    """
+    GET /availability/by-type/?type=football&year=YYYY&month=M
+    Merges every active field of the sport type:
+      available:   {"YYYY-MM-DD": [labels free on at least one field]}
+      free_fields: {"YYYY-MM-DD": {label: [field ids free for that slot]}}
+    """
     sport_type = (request.GET.get("type") or "").strip().lower()
     try:
-        year = int(request.GET.get("year"))
-        month = int(request.GET.get("month"))
-        only_future = (request.GET.get("only_future", "1") != "0")
+        start, next_start, only_future = _month_params(request)
     except Exception:
         return Response({"error": "Provide valid type, year, month"}, status=400)
 
-    field_obj = Field.objects.filter(type=sport_type, is_active=True).first()
-    if not field_obj:
-        return Response({"available": {}}, status=200)
+    fields = list(Field.objects.filter(type=sport_type, is_active=True).order_by("id"))
+    if not fields:
+        return Response({"type": sport_type, "fields": [], "available": {}, "free_fields": {}}, status=200)
 
-    start = date_cls(year, month, 1)
-    next_start = add_months(start, 1)
-    today = _today_local()
-    timeslots = list(Timeslot.objects.all().order_by("start_time"))
+    since = _today_local() if only_future else None
+    field_ids = [f.id for f in fields]
+
+    def render(grid):
+        available, free_fields = grid.merged_map(field_ids, since)
+        return {
+            "type": sport_type,
+            "fields": [{"id": f.id, "name": f.name} for f in fields],
+            "available": available,
+            "free_fields": free_fields,
+        }
+
+    return _cached_availability(request, "by-type", fields, start, next_start, render, since)
+
+
+AVAILABILITY_RANGE_MAX_DAYS = int(getattr(settings, "AVAILABILITY_RANGE_MAX_DAYS", 366))
 
-    out: dict[str, list[str]] = {}
-    d = start
-    while d < next_start:
-        if only_future and d < today:
-            d += timedelta(days=1)
-            continue
 
-        avail_labels = []
-        for ts in timeslots:
-            if not _is_slot_open(field_obj, d, ts):
-                continue
-            if _has_conflict(field_obj, d, ts):
-                continue
-            avail_labels.append(_slot_label_from_times(ts.start_time, ts.end_time))
+def _field_ids_param(request) -> list[int]:
+    """field_id=1&field_id=2 or field_id=1,2"""
+    out = []
+    for raw in request.GET.getlist("field_id"):
+        out.extend(int(part) for part in raw.split(",") if part.strip())
+    return out
+
 
-        if avail_labels:
-            out[d.isoformat()] = avail_labels
-        d += timedelta(days=1)
+@api_view(["GET"])
+@renderer_classes([JSONRenderer, NDJSONRenderer])
+def available_range(request):
+    """
+    GET /availability/range/?start=YYYY-MM-DD&end=YYYY-MM-DD&field_id=1[,2...]
+    Streams day-by-day availability for [start, end] (end inclusive):
+      {"start":..., "end":..., "fields":[ids], "days":[{"date":..., "available":{"<field_id>":[labels]}}, ...]}
+    With ?format=ndjson each day is written as its own JSON line instead.
+    Reads are batched one calendar month at a time.
+    """
+    try:
+        start = dt_cls.strptime(request.GET.get("start", ""), "%Y-%m-%d").date()
+        end = dt_cls.strptime(request.GET.get("end", ""), "%Y-%m-%d").date()
+        field_ids = _field_ids_param(request)
+    except (TypeError, ValueError):
+        return Response({"error": "Provide valid start, end (YYYY-MM-DD) and field_id"}, status=400)
+
+    if not field_ids:
+        return Response({"error": "field_id is required"}, status=400)
+    if end < start:
+        return Response({"error": "end must not be before start"}, status=400)
+    if (end - start).days + 1 > AVAILABILITY_RANGE_MAX_DAYS:
+        return Response({"error": f"Range is limited to {AVAILABILITY_RANGE_MAX_DAYS} days"}, status=400)
+
+    fields = list(Field.objects.filter(pk__in=field_ids).order_by("id"))
+    missing = set(field_ids) - {f.id for f in fields}
+    if missing:
+        return Response({"error": f"Unknown field_id: {sorted(missing)}"}, status=404)
+
+    ndjson = request.GET.get("format") == "ndjson"
+
+    def _days():
+        for grid in AvailabilityGrid.iter_months(fields, start, end + timedelta(days=1)):
+            for d in grid.days():
+                yield {
+                    "date": d.isoformat(),
+                    "available": {str(f.id): grid.free_labels(f.id, d) for f in fields},
+                }
 
-    return Response({"available": out}, status=200)
+    def _stream():
+        if ndjson:
+            for row in _days():
+                yield json.dumps(row) + "\n"
+            return
+        head = {"start": start.isoformat(), "end": end.isoformat(), "fields": [f.id for f in fields]}
+        yield json.dumps(head)[:-1] + ', "days": ['
+        sep = ""
+        for row in _days():
+            yield sep + json.dumps(row)
+            sep = ","
+        yield "]}"
+
+    resp = StreamingHttpResponse(
+        _stream(), content_type="application/x-ndjson" if ndjson else "application/json"
+    )
+    patch_cache_control(resp, private=True, no_cache=True, max_age=0)
+    return resp
 
 
 # ============================================================================
 # Booking list/detail
 # ============================================================================
+BOOKING_PAGE_SIZE = int(getattr(settings, "BOOKING_PAGE_SIZE", 50))
+BOOKING_MAX_PAGE_SIZE = int(getattr(settings, "BOOKING_MAX_PAGE_SIZE", 200))
+
+
 class BookingView(APIView):
     def get(self, request):
+        """
+        GET /booking/?start=YYYY-MM-DD&end=YYYY-MM-DD&field_id=1&status=approved&guest=abebe&limit=50&cursor=...
+        Newest first, one page at a time (staff see every booking, customers
+        their own). Pages are keyed on (created_at, id), so each one is a
+        single indexed query however deep it is; pass the returned `next` as
+        ?cursor= for the following page.
+        -> {"results": [...], "next": cursor or null}
+        """
         user = request.user
         if user.is_authenticated and getattr(user, "is_staff", False):
-            qs = Booking.objects.all().order_by("-created_at")
+            qs = Booking.objects.all()
         elif user.is_authenticated:
             try:
                 prof = user.profile  # type: ignore[attr-defined]
                 qs = Booking.objects.filter(
                     models.Q(user=prof) | models.Q(series__purchaser=prof)
-                ).order_by("-created_at")
+                )
             except Exception:
                 qs = Booking.objects.none()
         else:
             qs = Booking.objects.none()
 
-        return Response(BookingSerializer(qs, many=True).data, status=200)
+        try:
+            qs = qs.filter(**_booking_filters(request))
+            start, end = _optional_date(request, "start"), _optional_date(request, "end")
+            limit = _page_limit(request, BOOKING_PAGE_SIZE, BOOKING_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if request.GET.get("cursor"):
+            try:
+                cursor = _decode_cursor(request.GET["cursor"])
+                created_at, pk = dt_cls.fromisoformat(cursor["t"]), int(cursor["id"])
+            except (ValueError, KeyError, TypeError):
+                return Response({"error": "Invalid cursor"}, status=400)
+            qs = qs.filter(models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, id__lt=pk))
+        if start:
+            qs = qs.filter(date__gte=start)
+        if end:
+            qs = qs.filter(date__lte=end)
+        guest = (request.GET.get("guest") or "").strip()
+        if guest:
+            qs = qs.filter(
+                models.Q(guest_name__icontains=guest) |
+                models.Q(guest_email__icontains=guest) |
+                models.Q(guest_phone__icontains=guest)
+            )
+
+        # playground carries price_per_session, so price_etb needs no extra query
+        page = list(qs.select_related("playground", "time_slot").order_by("-created_at", "-id")[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = _encode_cursor({"t": page[-1].created_at.isoformat(), "id": page[-1].id})
+        return Response({"results": BookingSerializer(page, many=True).data, "next": next_cursor}, status=200)
 
     def post(self, request):
         if not (request.user.is_authenticated and getattr(request.user, "is_staff", False)):
@@ -549,12 +816,20 @@ class BookingView(APIView):
         ser.is_valid(raise_exception=True)
         data = ser.validated_data
 
-        if not _is_slot_open(data["playground"], data["date"], data["time_slot"]):
-            return Response({"error": "Slot closed or blacked out."}, status=400)
-        if _has_conflict(data["playground"], data["date"], data["time_slot"]):
+        field_obj, d, ts = data["playground"], data["date"], data["time_slot"]
+        grid = AvailabilityGrid.load([field_obj], d, d + timedelta(days=1), timeslots=[ts])
+        reason = grid.skip_reason(field_obj.id, d, ts.id)
+        if reason == SKIP_TAKEN:
             return Response({"error": "Slot already taken."}, status=400)
+        if reason:
+            return Response({"error": "Slot closed or blacked out."}, status=400)
 
-        b = ser.save(status=BookingStatus.APPROVED, is_booked=True, is_paid=True)
+        try:
+            with slot_reservation(data["playground"].id, data["time_slot"].id):
+                release_expired_holds(data["playground"], data["time_slot"], [data["date"]])
+                b = ser.save(status=BookingStatus.APPROVED, is_booked=True, is_paid=True)
+        except IntegrityError:
+            return Response({"error": "Slot already taken."}, status=400)
         return Response(BookingSerializer(b).data, status=201)
 
 
@@ -569,7 +844,12 @@ class BookingDetailView(APIView):
         b = get_object_or_404(Booking, pk=pk)
         ser = BookingSerializer(b, data=request.data, partial=True)
         ser.is_valid(raise_exception=True)
-        ser.save()
+        try:
+            with transaction.atomic():
+                ser.save()
+        except IntegrityError:
+            # e.g. re-activating a cancelled booking whose slot was resold
+            return Response({"error": "Slot already taken."}, status=400)
         return Response(ser.data, status=200)
 
     def delete(self, request, pk):
@@ -600,32 +880,74 @@ class BookingAvailabilityView(APIView):
         except Exception:
             return Response({"error": "Invalid date or field_id"}, status=400)
 
-        out = []
-        for ts in Timeslot.objects.all().order_by("start_time"):
-            label = _slot_label_from_times(ts.start_time, ts.end_time)
-            if not _is_slot_open(field_obj, d, ts):
-                out.append({"label": label, "status": "closed", "start_time": str(ts.start_time)[:5], "end_time": str(ts.end_time)[:5]})
-                continue
-            if _has_conflict(field_obj, d, ts):
-                out.append({"label": label, "status": "booked", "start_time": str(ts.start_time)[:5], "end_time": str(ts.end_time)[:5]})
-            else:
-                out.append({"label": label, "status": "available", "start_time": str(ts.start_time)[:5], "end_time": str(ts.end_time)[:5]})
-        return Response(out, status=200)
+        return _cached_availability(
+            request, "day", [field_obj], d, d + timedelta(days=1),
+            lambda grid: grid.day_slots(field_obj.id, d),
+        )
 
 
 # ============================================================================
 # Analytics
 # ============================================================================
+ANALYTICS_RANGE_MAX_DAYS = int(getattr(settings, "ANALYTICS_RANGE_MAX_DAYS", 366))
+LEADERBOARD_PAGE_SIZE = int(getattr(settings, "LEADERBOARD_PAGE_SIZE", 50))
+LEADERBOARD_MAX_PAGE_SIZE = int(getattr(settings, "LEADERBOARD_MAX_PAGE_SIZE", 200))
+
+
+def _date_range_params(
+    request, default_days: int = 7, max_days: int | None = ANALYTICS_RANGE_MAX_DAYS,
+) -> tuple[date_cls, date_cls]:
+    """
+    Inclusive [start, end] from ?start=&end= (YYYY-MM-DD). With neither, the
+    `default_days` window ending today; with only start, start through today;
+    with only end, the `default_days` window ending there. Ranges longer than
+    `max_days` (None: no limit) are refused. Raises ValueError with a
+    client-facing message.
+    """
+    start, end = _optional_date(request, "start"), _optional_date(request, "end")
+    if end is None:
+        end = _today_local()
+    if start is None:
+        start = end - timedelta(days=default_days - 1)
+    if end < start:
+        raise ValueError("end must not be before start")
+    if max_days is not None and (end - start).days + 1 > max_days:
+        raise ValueError(f"Range is limited to {max_days} days")
+    return start, end
+
+
+def _booking_filters(request) -> dict:
+    """ORM filters from ?field_id= and ?status=; raises ValueError on bad input."""
+    filters = {}
+    if request.GET.get("field_id"):
+        try:
+            filters["playground_id"] = int(request.GET["field_id"])
+        except ValueError:
+            raise ValueError("Invalid field_id")
+    status_param = request.GET.get("status")
+    if status_param:
+        if status_param not in BookingStatus.values:
+            raise ValueError(f"status must be one of {', '.join(BookingStatus.values)}")
+        filters["status"] = status_param
+    return filters
+
+
 @api_view(["GET"])
 def bookings_stats(request):
-    today = _today_local()
-    labels, values = [], []
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        count = Booking.objects.filter(date=day).count()
-        labels.append(day.strftime("%a"))
-        values.append(count)
-    return Response({"labels": labels, "values": values})
+    """
+    GET /bookings/stats/?start=YYYY-MM-DD&end=YYYY-MM-DD&field_id=1&status=approved
+    Bookings per day over [start, end] (default: the last 7 days), one grouped
+    query over the daily rollup whatever the range; days without bookings are
+    filled with 0.
+    -> {"labels": [...], "dates": [...], "values": [...], "total": n}
+    """
+    try:
+        start, end = _date_range_params(request)
+        filters = _booking_filters(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    return Response(stats_payload(bookings_per_day(start, end, **filters), start, end))
 
 
 @api_view(["GET"])
@@ -637,38 +959,137 @@ def revenue(request):
         year, m = month.split("-")
         year = int(year)
         m = int(m)
+        start = date_cls(year, m, 1)
     except Exception:
         return Response({"error": "Invalid month format"}, status=400)
 
-    start = date_cls(year, m, 1)
-    next_start = add_months(start, 1)
+    rows = revenue_rows(start, add_months(start, 1) - timedelta(days=1))
+    return Response({"total_etb": str(rows[0]["total_etb"]) if rows else "0"}, status=200)
+
+
+@api_view(["GET"])
+def revenue_breakdown(request):
+    """
+    GET /revenue/breakdown/?start=YYYY-MM-DD&end=YYYY-MM-DD&group_by=month,field,type
+    Paid revenue (Chapa payments + paid admin bookings) over [start, end]
+    (default: the last 365 days), aggregated in the database.
+    -> {"start", "end", "group_by", "currency", "total_etb",
+        "rows": [{"month"?, "field_id"?, "field_name"?, "type"?, "total_etb", "count"}]}
+    """
+    try:
+        start, end = _date_range_params(request, default_days=365)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    group_by = [g for g in request.GET.get("group_by", "month").split(",") if g]
+    unknown = set(group_by) - set(REVENUE_DIMENSIONS)
+    if unknown:
+        return Response(
+            {"error": f"group_by must be drawn from {', '.join(REVENUE_DIMENSIONS)}"}, status=400
+        )
+
+    rows = revenue_rows(start, end, group_by)
+    return Response({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "group_by": [dim for dim in REVENUE_DIMENSIONS if dim in group_by],
+        "currency": CURRENCY,
+        "total_etb": str(sum((r["total_etb"] for r in rows), Decimal("0"))),
+        "rows": [{**r, "total_etb": str(r["total_etb"])} for r in rows],
+    })
 
-    qs = Booking.objects.filter(
-        status=BookingStatus.APPROVED,
-        date__gte=start,
-        date__lt=next_start
-    ).select_related("playground")
 
-    total = sum([(b.playground.price_per_session or 0) for b in qs])
-    return Response({"total_etb": str(total)}, status=200)
+@api_view(["GET"])
+def bookings_heatmap(request):
+    """
+    GET /bookings/heatmap/?start=YYYY-MM-DD&end=YYYY-MM-DD&field_id=1
+    Share of open capacity taken by approved bookings per field, weekday and
+    timeslot over [start, end] (default: the last 12 weeks), for active
+    fields unless field_id names one. The work does not grow with the range,
+    so any range is accepted.
+    -> {"start", "end", "weekdays": [...], "timeslots": [{"id", "label"}],
+        "fields": [{"field_id", "field_name", "booked", "capacity",
+                    "utilisation", "overall"}]}
+    """
+    try:
+        start, end = _date_range_params(request, default_days=84, max_days=None)
+        field_id = _booking_filters(request).get("playground_id")
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    # Inactive fields take no bookings, so their capacity is not open; ask by field_id to see one anyway
+    fields = Field.objects.order_by("name")
+    fields = fields.filter(id=field_id) if field_id is not None else fields.filter(is_active=True)
+    timeslots = list(Timeslot.objects.order_by("start_time"))
+    return Response({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "weekdays": [label for _, label in EthiopianWeekday.choices],
+        "timeslots": [{"id": ts.id, "label": slot_label(ts.start_time, ts.end_time)} for ts in timeslots],
+        "fields": utilisation_heatmap(list(fields), timeslots, start, end),
+    })
 
 
 @api_view(["GET"])
 def recent_activities(request):
-    qs = Booking.objects.select_related("playground", "time_slot").order_by("-id")[:5]
-    items = []
-    for b in qs:
-        slot_text = _slot_label_from_times(b.time_slot.start_time, b.time_slot.end_time)
-        items.append(
-            {
-                "id": b.id,
-                "text": f"{b.guest_name or getattr(getattr(b, 'user', None), 'full_name', 'User')} "
-                        f"booked {b.playground.name} ({slot_text})",
-                "time": b.date.isoformat(),
-                "status": b.status,
-            }
+    return Response(activities_payload(), status=200)
+
+
+@api_view(["GET"])
+def dashboard(request):
+    """
+    GET /dashboard/?widgets=bookings_stats,revenue,bookings_per_month,revenue_per_playground,activities
+                   &start=YYYY-MM-DD&end=YYYY-MM-DD&month=YYYY-MM
+    Several dashboard widgets in one response (default: all of them), each
+    shaped like its own endpoint. start/end is the bookings_stats window
+    (default: the last 7 days; start alone runs through today) and month the revenue / bookings_per_month
+    month (default: this month). Results are cached per window briefly.
+    -> {"widgets": {<name>: payload}, "cached": bool}
+    """
+    raw = request.GET.get("widgets")
+    widgets = [w for w in raw.split(",") if w] if raw else list(DASHBOARD_WIDGETS)
+    unknown = set(widgets) - set(DASHBOARD_WIDGETS)
+    if unknown:
+        return Response({"error": f"widgets must be drawn from {', '.join(DASHBOARD_WIDGETS)}"}, status=400)
+    try:
+        start, end = _date_range_params(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    try:
+        month_start = (dt_cls.strptime(request.GET["month"], "%Y-%m").date() if request.GET.get("month")
+                       else _today_local().replace(day=1))
+    except ValueError:
+        return Response({"error": "Invalid month format"}, status=400)
+
+    payload, hit = cached_dashboard(widgets, start, end, month_start)
+    return Response({"widgets": payload, "cached": hit})
+
+
+# ============================================================================
+# Exports
+# ============================================================================
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def export_dataset(request, dataset):
+    """
+    GET /exports/<bookings|series|payments>/?format=csv|ndjson&start=YYYY-MM-DD&end=YYYY-MM-DD&status=
+    Admin only. Streams every matching row (CSV by default), oldest first;
+    start/end bound the booking date for bookings and the creation day
+    otherwise, and both are optional.
+    """
+    fmt = request.accepted_renderer.format
+    try:
+        lines = iter_export(
+            dataset, fmt, start=_optional_date(request, "start"), end=_optional_date(request, "end"),
+            status=request.GET.get("status") or None,
         )
-    return Response(items, status=200)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    resp = StreamingHttpResponse(lines, content_type=request.accepted_renderer.media_type)
+    resp["Content-Disposition"] = f'attachment; filename="{dataset}-{_today_local():%Y%m%d}.{fmt}"'
+    patch_cache_control(resp, private=True, no_cache=True, max_age=0)
+    return resp
 
 
 # ============================================================================
@@ -762,55 +1183,70 @@ class BookingsPerMonth(APIView):
         
         start = date_cls(year, month, 1)
         next_start = add_months(start, 1)
-        qs = Booking.objects.filter(date__gte=start, date__lt=next_start).count()
-        return Response({"year": year, "month": month, "bookings": qs}, status=200)
+        count = bookings_count(start, next_start - timedelta(days=1))
+        return Response({"year": year, "month": month, "bookings": count}, status=200)
 
 class RevenuePerPlayground(APIView):
     def get(self, request):
-        # Aggregate total revenue per field/playground
-        revenues = (
-            Booking.objects.values("playground__id", "playground__name")
-            .annotate(total_revenue=Sum("playground__price_per_session"))
-            .order_by("playground__name")
-        )
+        # Paid revenue per field, all time unless ?start=/&end= narrow it
+        try:
+            start, end = (_date_range_params(request) if request.GET.get("start") or request.GET.get("end")
+                          else (None, None))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(revenue_per_field_payload(start, end))
 
-        # Make sure every field shows up, even if it has no revenue
-        fields = Field.objects.all()
-        data = []
-        for f in fields:
-            rev = next(
-                (r["total_revenue"] for r in revenues if r["playground__id"] == f.id), 0
-            )
-            data.append(
-                {
-                    "playground_id": f.id,
-                    "playground_name": f.name,
-                    "total_revenue": rev or 0,
-                }
-            )
+class BookingsPerUser(APIView):
+    """
+    GET /bookings/per_user/?sort=bookings|spend|last_booking&limit=50&cursor=...
 
-        return Response(data)
+    Admin only. Customer leaderboard: registered profiles, and guests
+    grouped by normalised email (else phone). `customer` is an opaque id,
+    never the email or phone itself. Pass the returned `next` as ?cursor=
+    for the following page; it is null on the last one.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-class BookingsPerUser(APIView):
     def get(self, request):
-        booking = (
-            Booking.objects.values("user__id", "guest_name")
-            .annotate(total_booking=Sum("is_booked"))
-            .order_by("created_at")
-        )
+        sort = request.GET.get("sort", "bookings")
+        if sort not in CUSTOMER_SORTS:
+            return Response({"error": f"sort must be one of {', '.join(CUSTOMER_SORTS)}"}, status=400)
+        after = None
+        try:
+            limit = _page_limit(request, LEADERBOARD_PAGE_SIZE, LEADERBOARD_MAX_PAGE_SIZE)
+            if request.GET.get("cursor"):
+                cursor = _decode_cursor(request.GET["cursor"])
+                if cursor.get("sort") != sort or "v" not in cursor or "k" not in cursor:
+                    raise ValueError("Invalid cursor")
+                after = (cursor["v"], cursor["k"])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        users = Booking.objects.filter().values("user__id", "guest_name")
-        data = []
-        for u in users:
-            book = next(
-                (r["total_booking"] for r in booking if r["user__id"] == u.id), 0
-            )
-            data.append(
-                {
-                    "user_id": u.id,
-                    "guest_name": u.guest_name,
-                    "total_bookings": book or 0,
-                }
-            )
-        return Response(data)
-        
\ No newline at end of file
+        try:
+            rows, next_after = customer_leaderboard(sort, limit, after)
+        except (ValueError, ArithmeticError):
+            # Malformed value inside an otherwise well-formed cursor
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        # Names for the page's registered customers, one query
+        user_ids = [r["user_id"] for r in rows if r["user_id"] is not None]
+        names = {
+            pk: f"{first} {last}".strip() or username
+            for pk, first, last, username in Profile.objects.filter(id__in=user_ids)
+            .values_list("id", "first_name", "last_name", "username")
+        }
+        results = []
+        for r in rows:
+            registered = r["user_id"] is not None
+            results.append({
+                "customer": r["customer"],
+                "user_id": r["user_id"] if registered else None,
+                "name": names.get(r["user_id"], "") if registered else (r["guest_name"] or ""),
+                "total_bookings": r["bookings"],
+                "approved_bookings": r["approved_bookings"],
+                "spend_etb": str(r["spend_etb"]),
+                "last_booking": r["last_booking"],
+            })
+
+        next_cursor = _encode_cursor({"sort": sort, "v": next_after[0], "k": next_after[1]}) if next_after else None
+        return Response({"results": results, "next": next_cursor})
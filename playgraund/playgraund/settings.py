@@ -73,6 +73,8 @@ CHAPA_SECRET_KEY   = os.getenv("CHAPA_SECRET_KEY", "")
 CHAPA_WEBHOOK_SECRET = os.getenv("CHAPA_WEBHOOK_SECRET", "")
 CHAPA_RETURN_URL   = os.getenv("CHAPA_RETURN_URL", "http://localhost:5173/payment-return")
 CHAPA_CALLBACK_URL = os.getenv("CHAPA_CALLBACK_URL", "http://127.0.0.1:8000/booking/payments/chapa/callback/")
+# offline / load testing: answer Chapa calls in-process (booking.chapa.StubChapaAdapter)
+CHAPA_STUB = env_bool("CHAPA_STUB", False)
 
 # NEW: force all weekly slots open (override weekly rules)
 ALWAYS_OPEN_SLOTS = env_bool("ALWAYS_OPEN_SLOTS", True)
@@ -96,7 +98,7 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
-CORS_ALLOW_HEADERS = list(default_headers) + ["authorization"]
+CORS_ALLOW_HEADERS = list(default_headers) + ["authorization", "idempotency-key"]
 CORS_ALLOWED_ORIGINS = env_list(
     "CORS_ALLOWED_ORIGINS",
     ["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -141,7 +143,15 @@ WSGI_APPLICATION = "playgraund.wsgi.application"
 AUTH_USER_MODEL = "users.Profile"
 
 DATABASES = {
-    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock at BEGIN and wait for it, instead of failing with
+        # "database is locked" when concurrent transactions upgrade read -> write
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+        # A file, not shared-cache memory, so threaded tests see real SQLite locking
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    }
 }
 
 AUTH_PASSWORD_VALIDATORS = [